@@ -0,0 +1,194 @@
+import asyncio
+import time
+
+from core.executor import QueueFullError
+
+
+class MicroBatcher:
+    """
+    Gathers concurrent requests into batches, so they are scored with one batched product.
+
+    A request waits in the pending batch until one of the following happens: the batch reaches
+    `max_batch_size` requests, `window` seconds have passed since the first request of the batch
+    arrived, or fewer than `max_in_flight` batches are running. The last rule makes the batching
+    adaptive: when the workers are idle a request is dispatched at once and pays no extra
+    latency, and batches only grow while every worker is busy, which is when they pay off.
+
+    The batcher runs on the event loop and must be used from a single loop. It records the size
+    of every batch and how long requests waited before their batch was dispatched.
+
+    Attributes:
+        run_batch (callable): Coroutine function that takes a list of items and returns the
+                              list of their results, in the same order.
+        window (float): Maximum number of seconds a request waits for its batch to fill.
+        max_batch_size (int): Maximum number of requests of a batch.
+        max_in_flight (Optional[int]): Number of running batches below which a request is
+                                       dispatched at once. None always waits for the window.
+    """
+
+    def __init__(self, run_batch, window=0.002, max_batch_size=32, max_in_flight=None):
+        """
+        Initializes the MicroBatcher instance.
+
+        Args:
+            run_batch (callable): Coroutine function that takes a list of items and returns the
+                                  list of their results, in the same order.
+            window (float): Maximum number of seconds a request waits for its batch to fill.
+            max_batch_size (int): Maximum number of requests of a batch.
+            max_in_flight (Optional[int]): Number of running batches below which a request is
+                                           dispatched at once. None always waits for the window.
+        """
+        self.run_batch = run_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.max_in_flight = max_in_flight
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        self._in_flight = 0
+        self._batches = 0
+        self._requests = 0
+        self._batch_sizes = {}
+        self._delay_total = 0.0
+        self._delay_max = 0.0
+        self._delay_last = 0.0
+        self._retries = 0
+
+    async def submit(self, item):
+        """
+        Adds an item to the pending batch and waits for its result.
+
+        Args:
+            item: Item passed to `run_batch` with the other items of its batch.
+
+        Returns:
+            The result of the item.
+
+        Raises:
+            Exception: Any error raised by `run_batch` for the item.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future, time.perf_counter()))
+        self._schedule()
+        return await future
+
+    def _schedule(self):
+        """
+        Dispatches the pending batch if it is ready, or starts the window timer otherwise.
+        """
+        while self._pending and (
+            len(self._pending) >= self.max_batch_size
+            or (self.max_in_flight is not None and self._in_flight < self.max_in_flight)
+        ):
+            self._dispatch()
+        if self._pending and self._timer is None:
+            delay = self._pending[0][2] + self.window - time.perf_counter()
+            self._timer = asyncio.get_running_loop().call_later(
+                max(0.0, delay), self._on_window_expired
+            )
+
+    def _on_window_expired(self):
+        """
+        Dispatches the pending batch once the window of its first request has passed.
+        """
+        self._timer = None
+        if self._pending:
+            self._dispatch()
+        self._schedule()
+
+    def _dispatch(self):
+        """
+        Takes up to `max_batch_size` pending requests and runs them as one batch.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = self._pending[: self.max_batch_size]
+        self._pending = self._pending[self.max_batch_size :]
+        now = time.perf_counter()
+        delays = [now - submitted_at for _, _, submitted_at in batch]
+        self._in_flight += 1
+        self._batches += 1
+        self._requests += len(batch)
+        self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+        self._delay_total += sum(delays)
+        self._delay_max = max(self._delay_max, *delays)
+        self._delay_last = delays[-1]
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        """
+        Runs a batch and routes every result, or its error, to its request.
+
+        If the batch fails, its requests are run again one by one, so an invalid request only
+        fails itself and not the requests batched with it. A batch rejected because the search
+        queue is full is not retried, since retrying would only add load to the full queue; all
+        its requests fail with the same error.
+
+        Args:
+            batch (list): Items, futures and submission times of the requests of the batch.
+        """
+        try:
+            try:
+                results = await self.run_batch([item for item, _, _ in batch])
+            except Exception as error:
+                if len(batch) == 1 or isinstance(error, QueueFullError):
+                    results = [error] * len(batch)
+                else:
+                    self._retries += 1
+                    results = await asyncio.gather(
+                        *(self._run_one(item) for item, _, _ in batch)
+                    )
+            for (_, future, _), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        finally:
+            self._in_flight -= 1
+            self._schedule()
+
+    async def _run_one(self, item):
+        """
+        Runs a single item as a batch of its own.
+
+        Args:
+            item: Item passed to `run_batch`.
+
+        Returns:
+            The result of the item, or the error raised for it.
+        """
+        try:
+            (result,) = await self.run_batch([item])
+        except Exception as error:
+            return error
+        return result
+
+    def stats(self):
+        """
+        Returns the counters of the batcher.
+
+        Returns:
+            dict: Configuration, number of pending requests and running batches, number of
+            batches and requests, histogram of the batch sizes, number of failed batches whose
+            requests were run one by one and the delay added by batching in seconds.
+        """
+        return {
+            "window_seconds": self.window,
+            "max_batch_size": self.max_batch_size,
+            "pending": len(self._pending),
+            "in_flight": self._in_flight,
+            "batches": self._batches,
+            "requests": self._requests,
+            "batch_sizes": dict(sorted(self._batch_sizes.items())),
+            "retried_batches": self._retries,
+            "added_latency_seconds": {
+                "last": self._delay_last,
+                "mean": self._delay_total / self._requests if self._requests else 0.0,
+                "max": self._delay_max,
+            },
+        }
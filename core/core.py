@@ -1,8 +1,13 @@
 import json
+import os
+import time
 
-from data.database import Database
+import numpy as np
+
+from data.database import Database, get_query_worker
+from model.index import DocumentIndex, compute_fingerprint, compute_model_fingerprint
 from model.model import RetrievalModel
-from utils.common import extract_zip
+from utils.common import LOGGER, extract_zip, file_lock
 
 
 class CoreAPP:
@@ -25,8 +30,24 @@ class CoreAPP:
         max_date (Optional[str]): Maximum date for filtering results.
         boost_mode (bool): Whether to use boost mode for ranking.
         verbose (bool): Whether to enable verbose output.
-        records (list): List of records fetched from the database.
-        records_dictionary (dict): Dictionary of records transformed from the database.
+        index_path (str): Directory where the persisted document indexes are stored.
+        workers (int): Number of processes used to build the document index.
+        search_mode (str): "exact" to score every podcast, "ivf" for the approximate search.
+        ann_lists (Optional[int]): Number of inverted lists of the approximate search.
+        ann_nprobe (int): Number of inverted lists scanned per query.
+        quantization (Optional[str]): None for float32 document vectors, "int8" or "pq" for compressed ones.
+        min_ratings_count (Optional[int]): Minimum number of ratings for filtering results.
+        categories (Optional[list of str]): Categories for filtering results; a podcast matches any of them.
+        db_threads (Optional[int]): Number of threads used by DuckDB.
+        db_memory_limit (Optional[str]): Memory limit of DuckDB.
+        build_batch_size (int): Number of records read from the database per batch of the build.
+        incremental (bool): Whether a new index reuses the vectors of the unchanged podcasts of the
+                            latest index built with the same settings.
+        index_built (bool): Whether the last load built the index instead of loading a saved one.
+        base_fingerprint (Optional[str]): Fingerprint of the index the built index was derived from.
+        podcasts_count (int): Number of podcasts of the records.
+        records (iterator of dict): Batches of columns of the records fetched from the database.
+        records_columns (iterator of dict): Columns of the podcasts of every batch, grouped from the records.
         rm (RetrievalModel): Instance of the RetrievalModel used for ranking.
     """
 
@@ -44,6 +65,18 @@ class CoreAPP:
         max_date,
         boost_mode,
         verbose,
+        index_path=None,
+        workers=1,
+        search_mode="exact",
+        ann_lists=None,
+        ann_nprobe=8,
+        quantization=None,
+        min_ratings_count=None,
+        categories=None,
+        db_threads=None,
+        db_memory_limit=None,
+        build_batch_size=10000,
+        incremental=True,
     ):
         """
         Initializes the CoreAPP instance.
@@ -61,6 +94,23 @@ class CoreAPP:
             max_date (Optional[str]): Maximum date for filtering results.
             boost_mode (bool): Whether to enable boost mode.
             verbose (bool): Whether to enable verbose logging.
+            index_path (Optional[str]): Directory for the persisted document indexes.
+                                        Defaults to an `index` folder next to the database.
+            workers (int): Number of processes used to build the document index.
+            search_mode (str): "exact" to score every podcast, "ivf" for the approximate search.
+            ann_lists (Optional[int]): Number of inverted lists of the approximate search.
+            ann_nprobe (int): Number of inverted lists scanned per query.
+            quantization (Optional[str]): None for float32 document vectors, "int8" or "pq" for
+                                          compressed ones.
+            min_ratings_count (Optional[int]): Minimum number of ratings for filtering results.
+            categories (Optional[list of str]): Categories for filtering results.
+            db_threads (Optional[int]): Number of threads used by DuckDB. DuckDB's default if None.
+            db_memory_limit (Optional[str]): Memory limit of DuckDB, like "2GB". DuckDB's default
+                                             if None.
+            build_batch_size (int): Number of records read from the database per batch of the build,
+                                    which bounds the memory used by the build.
+            incremental (bool): Whether a new index reuses the vectors of the unchanged podcasts
+                                of the latest index built with the same settings.
         """
         self.zip_path = zip_path
         self.extract_to = extract_to
@@ -74,6 +124,20 @@ class CoreAPP:
         self.max_date = max_date
         self.boost_mode = boost_mode
         self.verbose = verbose
+        self.index_path = index_path or os.path.join(extract_to, "index")
+        self.workers = workers
+        self.search_mode = search_mode
+        self.ann_lists = ann_lists
+        self.ann_nprobe = ann_nprobe
+        self.quantization = quantization
+        self.min_ratings_count = min_ratings_count
+        self.categories = categories
+        self.db_threads = db_threads
+        self.db_memory_limit = db_memory_limit
+        self.build_batch_size = build_batch_size
+        self.incremental = incremental
+        self.index_built = False
+        self.base_fingerprint = None
         self._extract_zip_file()
 
     def _extract_zip_file(self):
@@ -84,24 +148,63 @@ class CoreAPP:
         """
         extract_zip(self.zip_path, self.extract_to)
 
-    def _set_database(self):
+    def _set_database(self, connection=None):
         """
         Initializes the `Database` instance with `self.db_path` and `self.verbose`.
+
+        Args:
+            connection (Optional[duckdb.DuckDBPyConnection]): Shared connection of the database.
         """
-        self.db = Database(self.db_path, self.verbose)
+        self.db = Database(self.db_path, self.verbose, connection=connection)
 
     def _get_records_from_database(self):
         """
-        Fetches and processes records from the database.
+        Prepares the records of the database to be fetched in batches.
+
+        The queries run in the query worker of the database, which keeps one read-only connection
+        open for the whole process, so later builds and rebuilds reuse it. `self.records` is an
+        iterator that fetches the next batch of at most `build_batch_size` records only when it
+        is reached, so only one batch is in memory at a time.
+        """
+        worker = get_query_worker(self.db_path, self.db_threads, self.db_memory_limit)
+        self.podcasts_count, batches = worker.run(self._query_records)
+        self.records = self._fetch_batches(worker, batches)
+
+    @staticmethod
+    def _fetch_batches(worker, batches):
+        """
+        Advances a generator of batches in the thread of the query worker.
+
+        Args:
+            worker (QueryWorker): Query worker that created the generator.
+            batches (generator): Generator of `Database.fetch_column_batches`.
 
-        - Initializes the database connection.
-        - Retrieves and filters podcasts.
+        Yields:
+            dict: Array of every fetched column of the next batch.
+        """
+        while True:
+            batch = worker.run(lambda connection: next(batches, None))
+            if batch is None:
+                return
+            yield batch
+
+    def _query_records(self, connection):
+        """
+        Runs the queries that fetch the records, in the thread of the query worker.
+
+        - Retrieves podcasts with a rating score and a scraping date.
         - Joins tables and selects relevant columns.
         - Adds a composed column to the table.
-        - Fetches the final records.
-        - Closes the database connection.
+        - Counts the records of every podcast and prepares the batches of the final records,
+          ordered by podcast so that the records of a podcast are never split between batches.
+
+        Args:
+            connection (duckdb.DuckDBPyConnection): Shared connection of the database.
+
+        Returns:
+            tuple: Number of podcasts and the generator of the batches of records.
         """
-        self._set_database()
+        self._set_database(connection)
         self.db.show_all_tables()
         filtered_podcasts = self.db.filter_podcasts()
 
@@ -121,60 +224,377 @@ class CoreAPP:
                 "ratings_count",
                 "scraped_at",
             ],
-            min_filter=self.min_score,
-            max_filter=self.max_score,
-            min_date=self.min_date,
-            max_date=self.max_date,
         )
 
         composed_table = self.db.add_composed_column(
             table=joined_table,
             columns=["category", "slug", "title", "author", "description"],
             new_column_name="full_info",
+            keep_columns=["category"],
         )
-        self.records = self.db.fetch_column_records(
+        return self.db.fetch_column_batches(
             table_name=composed_table,
             columns=[
                 "podcast_id",
                 "average_rating",
                 "itunes_url",
                 "full_info",
+                "scraped_at",
+                "ratings_count",
+                "category",
             ],
+            key="podcast_id",
+            batch_size=self.build_batch_size,
+            order_by="podcast_id, category",
         )
-        self.db.close_connection()
 
     def _transform_records_from_database(self):
         """
-        Transforms the records fetched from the database into a dictionary format.
+        Groups every batch of records into the columns of its podcasts when it is fetched.
+        """
+        self.records_columns = map(self._group_records, self.records)
+
+    @staticmethod
+    def _group_records(records):
+        """
+        Groups the columns of a batch of records into the columns of the podcasts.
+
+        A podcast has one record per category. The podcasts keep the order of their first record
+        and the attributes and `text` of their last one, and their categories are kept as pairs
+        of category and podcast row. The grouping works on whole columns, so no Python object is
+        built per record.
 
-        The dictionary maps podcast IDs to a dictionary of attributes including `itunes_url`, `average_rating`, and `text`.
+        Args:
+            records (dict): Array of every column fetched from the database.
+
+        Returns:
+            dict: Columns of the podcasts, as accepted by `RetrievalModel.build_index_from_batches`.
         """
-        self.records_dictionary = {}
-        for item in self.records:
-            self.records_dictionary.update(
-                {
-                    str(item[0]): {
-                        "itunes_url": item[2],
-                        "average_rating": item[1],
-                        "text": item[3],
-                    }
-                }
+        podcast_ids = np.ma.filled(records["podcast_id"], "").astype(str)
+        _, first, inverse = np.unique(
+            podcast_ids, return_index=True, return_inverse=True
+        )
+        order = np.argsort(first)
+        positions = np.empty_like(order)
+        positions[order] = np.arange(len(order))
+        rows = positions[inverse.reshape(-1)]
+        last = np.zeros(len(order), dtype=np.int64)
+        np.maximum.at(last, rows, np.arange(len(rows)))
+        # Attributes of the last record of every podcast, with NULL values filled in
+        latest = {
+            name: np.ma.filled(column, fill)[last]
+            for name, column, fill in (
+                ("itunes_url", records["itunes_url"], ""),
+                ("average_rating", records["average_rating"], np.nan),
+                ("scraped_at", records["scraped_at"], np.datetime64("NaT")),
+                ("ratings_count", records["ratings_count"], 0),
+                ("full_info", records["full_info"], ""),
             )
+        }
+        categories = records["category"]
+        has_category = ~np.ma.getmaskarray(categories)
+        return {
+            "podcast_ids": podcast_ids[last],
+            "itunes_urls": latest["itunes_url"].astype(str),
+            "average_ratings": latest["average_rating"].astype(np.float64),
+            "scraped_at": latest["scraped_at"].astype("datetime64[s]"),
+            "ratings_counts": latest["ratings_count"].astype(np.int64),
+            "category_labels": np.ma.filled(categories, "")[has_category].astype(str),
+            "category_rows": rows[has_category],
+            "texts": latest["full_info"].tolist(),
+        }
 
     def _set_model(self):
         """
-        Initializes the `RetrievalModel` instance with `self.vectors_path`.
+        Initializes the `RetrievalModel` instance with `self.vectors_path`, `self.workers` and
+        the search settings.
+        """
+        self.rm = RetrievalModel(
+            self.vectors_path,
+            workers=self.workers,
+            search_mode=self.search_mode,
+            ann_lists=self.ann_lists,
+            ann_nprobe=self.ann_nprobe,
+            quantization=self.quantization,
+        )
+
+    def _build_index(self, fingerprint, vectors_path, base=None):
+        """
+        Builds the document index from `self.records_columns` using the `RetrievalModel` instance.
+
+        Args:
+            fingerprint (str): Fingerprint of the document index.
+            vectors_path (str): Scratch file the document vectors are written to during the build.
+            base (Optional[DocumentIndex]): Older index whose vectors of the unchanged podcasts are reused.
+
+        Returns:
+            DocumentIndex: The new document index.
         """
-        self.rm = RetrievalModel(self.vectors_path)
+        index = self.rm.build_index_from_batches(
+            self.records_columns,
+            self.podcasts_count,
+            fingerprint,
+            vectors_path,
+            base=base,
+        )
+        index.model_fingerprint = self._get_model_fingerprint()
+        return index
 
-    def _create_vectors_dictionary(self):
+    def _get_index_fingerprint(self):
         """
-        Computes the vectors dictionary using the `RetrievalModel` instance.
+        Computes the fingerprint of the document index for the current database, vectors and model settings.
+
+        Returns:
+            str: Fingerprint of the document index.
+        """
+        return compute_fingerprint(
+            self.db_path, self.rm.vectors_path, self.rm.index_config()
+        )
 
-        Updates the vectors dictionary in `self.rm` with `self.records_dictionary`.
+    def _get_model_fingerprint(self):
         """
+        Computes the fingerprint of the vectors and model settings of the document index.
+
+        Returns:
+            str: Fingerprint of the settings, shared by the indexes of every database version.
+        """
+        return compute_model_fingerprint(self.rm.vectors_path, self.rm.index_config())
+
+    def _load_or_build_index(self, rebuild=False, progress=None):
+        """
+        Loads the persisted document index, building and saving it first if it does not exist.
+
+        The index covers every podcast with a rating score and a scraping date; the rating and
+        date filters are applied at ranking time, so one index serves every filter combination.
+        The records are read and encoded in batches of `build_batch_size` records, so the memory
+        used by the build does not grow with the corpus; the document vectors go to a scratch file
+        next to the index, removed once the index is saved. A built index is served from its saved,
+        memory mapped copy.
+
+        When the database changed, the new index is built incrementally from the latest index with
+        the same settings: only new and changed podcasts are embedded, and deleted ones are left
+        out. A forced `rebuild`, or `incremental` set to False, embeds every podcast again.
+
+        The build holds a lock file next to the index, so when several server workers start at
+        once only one of them builds the index and the others wait and memory map it.
+
+        Args:
+            rebuild (bool): If True, build and save the index from scratch even if it already exists.
+            progress (Optional[callable]): Called with the name of every stage of the loading.
+        """
+        report = progress or (lambda stage: None)
         self._set_model()
-        self.rm.compute_vectors_dict(self.records_dictionary)
+        fingerprint = self._get_index_fingerprint()
+        index = None if rebuild else DocumentIndex.load(self.index_path, fingerprint)
+        if index is not None:
+            report("loading index")
+            self.rm.load_index(index)
+            return
+        os.makedirs(self.index_path, exist_ok=True)
+        with file_lock(os.path.join(self.index_path, f".{fingerprint}.lock")):
+            # Another process may have built the index while this one waited for the lock
+            index = (
+                None if rebuild else DocumentIndex.load(self.index_path, fingerprint)
+            )
+            if index is None:
+                vectors_path = os.path.join(
+                    self.index_path, f".{fingerprint}.vectors.npy"
+                )
+                base = None
+                if self.incremental and not rebuild:
+                    base = DocumentIndex.find_latest(
+                        self.index_path, self._get_model_fingerprint(), fingerprint
+                    )
+                try:
+                    report("reading records")
+                    self._get_records_from_database()
+                    self._transform_records_from_database()
+                    report("building index")
+                    index = self._build_index(fingerprint, vectors_path, base)
+                    report("saving index")
+                    index.save(self.index_path)
+                    self.index_built = True
+                    self.base_fingerprint = None if base is None else base.fingerprint
+                finally:
+                    self.records = self.records_columns = index = base = None
+                    if os.path.exists(vectors_path):
+                        os.remove(vectors_path)
+                index = DocumentIndex.load(self.index_path, fingerprint)
+        report("loading index")
+        self.rm.load_index(index)
+
+    def prune_indexes(self, keep=()):
+        """
+        Removes the indexes superseded by the index built by the last load, and their lock files.
+
+        The built index, the index it was derived from and the `keep` indexes are kept, as is
+        any index another process is building. Nothing is removed unless the last load built the
+        index.
+
+        Args:
+            keep (iterable of str): Fingerprints of other indexes to keep, like the ones still
+                                    serving searches.
+
+        Returns:
+            list of str: Fingerprints of the removed indexes.
+        """
+        if not self.index_built:
+            return []
+        keep = {self.rm.index.fingerprint, self.base_fingerprint, *keep}
+        return DocumentIndex.prune(self.index_path, keep - {None})
+
+    def load(self, rebuild=False, progress=None):
+        """
+        Loads the persisted document index, or builds it from the database records.
+
+        After loading, `search` only embeds the query and ranks, so a long-lived instance can
+        serve many queries.
+
+        Args:
+            rebuild (bool): If True, build and save the index from scratch even if it already exists.
+            progress (Optional[callable]): Called with the name of every stage of the loading.
+        """
+        self._load_or_build_index(rebuild, progress)
+
+    def warm_up(self, queries):
+        """
+        Runs a few queries to page in the memory mapped index before serving traffic.
+
+        Each query is ranked with and without boost mode, so the document vectors and the
+        ratings are both read once.
+
+        Args:
+            queries (list of str): Queries to run.
+        """
+        start = time.perf_counter()
+        for query in queries:
+            for boost_mode in (False, True):
+                self.rm.rankings(query, top_n=self.top_n, boost_mode=boost_mode)
+        LOGGER.info(
+            f"Warm-up with {len(queries)} queries done in {time.perf_counter() - start:.3f}s"
+        )
+
+    def search(
+        self,
+        query,
+        top_n,
+        boost_mode=False,
+        min_score=None,
+        max_score=None,
+        min_date=None,
+        max_date=None,
+        min_ratings_count=None,
+        categories=None,
+    ):
+        """
+        Ranks the podcasts for a query with the loaded index.
+
+        Args:
+            query (str): Query string for searching podcasts.
+            top_n (int): Number of top results to return.
+            boost_mode (bool): Whether to enable boost mode.
+            min_score (Optional[float]): Minimum score for filtering results.
+            max_score (Optional[float]): Maximum score for filtering results.
+            min_date (Optional[str]): Minimum date for filtering results.
+            max_date (Optional[str]): Maximum date for filtering results.
+            min_ratings_count (Optional[int]): Minimum number of ratings for filtering results.
+            categories (Optional[list of str]): Categories for filtering results.
+
+        Returns:
+            str: JSON string of the ranked results.
+        """
+        ranks = self.rm.rankings(
+            query,
+            top_n=top_n,
+            boost_mode=boost_mode,
+            min_score=min_score,
+            max_score=max_score,
+            min_date=min_date,
+            max_date=max_date,
+            min_ratings_count=min_ratings_count,
+            categories=categories,
+        )
+        return self._serialize(ranks)
+
+    def search_batch(
+        self,
+        queries,
+        top_n,
+        boost_mode=False,
+        min_score=None,
+        max_score=None,
+        min_date=None,
+        max_date=None,
+        min_ratings_count=None,
+        categories=None,
+    ):
+        """
+        Ranks the podcasts for a batch of queries with the loaded index.
+
+        Every setting but `queries` is either one value shared by every query or a list with one
+        value per query, as accepted by `RetrievalModel.rankings_batch`.
+
+        Args:
+            queries (list of str): Query strings for searching podcasts.
+            top_n (int or list of int): Number of top results to return.
+            boost_mode (bool or list of bool): Whether to enable boost mode.
+            min_score (Optional[float] or list): Minimum score for filtering results.
+            max_score (Optional[float] or list): Maximum score for filtering results.
+            min_date (Optional[str] or list): Minimum date for filtering results.
+            max_date (Optional[str] or list): Maximum date for filtering results.
+            min_ratings_count (Optional[int] or list): Minimum number of ratings for filtering results.
+            categories (Optional[list of str] or list of lists): Categories for filtering results.
+
+        Returns:
+            list of str: JSON string of the ranked results of every query.
+        """
+        batch_ranks = self.rm.rankings_batch(
+            queries,
+            top_n=top_n,
+            boost_mode=boost_mode,
+            min_score=min_score,
+            max_score=max_score,
+            min_date=min_date,
+            max_date=max_date,
+            min_ratings_count=min_ratings_count,
+            categories=categories,
+        )
+        return [self._serialize(ranks) for ranks in batch_ranks]
+
+    def rank(self, query, top_n, boost_mode=False, **filters):
+        """
+        Ranks the podcasts for a query with the loaded index, without serializing the results.
+
+        Args:
+            query (str): Query string for searching podcasts.
+            top_n (int): Number of top results to return.
+            boost_mode (bool): Whether to enable boost mode.
+            **filters: Rating, date and category filters, as accepted by `search`.
+
+        Returns:
+            list: Tuples with the row of the document index and the score, best first.
+        """
+        return self.rm.rankings(
+            query, top_n=top_n, boost_mode=boost_mode, rows=True, **filters
+        )
+
+    def rank_batch(self, queries, top_n, boost_mode=False, **filters):
+        """
+        Ranks the podcasts for a batch of queries with the loaded index, without serializing the
+        results.
+
+        Args:
+            queries (list of str): Query strings for searching podcasts.
+            top_n (int or list of int): Number of top results to return.
+            boost_mode (bool or list of bool): Whether to enable boost mode.
+            **filters: Rating, date and category filters, as accepted by `search_batch`.
+
+        Returns:
+            list: For every query, tuples with the row of the document index and the score.
+        """
+        return self.rm.rankings_batch(
+            queries, top_n=top_n, boost_mode=boost_mode, rows=True, **filters
+        )
 
     def _get_ranking(self):
         """
@@ -185,10 +605,17 @@ class CoreAPP:
         Returns:
             str: JSON string of the ranked results.
         """
-        ranks = self.rm.rankings(
-            self.query, top_n=self.top_n, boost_mode=self.boost_mode
+        return self.search(
+            self.query,
+            self.top_n,
+            boost_mode=self.boost_mode,
+            min_score=self.min_score,
+            max_score=self.max_score,
+            min_date=self.min_date,
+            max_date=self.max_date,
+            min_ratings_count=self.min_ratings_count,
+            categories=self.categories,
         )
-        return self._serialize(ranks)
 
     def _serialize(self, object):
         """
@@ -207,16 +634,12 @@ class CoreAPP:
         """
         Executes the main logic of the CoreAPP.
 
-        - Fetches and processes records from the database.
-        - Transforms records into a dictionary.
-        - Creates vectors dictionary.
+        - Loads the persisted document index, or builds it from the database records.
         - Retrieves and returns the ranked results.
 
         Returns:
             str: JSON string of the ranked results.
         """
-        self._get_records_from_database()
-        self._transform_records_from_database()
-        self._create_vectors_dictionary()
+        self.load()
         ranks = self._get_ranking()
         return ranks
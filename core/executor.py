@@ -0,0 +1,237 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class QueueFullError(RuntimeError):
+    """
+    Raised when a task is submitted to a `BoundedExecutor` whose queue is full.
+    """
+
+
+def _timed_call(fn, args, kwargs, submitted_at):
+    """
+    Calls a function and measures how long it waited in the queue.
+
+    Args:
+        fn (callable): Function to call.
+        args (tuple): Positional arguments of the function.
+        kwargs (dict): Keyword arguments of the function.
+        submitted_at (float): Wall-clock time at which the task was submitted.
+
+    Returns:
+        tuple: Seconds spent in the queue and result of the function.
+    """
+    waited = max(0.0, time.time() - submitted_at)
+    return waited, fn(*args, **kwargs)
+
+
+class BoundedExecutor:
+    """
+    A thread or process pool with a bounded queue, for CPU-bound work called from asyncio.
+
+    At most `workers + max_queue` tasks are admitted at once; further submissions fail fast
+    with `QueueFullError` instead of piling up. The executor counts the tasks it admits,
+    completes, fails and rejects, and measures how long tasks wait before a worker picks them up.
+
+    Threads share the memory of the process and work well when the task releases the GIL, as
+    NumPy does for matrix products. Processes run Python code in parallel; their functions and
+    arguments must be picklable and their state is set up by `initializer`.
+
+    Attributes:
+        kind (str): "thread" or "process".
+        workers (int): Number of workers of the pool.
+        max_queue (int): Number of admitted tasks that can wait for a free worker.
+    """
+
+    KINDS = ("thread", "process")
+
+    def __init__(
+        self, workers=4, max_queue=64, kind="thread", initializer=None, initargs=()
+    ):
+        """
+        Initializes the BoundedExecutor instance.
+
+        Args:
+            workers (int): Number of workers of the pool.
+            max_queue (int): Number of admitted tasks that can wait for a free worker.
+            kind (str): "thread" or "process".
+            initializer (Optional[callable]): Function called once in every worker.
+            initargs (tuple): Arguments of `initializer`.
+
+        Raises:
+            ValueError: If `kind` is not a known kind of pool.
+        """
+        if kind not in self.KINDS:
+            raise ValueError(f"kind must be one of {self.KINDS}")
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self._initializer = initializer
+        self._initargs = initargs
+        self._pool = self._create_pool()
+        self._restarts = 0
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_last = 0.0
+
+    def _create_pool(self):
+        """
+        Creates the pool of workers.
+
+        Returns:
+            concurrent.futures.Executor: A thread or process pool of `workers` workers.
+        """
+        if self.kind == "thread":
+            return ThreadPoolExecutor(
+                self.workers,
+                thread_name_prefix="search",
+                initializer=self._initializer,
+                initargs=self._initargs,
+            )
+        return ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=self._initializer,
+            initargs=self._initargs,
+        )
+
+    def restart(self):
+        """
+        Replaces the workers with new ones, which run `initializer` again.
+
+        Tasks already submitted finish on the old workers, which exit once they are done, and
+        new tasks go to the new workers. The bound on admitted tasks and the counters are kept.
+        """
+        old_pool = self._pool
+        self._pool = self._create_pool()
+        old_pool.shutdown(wait=False)
+        with self._lock:
+            self._restarts += 1
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Submits a task to the pool.
+
+        Args:
+            fn (callable): Function to run.
+            *args: Positional arguments of the function.
+            **kwargs: Keyword arguments of the function.
+
+        Returns:
+            concurrent.futures.Future: Future with the seconds spent in the queue and the result.
+
+        Raises:
+            QueueFullError: If `workers + max_queue` tasks are already admitted.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise QueueFullError(
+                f"Search queue is full ({self.workers + self.max_queue} pending tasks)"
+            )
+        with self._lock:
+            self._in_flight += 1
+            self._submitted += 1
+        try:
+            future = self._pool.submit(_timed_call, fn, args, kwargs, time.time())
+        except BaseException:
+            self._release(failed=True)
+            raise
+        future.add_done_callback(self._on_done)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Runs a task in the pool without blocking the event loop.
+
+        Args:
+            fn (callable): Function to run.
+            *args: Positional arguments of the function.
+            **kwargs: Keyword arguments of the function.
+
+        Returns:
+            The result of the function.
+
+        Raises:
+            QueueFullError: If `workers + max_queue` tasks are already admitted.
+        """
+        _, result = await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+        return result
+
+    def _on_done(self, future):
+        """
+        Releases the slot of a finished task and records its outcome.
+
+        Args:
+            future (concurrent.futures.Future): Future of the finished task.
+        """
+        if future.cancelled() or future.exception() is not None:
+            self._release(failed=True)
+            return
+        self._release(failed=False, waited=future.result()[0])
+
+    def _release(self, failed, waited=0.0):
+        """
+        Releases the slot of a task and updates the counters.
+
+        Args:
+            failed (bool): Whether the task failed or was cancelled.
+            waited (float): Seconds the task spent in the queue.
+        """
+        with self._lock:
+            self._in_flight -= 1
+            if failed:
+                self._failed += 1
+            else:
+                self._completed += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+                self._wait_last = waited
+        self._slots.release()
+
+    def stats(self):
+        """
+        Returns the counters of the executor.
+
+        The queue depth is the number of admitted tasks beyond the number of workers, which is
+        the number of tasks waiting for a worker when the pool is saturated.
+
+        Returns:
+            dict: Configuration, queue depth, task counters and queue wait times in seconds.
+        """
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "queue_depth": max(0, self._in_flight - self.workers),
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "restarts": self._restarts,
+                "wait_seconds": {
+                    "last": self._wait_last,
+                    "mean": (
+                        self._wait_total / self._completed if self._completed else 0.0
+                    ),
+                    "max": self._wait_max,
+                },
+            }
+
+    def shutdown(self):
+        """
+        Stops the pool, cancelling the tasks that have not started.
+        """
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,120 @@
+from uuid import uuid4
+
+from utils.cache import TTLCache
+
+
+class ResultSnapshots:
+    """
+    Snapshots of deep ranked result sets, served page by page.
+
+    A deep search is ranked once and its ranked results are kept as a snapshot, so every page is
+    a slice of the snapshot instead of a new ranking of `offset + page_size` results. A snapshot
+    keeps the encoder of the index that ranked it, so its pages stay consistent even if the index
+    changes while a client pages through it.
+
+    A page is addressed by a cursor "<snapshot_id>-<offset>", which the response of every page
+    returns for the next one; clients can also build the cursor of any offset themselves.
+
+    Attributes:
+        cache (TTLCache): Ranked results, page size and encoder by snapshot identifier.
+    """
+
+    def __init__(self, maxsize=128, ttl=600.0):
+        """
+        Initializes the ResultSnapshots instance.
+
+        Args:
+            maxsize (int): Maximum number of snapshots kept at the same time.
+            ttl (Optional[float]): Number of seconds a snapshot stays valid. Snapshots never expire if None.
+        """
+        self.cache = TTLCache(maxsize, ttl)
+
+    def create(self, ranks, page_size, encoder):
+        """
+        Stores the ranked results of a deep search as a new snapshot.
+
+        Args:
+            ranks (list): Ranked results, best first.
+            page_size (int): Default number of results of a page of the snapshot.
+            encoder (ResultEncoder): Encoder of the index that ranked the results.
+
+        Returns:
+            str: Identifier of the snapshot.
+        """
+        snapshot_id = uuid4().hex
+        self.cache.put(snapshot_id, (ranks, page_size, encoder))
+        return snapshot_id
+
+    def page(self, cursor, limit=None):
+        """
+        Returns a page of a snapshot.
+
+        Args:
+            cursor (str): Cursor "<snapshot_id>-<offset>" of the first result of the page.
+            limit (Optional[int]): Number of results of the page. Defaults to the page size of the snapshot.
+
+        Returns:
+            dict: Snapshot identifier, offset, total number of results of the snapshot, ranked
+            results of the page, cursor of the next page, or None on the last page, and encoder
+            of the snapshot.
+
+        Raises:
+            ValueError: If the cursor is malformed.
+            KeyError: If the snapshot does not exist or has expired.
+        """
+        snapshot_id, offset = parse_cursor(cursor)
+        snapshot = self.cache.get(snapshot_id)
+        if snapshot is None:
+            raise KeyError(snapshot_id)
+        ranks, page_size, encoder = snapshot
+        end = offset + (page_size if limit is None else limit)
+        return {
+            "snapshot_id": snapshot_id,
+            "offset": offset,
+            "total_results": len(ranks),
+            "ranks": ranks[offset:end],
+            "next_cursor": make_cursor(snapshot_id, end) if end < len(ranks) else None,
+            "encoder": encoder,
+        }
+
+    def stats(self):
+        """
+        Returns the counters of the snapshots.
+
+        Returns:
+            dict: Counters of the underlying cache.
+        """
+        return self.cache.stats()
+
+
+def make_cursor(snapshot_id, offset):
+    """
+    Builds the cursor of a page of a snapshot.
+
+    Args:
+        snapshot_id (str): Identifier of the snapshot.
+        offset (int): Position of the first result of the page.
+
+    Returns:
+        str: Cursor of the page.
+    """
+    return f"{snapshot_id}-{offset}"
+
+
+def parse_cursor(cursor):
+    """
+    Splits a cursor into its snapshot identifier and offset.
+
+    Args:
+        cursor (str): Cursor "<snapshot_id>-<offset>".
+
+    Returns:
+        tuple: Snapshot identifier and offset.
+
+    Raises:
+        ValueError: If the cursor is malformed or its offset is negative.
+    """
+    snapshot_id, _, offset = cursor.rpartition("-")
+    if not snapshot_id or not offset.isdigit():
+        raise ValueError(f"Malformed cursor: {cursor!r}")
+    return snapshot_id, int(offset)
@@ -0,0 +1,195 @@
+import msgpack
+import orjson
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+# Format of the response for every accepted media range
+MEDIA_TYPES = {
+    JSON: JSON,
+    "application/*": JSON,
+    "*/*": JSON,
+    MSGPACK: MSGPACK,
+    "application/x-msgpack": MSGPACK,
+}
+
+
+class Encoded(bytes):
+    """
+    A value that is already encoded in the format of the response, embedded as is.
+    """
+
+
+class ResultEncoder:
+    """
+    Encodes ranked rows of a document index as typed results, in JSON or MessagePack.
+
+    A result is an object with the `id`, `url` and `score` of a podcast. The constant part of
+    every result, everything but its score, is encoded once per document and format the first
+    time the document is ranked, so encoding a ranking mostly concatenates bytes.
+
+    Attributes:
+        podcast_ids (numpy.ndarray): Podcast IDs, one per row of the index.
+        itunes_urls (numpy.ndarray): iTunes URLs, one per row of the index.
+    """
+
+    def __init__(self, podcast_ids, itunes_urls):
+        """
+        Initializes the ResultEncoder instance.
+
+        Args:
+            podcast_ids (numpy.ndarray): Podcast IDs, one per row of the index.
+            itunes_urls (numpy.ndarray): iTunes URLs, one per row of the index.
+        """
+        self.podcast_ids = podcast_ids
+        self.itunes_urls = itunes_urls
+        self._fragments = {JSON: {}, MSGPACK: {}}
+
+    def encode(self, ranks, media_type=JSON):
+        """
+        Encodes ranked rows as an array of results.
+
+        Args:
+            ranks (list): Tuples with the row of the index and the score, best first.
+            media_type (str): JSON or MSGPACK.
+
+        Returns:
+            Encoded: The encoded array.
+        """
+        if media_type == MSGPACK:
+            return Encoded(
+                msgpack.Packer().pack_array_header(len(ranks))
+                + b"".join(
+                    self._fragment(row, MSGPACK) + msgpack.packb(score)
+                    for row, score in ranks
+                )
+            )
+        return Encoded(
+            b"["
+            + b",".join(
+                self._fragment(row, JSON) + orjson.dumps(score) + b"}"
+                for row, score in ranks
+            )
+            + b"]"
+        )
+
+    def iter_lines(self, ranks, chunk_size=256):
+        """
+        Encodes ranked rows as newline-delimited JSON, one result per line.
+
+        The lines are yielded in chunks of `chunk_size` results, so a large result set never
+        becomes one large document in memory.
+
+        Args:
+            ranks (iterable): Tuples with the row of the index and the score, best first.
+            chunk_size (int): Number of results per yielded chunk.
+
+        Yields:
+            bytes: Lines of the next `chunk_size` results.
+        """
+        lines = []
+        for row, score in ranks:
+            lines.append(self._fragment(row, JSON) + orjson.dumps(score) + b"}\n")
+            if len(lines) == chunk_size:
+                yield b"".join(lines)
+                lines = []
+        if lines:
+            yield b"".join(lines)
+
+    def _fragment(self, row, media_type):
+        """
+        Returns the encoded result of a row up to its score, encoding it on first use.
+
+        Args:
+            row (int): Row of the index.
+            media_type (str): JSON or MSGPACK.
+
+        Returns:
+            bytes: The encoded `id` and `url` followed by the `score` key.
+        """
+        fragments = self._fragments[media_type]
+        fragment = fragments.get(row)
+        if fragment is None:
+            podcast_id = str(self.podcast_ids[row])
+            url = str(self.itunes_urls[row])
+            if media_type == MSGPACK:
+                fragment = b"\x83" + b"".join(
+                    msgpack.packb(value) for value in ("id", podcast_id, "url", url)
+                )
+                fragment += msgpack.packb("score")
+            else:
+                fragment = (
+                    b'{"id":'
+                    + orjson.dumps(podcast_id)
+                    + b',"url":'
+                    + orjson.dumps(url)
+                    + b',"score":'
+                )
+            fragments[row] = fragment
+        return fragment
+
+
+def negotiate(accept):
+    """
+    Chooses the format of a response from the Accept header of the request.
+
+    Args:
+        accept (Optional[str]): Accept header of the request.
+
+    Returns:
+        str: JSON or MSGPACK, the supported format with the highest quality; JSON if the header
+        is missing or accepts no supported format.
+    """
+    best, best_quality = JSON, 0.0
+    for media_range in (accept or "").split(","):
+        media_type, *parameters = [part.strip() for part in media_range.split(";")]
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        media_type = MEDIA_TYPES.get(media_type.lower())
+        if media_type is not None and quality > best_quality:
+            best, best_quality = media_type, quality
+    return best
+
+
+def encode(value, media_type=JSON):
+    """
+    Encodes a response body, embedding its `Encoded` values as they are.
+
+    Dictionaries and lists are encoded item by item, so already encoded arrays of results are
+    concatenated instead of being decoded and encoded again.
+
+    Args:
+        value: Dictionary, list or scalar to encode.
+        media_type (str): JSON or MSGPACK.
+
+    Returns:
+        Encoded: The encoded value.
+    """
+    if isinstance(value, Encoded):
+        return value
+    if isinstance(value, dict):
+        items = [
+            (encode(key, media_type), encode(v, media_type)) for key, v in value.items()
+        ]
+        if media_type == MSGPACK:
+            return Encoded(
+                msgpack.Packer().pack_map_header(len(items))
+                + b"".join(key + v for key, v in items)
+            )
+        return Encoded(b"{" + b",".join(key + b":" + v for key, v in items) + b"}")
+    if isinstance(value, (list, tuple)):
+        items = [encode(v, media_type) for v in value]
+        if media_type == MSGPACK:
+            return Encoded(
+                msgpack.Packer().pack_array_header(len(items)) + b"".join(items)
+            )
+        return Encoded(b"[" + b",".join(items) + b"]")
+    if media_type == MSGPACK:
+        return Encoded(msgpack.packb(value, default=str))
+    return Encoded(orjson.dumps(value))
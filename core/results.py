@@ -0,0 +1,104 @@
+import asyncio
+from functools import partial
+
+from utils.cache import TTLCache
+
+# Marker of a cache miss, since None could be a cached result
+_MISSING = object()
+
+
+class ResultCache:
+    """
+    A bounded TTL/LRU cache of search results with single-flight request coalescing.
+
+    Results are keyed by the normalized request and the version of the index that produced
+    them. When the version changes, for example after the index is rebuilt, every cached result
+    is dropped. Concurrent identical requests share one computation: the first one starts it and
+    the others wait for its result. The computation runs in its own task, so a cancelled request
+    does not cancel it for the requests waiting on it. Errors are not cached.
+
+    The cache runs on the event loop and must be used from a single loop.
+
+    Attributes:
+        cache (TTLCache): Results by index version and normalized request.
+        version (Optional[str]): Version of the index of the cached results.
+        coalesced (int): Number of requests that waited for an identical computation in flight.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300.0):
+        """
+        Initializes the ResultCache instance.
+
+        Args:
+            maxsize (int): Maximum number of results kept in the cache; 0 only coalesces.
+            ttl (Optional[float]): Number of seconds a result stays valid. Results never expire if None.
+        """
+        self.cache = TTLCache(maxsize, ttl)
+        self.version = None
+        self.coalesced = 0
+        self._in_flight = {}
+
+    async def get_or_compute(self, key, version, compute):
+        """
+        Returns the cached result of a request, computing it once if it is missing.
+
+        Args:
+            key (tuple): Normalized request.
+            version (str): Version of the index that serves the request.
+            compute (callable): Coroutine function that computes the result as a tuple
+                whose first item is the version of the index that produced it.
+
+        Returns:
+            tuple: The result of the request.
+
+        Raises:
+            Exception: Any error raised by `compute`.
+        """
+        if version != self.version:
+            self.cache.clear()
+            self.version = version
+        key = (version, key)
+        result = self.cache.get(key, _MISSING)
+        if result is not _MISSING:
+            return result
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self._in_flight[key] = task
+            task.add_done_callback(partial(self._on_done, key))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _on_done(self, key, task):
+        """
+        Caches the result of a finished computation, unless it failed or the index changed.
+
+        The result is cached only if it was produced by the index version of the request and
+        that version is still the current one, so a computation that ran on an index swapped in
+        meanwhile is not cached under the old version.
+
+        Args:
+            key (tuple): Index version and normalized request.
+            task (asyncio.Task): Task of the computation.
+        """
+        del self._in_flight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        if task.result()[0] == key[0] == self.version:
+            self.cache.put(key, task.result())
+
+    def stats(self):
+        """
+        Returns the counters of the cache.
+
+        Returns:
+            dict: Counters of the underlying cache, index version, number of computations in
+            flight and number of coalesced requests.
+        """
+        return dict(
+            self.cache.stats(),
+            version=self.version,
+            in_flight=len(self._in_flight),
+            coalesced=self.coalesced,
+        )
@@ -0,0 +1,410 @@
+import threading
+import time
+
+from core.responses import ResultEncoder
+from utils.common import LOGGER, process_memory
+
+
+class SearchService:
+    """
+    Long-lived search state shared by the requests of the API.
+
+    The service creates the `CoreAPP` once, loads the document index and runs warm-up queries,
+    either in the calling thread or in a background thread. It only reports itself ready once
+    loading has finished, and request handlers then only embed the query and rank.
+
+    The index can be rebuilt in a background thread while the service keeps serving. The new
+    application is loaded and warmed up next to the live one and then swapped in at once;
+    searches that already started finish on the previous application. Rankings are returned
+    with the version of the index that produced them, and the encoder of the previous index is
+    kept, so a ranking is always encoded with the index that produced it.
+
+    Attributes:
+        create_core_app (callable): Function that returns the `CoreAPP` to load.
+        warm_up_queries (list of str): Queries run after loading to page in the index.
+        state (str): One of "idle", "loading", "ready" or "failed".
+        error (Optional[BaseException]): Error raised while loading, if any.
+    """
+
+    # Stages of a rebuild, in order; "reading records" to "saving index" only run for a new index
+    REBUILD_STAGES = (
+        "reading records",
+        "building index",
+        "saving index",
+        "loading index",
+        "warming up",
+        "swapping",
+    )
+
+    def __init__(self, create_core_app, warm_up_queries=()):
+        """
+        Initializes the SearchService instance.
+
+        Args:
+            create_core_app (callable): Function that returns the `CoreAPP` to load.
+            warm_up_queries (iterable of str): Queries run after loading to page in the index.
+        """
+        self.create_core_app = create_core_app
+        self.warm_up_queries = list(warm_up_queries)
+        self.state = "idle"
+        self.error = None
+        self._live = (None, None)
+        self._encoders = {}
+        self._ready = threading.Event()
+        self._thread = None
+        self._rebuild_lock = threading.Lock()
+        self._rebuild = {"status": "idle"}
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    @property
+    def core_app(self):
+        """
+        The live application, or None before loading has finished.
+        """
+        return self._live[0]
+
+    @property
+    def encoder(self):
+        """
+        Encoder of the results of the live index, or None before loading has finished.
+        """
+        return self._live[1]
+
+    @property
+    def index_version(self):
+        """
+        Fingerprint of the live document index, or None while the service is not ready.
+        """
+        if not self.ready:
+            return None
+        return self.core_app.rm.index.fingerprint
+
+    def encoder_for(self, version):
+        """
+        Returns the encoder of the results of an index version.
+
+        Args:
+            version (str): Fingerprint of the index that produced the results.
+
+        Returns:
+            ResultEncoder: Encoder of the live index or of the index it replaced.
+
+        Raises:
+            RuntimeError: If the version is neither the live nor the previous index.
+        """
+        encoder = self._encoders.get(version)
+        if encoder is None:
+            raise RuntimeError(f"Index {version} is no longer loaded")
+        return encoder
+
+    def load(self):
+        """
+        Creates the application, loads the document index and runs the warm-up queries.
+
+        Raises:
+            Exception: Any error raised while loading, after recording it in `error`.
+        """
+        self.state = "loading"
+        start = time.perf_counter()
+        try:
+            core_app = self.create_core_app()
+            core_app.load()
+            core_app.warm_up(self.warm_up_queries)
+            previous_version = self.index_version
+            self._swap(core_app)
+            self._prune_indexes(core_app, previous_version)
+        except Exception as error:
+            self.state = "failed"
+            self.error = error
+            LOGGER.exception("Search service failed to load")
+            raise
+        LOGGER.info(f"Search service ready in {time.perf_counter() - start:.3f}s")
+        memory = process_memory()
+        if memory is not None:
+            LOGGER.info(
+                f"Memory of process {memory['pid']}: {memory['rss_mb']} MB resident, "
+                f"{memory['shared_mb']} MB shared, {memory['private_mb']} MB private, "
+                f"{memory['pss_mb']} MB proportional"
+            )
+
+    def _swap(self, core_app):
+        """
+        Makes a loaded application the live one, in one assignment.
+
+        The encoder of the index it replaces is kept for the rankings still in flight, and
+        every older one is dropped.
+
+        Args:
+            core_app (CoreAPP): The loaded and warmed up application.
+        """
+        index = core_app.rm.index
+        encoder = ResultEncoder(index.podcast_ids, index.itunes_urls)
+        previous_app, previous_encoder = self._live
+        encoders = {index.fingerprint: encoder}
+        if previous_app is not None:
+            encoders.setdefault(previous_app.rm.index.fingerprint, previous_encoder)
+        self._encoders = encoders
+        self._live = (core_app, encoder)
+        self.state = "ready"
+        self.error = None
+        self._ready.set()
+
+    @staticmethod
+    def _prune_indexes(core_app, previous_version):
+        """
+        Removes the indexes superseded by a newly built live index.
+
+        The index it replaced is kept for the searches still running on it. The new index is
+        already live, so an error is only logged.
+
+        Args:
+            core_app (CoreAPP): The application that was just swapped in.
+            previous_version (Optional[str]): Fingerprint of the index it replaced.
+        """
+        try:
+            core_app.prune_indexes(keep=[previous_version] if previous_version else [])
+        except Exception:
+            LOGGER.exception("Superseded indexes could not be removed")
+
+    def start(self):
+        """
+        Loads the service in a background thread, so the API can answer liveness checks meanwhile.
+        """
+        self._thread = threading.Thread(
+            target=self._load_in_background, name="search-service-loader", daemon=True
+        )
+        self._thread.start()
+
+    def _load_in_background(self):
+        """
+        Loads the service; errors are already recorded and logged by `load`.
+        """
+        try:
+            self.load()
+        except Exception:
+            pass
+
+    def wait_ready(self, timeout=None):
+        """
+        Blocks until the service is ready or the timeout expires.
+
+        Args:
+            timeout (Optional[float]): Maximum number of seconds to wait. Waits forever if None.
+
+        Returns:
+            bool: True if the service is ready.
+        """
+        return self._ready.wait(timeout)
+
+    def status(self):
+        """
+        Returns the loading status of the service.
+
+        Returns:
+            dict: State of the service and the loading error, if any.
+        """
+        return {
+            "status": self.state,
+            "error": None if self.error is None else str(self.error),
+        }
+
+    def start_rebuild(self, force=False, on_swap=None):
+        """
+        Starts a rebuild of the document index in a background thread.
+
+        Only one rebuild runs at a time, so at most two indexes, the live one and the new one,
+        are in memory at once.
+
+        Args:
+            force (bool): If True, build the index from scratch even if the index of the current
+                          database, vectors and settings already exists.
+            on_swap (Optional[callable]): Called after the new index is swapped in.
+
+        Returns:
+            bool: True if the rebuild started, False if a rebuild or the initial loading is
+            already running.
+        """
+        with self._rebuild_lock:
+            if self._rebuild["status"] == "running" or self.state == "loading":
+                return False
+            self._rebuild = {
+                "status": "running",
+                "force": force,
+                "stage": None,
+                "step": 0,
+                "steps": len(self.REBUILD_STAGES),
+                "started_at": time.time(),
+                "finished_at": None,
+                "previous_version": self.index_version,
+                "index_version": None,
+                "error": None,
+            }
+        threading.Thread(
+            target=self._rebuild_in_background,
+            args=(force, on_swap),
+            name="search-index-rebuild",
+            daemon=True,
+        ).start()
+        return True
+
+    def _rebuild_in_background(self, force, on_swap):
+        """
+        Rebuilds the index and records the outcome of the rebuild.
+
+        Args:
+            force (bool): If True, build the index even if it already exists.
+            on_swap (Optional[callable]): Called after the new index is swapped in.
+        """
+        try:
+            core_app = self.create_core_app()
+            core_app.load(rebuild=force, progress=self._report_rebuild)
+            self._report_rebuild("warming up")
+            core_app.warm_up(self.warm_up_queries)
+            self._report_rebuild("swapping")
+            previous_version = self.index_version
+            self._swap(core_app)
+            self._prune_indexes(core_app, previous_version)
+            del core_app
+            if on_swap is not None:
+                on_swap()
+        except Exception as error:
+            LOGGER.exception("Index rebuild failed")
+            self._finish_rebuild("failed", error=str(error))
+        else:
+            LOGGER.info(f"Index rebuilt and swapped in as {self.index_version}")
+            self._finish_rebuild("succeeded", index_version=self.index_version)
+
+    def _report_rebuild(self, stage):
+        """
+        Records the stage a rebuild has reached.
+
+        Args:
+            stage (str): One of `REBUILD_STAGES`.
+        """
+        with self._rebuild_lock:
+            self._rebuild = dict(
+                self._rebuild, stage=stage, step=self.REBUILD_STAGES.index(stage) + 1
+            )
+
+    def _finish_rebuild(self, status, **fields):
+        """
+        Records the end of a rebuild.
+
+        Args:
+            status (str): "succeeded" or "failed".
+            **fields: Fields of the rebuild status to set.
+        """
+        with self._rebuild_lock:
+            self._rebuild = dict(
+                self._rebuild, status=status, finished_at=time.time(), **fields
+            )
+
+    def rebuild_status(self):
+        """
+        Returns the status of the last rebuild.
+
+        Returns:
+            dict: Status ("idle", "running", "succeeded" or "failed"), current stage and step
+            out of the number of steps, start and end times, elapsed seconds, index versions
+            before and after and the error, if any.
+        """
+        with self._rebuild_lock:
+            status = dict(self._rebuild)
+        if "started_at" in status:
+            end = status["finished_at"] or time.time()
+            status["elapsed_seconds"] = end - status["started_at"]
+        return status
+
+    def rank(self, query, top_n, **filters):
+        """
+        Ranks the podcasts for a query with the live index.
+
+        Args:
+            query (str): Query string for searching podcasts.
+            top_n (int): Number of top results to return.
+            **filters: Boost mode and rating and date filters, as accepted by `CoreAPP.rank`.
+
+        Returns:
+            tuple: Version of the index and tuples with its rows and their scores, best first.
+
+        Raises:
+            RuntimeError: If the service is not ready.
+        """
+        if not self.ready:
+            raise RuntimeError(f"Search service is not ready ({self.state})")
+        core_app = self.core_app
+        return core_app.rm.index.fingerprint, core_app.rank(query, top_n, **filters)
+
+    def rank_batch(self, queries, top_n, **filters):
+        """
+        Ranks the podcasts for a batch of queries with the live index.
+
+        Args:
+            queries (list of str): Query strings for searching podcasts.
+            top_n (int or list of int): Number of top results to return.
+            **filters: Boost mode and rating and date filters, as accepted by `CoreAPP.rank_batch`.
+
+        Returns:
+            tuple: Version of the index and, for every query, tuples with its rows and their scores.
+
+        Raises:
+            RuntimeError: If the service is not ready.
+        """
+        if not self.ready:
+            raise RuntimeError(f"Search service is not ready ({self.state})")
+        core_app = self.core_app
+        return core_app.rm.index.fingerprint, core_app.rank_batch(
+            queries, top_n, **filters
+        )
+
+
+# Search service of a worker process, set once by `init_worker_service`
+_WORKER = {}
+
+
+def init_worker_service(create_core_app, warm_up_queries=()):
+    """
+    Loads a search service in a worker process of a process pool.
+
+    The index has already been built by the parent process, so every worker only memory maps
+    it, and the pages are shared through the OS page cache.
+
+    Args:
+        create_core_app (callable): Picklable function that returns the `CoreAPP` to load.
+        warm_up_queries (iterable of str): Queries run after loading to page in the index.
+    """
+    _WORKER["service"] = SearchService(create_core_app, warm_up_queries)
+    _WORKER["service"].load()
+
+
+def rank_in_worker(query, top_n, **filters):
+    """
+    Ranks the podcasts for a query with the search service of the worker process.
+
+    Args:
+        query (str): Query string for searching podcasts.
+        top_n (int): Number of top results to return.
+        **filters: Boost mode and rating and date filters, as accepted by `CoreAPP.rank`.
+
+    Returns:
+        tuple: Version of the index and tuples with its rows and their scores, best first.
+    """
+    return _WORKER["service"].rank(query, top_n, **filters)
+
+
+def rank_batch_in_worker(queries, top_n, **filters):
+    """
+    Ranks the podcasts for a batch of queries with the search service of the worker process.
+
+    Args:
+        queries (list of str): Query strings for searching podcasts.
+        top_n (int or list of int): Number of top results to return.
+        **filters: Boost mode and rating and date filters, as accepted by `CoreAPP.rank_batch`.
+
+    Returns:
+        tuple: Version of the index and, for every query, tuples with its rows and their scores.
+    """
+    return _WORKER["service"].rank_batch(queries, top_n, **filters)
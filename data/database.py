@@ -1,8 +1,163 @@
+import operator
 import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
 
 import duckdb
+import numpy as np
 
-from utils.common import LOGGER
+from utils.common import LOGGER, file_signature
+
+# Shared query workers by database file, created by `get_query_worker`
+_WORKERS = {}
+_WORKERS_LOCK = threading.Lock()
+
+
+def log_storage_version(db_path):
+    """
+    Reads the storage version of a database from its file header and logs it.
+
+    Args:
+        db_path (str): Path to the database file.
+    """
+    pattern = struct.Struct("<8x4sQ")
+
+    with open(db_path, "rb") as fh:
+        LOGGER.info(
+            f"Database Storage version: {pattern.unpack(fh.read(pattern.size))[1]}"
+        )
+
+
+class QueryWorker:
+    """
+    A read-only DuckDB connection to a database file, owned by one dedicated thread.
+
+    A DuckDB connection must not be used by several threads at once, so every query runs in the
+    thread of the worker, and callers submit functions that receive the connection. DuckDB still
+    runs every query on up to `threads` threads. The connection is read-only, so several
+    processes can open the same file at once.
+
+    Attributes:
+        db_path (str): Path to the database file.
+        threads (Optional[int]): Number of threads used by DuckDB. DuckDB's default if None.
+        memory_limit (Optional[str]): Memory limit of DuckDB, like "2GB". DuckDB's default if None.
+        signature (list): Size and modification time of the database file when it was opened.
+        closed (bool): Whether the worker has been closed.
+    """
+
+    def __init__(self, db_path, threads=None, memory_limit=None):
+        """
+        Initializes the QueryWorker instance and opens its connection.
+
+        Args:
+            db_path (str): Path to the database file.
+            threads (Optional[int]): Number of threads used by DuckDB.
+            memory_limit (Optional[str]): Memory limit of DuckDB, like "2GB".
+        """
+        self.db_path = db_path
+        self.threads = threads
+        self.memory_limit = memory_limit
+        self.signature = file_signature(db_path)
+        self.closed = False
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="duckdb")
+        self._connection = self._executor.submit(self._connect).result()
+
+    def _connect(self):
+        """
+        Opens the read-only connection, in the thread of the worker.
+
+        Returns:
+            duckdb.DuckDBPyConnection: The connection.
+        """
+        config = {}
+        if self.threads is not None:
+            config["threads"] = self.threads
+        if self.memory_limit is not None:
+            config["memory_limit"] = self.memory_limit
+        log_storage_version(self.db_path)
+        return duckdb.connect(self.db_path, read_only=True, config=config)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Submits a query function to the thread of the worker.
+
+        Asyncio code can await the returned future with `asyncio.wrap_future`.
+
+        Args:
+            fn (callable): Function called with the connection followed by the arguments.
+            *args: Positional arguments of the function.
+            **kwargs: Keyword arguments of the function.
+
+        Returns:
+            concurrent.futures.Future: Future with the result of the function.
+        """
+        return self._executor.submit(fn, self._connection, *args, **kwargs)
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Runs a query function in the thread of the worker and waits for its result.
+
+        Args:
+            fn (callable): Function called with the connection followed by the arguments.
+            *args: Positional arguments of the function.
+            **kwargs: Keyword arguments of the function.
+
+        Returns:
+            The result of the function.
+        """
+        return self.submit(fn, *args, **kwargs).result()
+
+    def close(self):
+        """
+        Closes the connection once the submitted queries have finished, and stops the thread.
+
+        Closing a closed worker does nothing.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self._executor.submit(self._connection.close)
+        self._executor.shutdown(wait=True)
+
+
+def get_query_worker(db_path, threads=None, memory_limit=None):
+    """
+    Returns the query worker of a database file, shared by the whole process.
+
+    The worker is created on first use. It is replaced, with the new settings, if it has been
+    closed, the database file has changed since it was opened or the settings are different.
+
+    Args:
+        db_path (str): Path to the database file.
+        threads (Optional[int]): Number of threads used by DuckDB.
+        memory_limit (Optional[str]): Memory limit of DuckDB, like "2GB".
+
+    Returns:
+        QueryWorker: The worker of the database file.
+    """
+    with _WORKERS_LOCK:
+        worker = _WORKERS.get(db_path)
+        if worker is not None and (
+            worker.closed
+            or worker.signature != file_signature(db_path)
+            or (worker.threads, worker.memory_limit) != (threads, memory_limit)
+        ):
+            worker.close()
+            worker = None
+        if worker is None:
+            worker = _WORKERS[db_path] = QueryWorker(db_path, threads, memory_limit)
+        return worker
+
+
+def close_query_workers():
+    """
+    Closes the query workers of every database file.
+    """
+    with _WORKERS_LOCK:
+        for worker in _WORKERS.values():
+            worker.close()
+        _WORKERS.clear()
 
 
 class Database:
@@ -18,24 +173,32 @@ class Database:
         verbose (bool): Flag to control the verbosity of output.
     """
 
-    def __init__(self, db_path, verbose):
+    def __init__(self, db_path, verbose, connection=None):
         """
         Initializes the Database instance.
 
         Args:
             db_path (str): Path to the SQLite database file.
             verbose (bool): Flag to enable verbose output.
+            connection (Optional[duckdb.DuckDBPyConnection]): Shared connection to use, like the
+                one of a `QueryWorker`, which stays open. A read-only connection of its own is
+                opened if None.
         """
         self.db_path = db_path
-        self.connection = duckdb.connect(db_path)
         self.verbose = verbose
-        self._check_database_storage_version()
+        self._projections = {}
+        self._owns_connection = connection is None
+        if self._owns_connection:
+            connection = duckdb.connect(db_path, read_only=True)
+            self._check_database_storage_version()
+        self.connection = connection
 
     def close_connection(self):
         """
-        Closes the connection to the database.
+        Closes the connection to the database, unless it is a shared one.
         """
-        self.connection.close()
+        if self._owns_connection:
+            self.connection.close()
 
     def _check_database_storage_version(self):
         """
@@ -43,12 +206,7 @@ class Database:
 
         The version is read from the database file header.
         """
-        pattern = struct.Struct("<8x4sQ")
-
-        with open(self.db_path, "rb") as fh:
-            LOGGER.info(
-                f"Database Storage version: {pattern.unpack(fh.read(pattern.size))[1]}"
-            )
+        log_storage_version(self.db_path)
 
     def show_table(self, table_name, limit=5):
         """
@@ -90,6 +248,29 @@ class Database:
             self.show_table(filtered_podcasts)
         return filtered_podcasts
 
+    def _project(self, table, columns):
+        """
+        Selects columns of a table.
+
+        The projection of a named table is bound once and reused by later calls with the same
+        columns; DuckDB relations are lazy, so every use still reads the current data.
+
+        Args:
+            table (str or duckdb.DuckDBPyRelation): The name of the table or DuckDBPyRelation object.
+            columns (list of str): Column names to select.
+
+        Returns:
+            duckdb.DuckDBPyRelation: Relation with the selected columns.
+        """
+        if not isinstance(table, str):
+            return table.project(", ".join(columns))
+        key = (table, tuple(columns))
+        projection = self._projections.get(key)
+        if projection is None:
+            projection = self.connection.table(table).project(", ".join(columns))
+            self._projections[key] = projection
+        return projection
+
     def join_and_select(
         self,
         table1,
@@ -119,34 +300,27 @@ class Database:
         Returns:
             duckdb.DuckDBPyRelation: Joined and filtered DuckDBPyRelation object.
         """
-        # Check if table1 and table2 are strings (table names) or DuckDBPyRelation objects
-        if isinstance(table1, str):
-            table1 = self.connection.table(table1)
-        if isinstance(table2, str):
-            table2 = self.connection.table(table2)
-
         # Perform the select operation on each table
-        selected_table1 = table1.project(", ".join(columns_table1))
-
-        # Build the filter condition for table2
-        filters = []
-        if min_filter is not None:
-            filters.append(f"average_rating >= {min_filter}")
-        if max_filter is not None:
-            filters.append(f"average_rating <= {max_filter}")
-        if min_date is not None:
-            filters.append(f"scraped_at >= '{min_date}'")
-        if max_date is not None:
-            filters.append(f"scraped_at <= '{max_date}'")
+        selected_table1 = self._project(table1, columns_table1)
+        selected_table2 = self._project(table2, columns_table2)
+
+        # Build the filter condition for table2; the values are bound as typed constants and
+        # never formatted into the SQL text
+        bounds = [
+            ("average_rating", operator.ge, min_filter),
+            ("average_rating", operator.le, max_filter),
+            ("scraped_at", operator.ge, min_date),
+            ("scraped_at", operator.le, max_date),
+        ]
+        filters = [
+            compare(duckdb.ColumnExpression(column), duckdb.ConstantExpression(value))
+            for column, compare, value in bounds
+            if value is not None
+        ]
 
         # Apply the filters to table2
         if filters:
-            filter_condition = " AND ".join(filters)
-            selected_table2 = table2.project(", ".join(columns_table2)).filter(
-                filter_condition
-            )
-        else:
-            selected_table2 = table2.project(", ".join(columns_table2))
+            selected_table2 = selected_table2.filter(reduce(operator.and_, filters))
 
         # Perform the join operation
         joined_table = selected_table1.join(selected_table2, primary_key)
@@ -157,7 +331,7 @@ class Database:
 
         return joined_table
 
-    def add_composed_column(self, table, columns, new_column_name):
+    def add_composed_column(self, table, columns, new_column_name, keep_columns=()):
         """
         Adds a new column to a table that is a concatenation of the specified columns.
 
@@ -165,6 +339,7 @@ class Database:
             table (duckdb.DuckDBPyRelation): The DuckDBPyRelation object to modify.
             columns (list of str): List of column names to concatenate.
             new_column_name (str): The name of the new composed column.
+            keep_columns (iterable of str): Columns of `columns` that are kept next to the new column.
 
         Returns:
             duckdb.DuckDBPyRelation: Modified DuckDBPyRelation object with the new column.
@@ -176,7 +351,9 @@ class Database:
         # Add a new column composed of the concatenation of the specified columns
         # Project all columns except the ones to be concatenated
         all_columns = [col for col in table.columns]
-        remaining_columns = [col for col in all_columns if col not in columns]
+        remaining_columns = [
+            col for col in all_columns if col not in columns or col in keep_columns
+        ]
 
         # Add a new column composed of the concatenation of the specified columns
         if remaining_columns:
@@ -227,3 +404,93 @@ class Database:
 
         # Return the list of records
         return column_records
+
+    def fetch_columns(self, table_name, columns):
+        """
+        Fetches columns of a table as one NumPy array per column.
+
+        The result is transferred column by column: numeric and timestamp columns arrive as typed
+        arrays, without building a Python object per value, and no tuple is built per row.
+
+        Args:
+            table_name (str or duckdb.DuckDBPyRelation): The name of the table or DuckDBPyRelation object.
+            columns (str or list of str): Column name(s) to fetch. If a single column, can be a string.
+
+        Returns:
+            dict: Array of every column by name. Columns with NULL values are masked arrays.
+
+        Raises:
+            ValueError: If `table_name` is not a string or DuckDBPyRelation.
+        """
+        if isinstance(columns, str):
+            columns = [columns]
+        if isinstance(table_name, str):
+            table_name = self.connection.table(table_name)
+        elif not isinstance(table_name, duckdb.DuckDBPyRelation):
+            raise ValueError("table_name must be either a string or a DuckDBPyRelation")
+        return table_name.project(", ".join(columns)).fetchnumpy()
+
+    def fetch_column_batches(self, table_name, columns, key, batch_size, order_by=None):
+        """
+        Fetches columns of a table in batches, as one NumPy array per column.
+
+        A first query counts the rows of every key in order. The keys are then split into
+        consecutive ranges of whole keys with at most `batch_size` rows, unless a key alone has
+        more, and every batch is one query for its range, fetched with `fetchnumpy`. The range
+        filter reaches the table scans, so a batch only reads its own rows, and only one batch is
+        in memory at a time. Rows with a NULL key are left out.
+
+        Args:
+            table_name (str or duckdb.DuckDBPyRelation): The name of the table or DuckDBPyRelation object.
+            columns (list of str): Column names to fetch, including `key`.
+            key (str): Column that orders the rows and groups them.
+            batch_size (int): Maximum number of rows of a batch.
+            order_by (Optional[str]): Ordering of the rows, which must start with `key`. Defaults to `key`.
+
+        Returns:
+            tuple: Number of distinct keys and a generator of the batches, which yields the array
+            of every column of the next batch by name, like `fetch_columns`.
+        """
+        if isinstance(table_name, str):
+            table_name = self.connection.table(table_name)
+        relation = table_name.project(", ".join(columns))
+        sizes = (
+            relation.filter(f"{key} IS NOT NULL")
+            .aggregate(f"{key}, count(*) AS key_rows")
+            .order(key)
+            .fetchnumpy()
+        )
+        keys = sizes[key]
+        ends = np.cumsum(sizes["key_rows"])
+        return len(keys), self._fetch_key_ranges(
+            relation, key, keys, ends, batch_size, order_by or key
+        )
+
+    @staticmethod
+    def _fetch_key_ranges(relation, key, keys, ends, batch_size, order_by):
+        """
+        Yields the rows of consecutive ranges of keys, one query per range.
+
+        Args:
+            relation (duckdb.DuckDBPyRelation): Relation with the columns to fetch.
+            key (str): Column that groups the rows.
+            keys (numpy.ndarray): Distinct keys, in order.
+            ends (numpy.ndarray): Number of rows up to and including every key.
+            batch_size (int): Maximum number of rows of a range with more than one key.
+            order_by (str): Ordering of the rows.
+
+        Yields:
+            dict: Array of every column of the next batch by name.
+        """
+        column = duckdb.ColumnExpression(key)
+        start = 0
+        while start < len(keys):
+            offset = ends[start - 1] if start else 0
+            end = max(
+                start + 1, int(np.searchsorted(ends, offset + batch_size, side="right"))
+            )
+            condition = (column >= duckdb.ConstantExpression(keys[start])) & (
+                column <= duckdb.ConstantExpression(keys[end - 1])
+            )
+            yield relation.filter(condition).order(order_by).fetchnumpy()
+            start = end
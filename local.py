@@ -15,6 +15,9 @@ ZIP_PATH = os.environ.get("ZIP_PATH", DATASET_PATH + "/podcastreviews.zip")
 VECTORS_PATH = os.environ.get(
     "VECTORS_PATH", ensure_directory_exists(f"{os.getcwd()}/dataset/vectors")
 )
+INDEX_PATH = os.environ.get(
+    "INDEX_PATH", ensure_directory_exists(f"{os.getcwd()}/dataset/index")
+)
 DB_PATH = RAW_DATA_PATH + "/database.db"
 QUERY = (
     "I want to listen to a podcast about entertainment industry, focusing on videogames"
@@ -38,8 +41,17 @@ if __name__ == "__main__":
     --max_score: Maximum rating score for the results (default: None)
     --min_date: Minimum date for the results (default: None)
     --max_date: Maximum date for the results (default: None)
+    --min_ratings_count: Minimum number of ratings for the results (default: None)
+    --categories: Categories for the results, a podcast matches any of them (default: None)
     --boost_mode: Ranks higher results with a bigger average rating score (default: False)
     --verbose: Verbosity of the execution (default: False)
+    --workers: Number of processes used to build the document index (default: 1)
+    --search_mode: "exact" to score every podcast, "ivf" for the approximate search (default: exact)
+    --ann_lists: Number of inverted lists of the approximate search (default: None)
+    --ann_nprobe: Number of inverted lists scanned per query (default: 8)
+    --quantization: Compression of the document vectors, "int8" or "pq" (default: None)
+    --build_batch_size: Number of records read from the database per batch of the build (default: 10000)
+    --full_build: Embeds every podcast instead of reusing the vectors of the latest index (default: False)
     """
 
     parser = argparse.ArgumentParser(
@@ -101,6 +113,20 @@ if __name__ == "__main__":
         default=None,
         help="Maximum date for the results",
     )
+    parser.add_argument(
+        "--min_ratings_count",
+        type=int,
+        nargs="?",
+        default=None,
+        help="Minimum number of ratings for the results",
+    )
+    parser.add_argument(
+        "--categories",
+        type=str,
+        nargs="*",
+        default=None,
+        help="Categories for the results, a podcast matches any of them",
+    )
     parser.add_argument(
         "--boost_mode",
         action="store_true",
@@ -109,6 +135,55 @@ if __name__ == "__main__":
     parser.add_argument(
         "--verbose", action="store_true", help="Verbosity of the execution"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="?",
+        default=1,
+        help="Number of processes used to build the document index",
+    )
+    parser.add_argument(
+        "--search_mode",
+        type=str,
+        nargs="?",
+        default="exact",
+        choices=["exact", "ivf"],
+        help="Score every podcast or use the approximate search",
+    )
+    parser.add_argument(
+        "--ann_lists",
+        type=int,
+        nargs="?",
+        default=None,
+        help="Number of inverted lists of the approximate search",
+    )
+    parser.add_argument(
+        "--ann_nprobe",
+        type=int,
+        nargs="?",
+        default=8,
+        help="Number of inverted lists scanned per query",
+    )
+    parser.add_argument(
+        "--quantization",
+        type=str,
+        nargs="?",
+        default=None,
+        choices=["int8", "pq"],
+        help="Compression of the document vectors",
+    )
+    parser.add_argument(
+        "--build_batch_size",
+        type=int,
+        nargs="?",
+        default=10000,
+        help="Number of records read from the database per batch of the build",
+    )
+    parser.add_argument(
+        "--full_build",
+        action="store_true",
+        help="Embeds every podcast instead of reusing the vectors of the latest index",
+    )
 
     args = parser.parse_args()
 
@@ -125,6 +200,16 @@ if __name__ == "__main__":
         args.max_date,
         args.boost_mode,
         args.verbose,
+        INDEX_PATH,
+        args.workers,
+        args.search_mode,
+        args.ann_lists,
+        args.ann_nprobe,
+        args.quantization,
+        min_ratings_count=args.min_ratings_count,
+        categories=args.categories,
+        build_batch_size=args.build_batch_size,
+        incremental=not args.full_build,
     )
     ranks = core_app.main_logic()
     LOGGER.info(ranks)
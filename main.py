@@ -1,12 +1,30 @@
 import os
-from typing import Optional
+import secrets
+from contextlib import asynccontextmanager
+from datetime import date
+from functools import partial
+from typing import List, Optional
 from uuid import UUID, uuid4
 
-from fastapi import FastAPI
-from pydantic import BaseModel
+from fastapi import Depends, FastAPI, Header, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
 
+from core.batcher import MicroBatcher
 from core.core import CoreAPP
-from utils.common import ensure_directory_exists
+from core.executor import BoundedExecutor, QueueFullError
+from core.pages import ResultSnapshots, make_cursor
+from core.responses import encode, negotiate
+from core.results import ResultCache
+from core.service import (
+    SearchService,
+    init_worker_service,
+    rank_batch_in_worker,
+    rank_in_worker,
+)
+from data.database import close_query_workers
+from utils.common import ensure_directory_exists, process_memory
 
 # Environment configuration
 DATASET_PATH = os.environ.get(
@@ -19,14 +37,149 @@ ZIP_PATH = os.environ.get("ZIP_PATH", DATASET_PATH + "/podcastreviews.zip")
 VECTORS_PATH = os.environ.get(
     "VECTORS_PATH", ensure_directory_exists(f"{os.getcwd()}/dataset/vectors")
 )
+INDEX_PATH = os.environ.get(
+    "INDEX_PATH", ensure_directory_exists(f"{os.getcwd()}/dataset/index")
+)
+SEARCH_MODE = os.environ.get("SEARCH_MODE", "exact")
+ANN_LISTS = int(os.environ["ANN_LISTS"]) if os.environ.get("ANN_LISTS") else None
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", 8))
+QUANTIZATION = os.environ.get("QUANTIZATION") or None
 DB_PATH = RAW_DATA_PATH + "/database.db"
+DUCKDB_THREADS = (
+    int(os.environ["DUCKDB_THREADS"]) if os.environ.get("DUCKDB_THREADS") else None
+)
+DUCKDB_MEMORY_LIMIT = os.environ.get("DUCKDB_MEMORY_LIMIT") or None
+BUILD_BATCH_SIZE = int(os.environ.get("BUILD_BATCH_SIZE", 10000))
+INCREMENTAL_INDEX = os.environ.get("INCREMENTAL_INDEX", "true") == "true"
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN") or None
 QUERY = (
     "I want to listen to a podcast about entertainment industry, focusing on videogames"
 )
 TOP_N = 5
+WARMUP_QUERIES = [
+    query for query in os.environ.get("WARMUP_QUERIES", QUERY).split("|") if query
+]
+PRELOAD_IN_BACKGROUND = os.environ.get("PRELOAD_IN_BACKGROUND", "false") == "true"
+SEARCH_EXECUTOR = os.environ.get("SEARCH_EXECUTOR", "thread")
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", os.cpu_count() or 1))
+SEARCH_QUEUE_SIZE = int(os.environ.get("SEARCH_QUEUE_SIZE", 64))
+SEARCH_BATCH_MAX_QUERIES = int(os.environ.get("SEARCH_BATCH_MAX_QUERIES", 1000))
+MICRO_BATCH_WINDOW_MS = float(os.environ.get("MICRO_BATCH_WINDOW_MS", 2.0))
+MICRO_BATCH_MAX_SIZE = int(os.environ.get("MICRO_BATCH_MAX_SIZE", 32))
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 1024))
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", 300)) or None
+SEARCH_MAX_RESULTS = int(os.environ.get("SEARCH_MAX_RESULTS", 10000))
+PAGE_SIZE = int(os.environ.get("PAGE_SIZE", 50))
+SNAPSHOT_CACHE_SIZE = int(os.environ.get("SNAPSHOT_CACHE_SIZE", 128))
+SNAPSHOT_TTL = float(os.environ.get("SNAPSHOT_TTL", 600)) or None
+
+# Per-query settings of a batch search; a batch query can override the shared ones
+BATCH_SETTINGS = (
+    "top_n",
+    "min_score",
+    "max_score",
+    "min_date",
+    "max_date",
+    "min_ratings_count",
+    "categories",
+    "boost_mode",
+)
+
+
+def create_core_app():
+    """
+    Creates the `CoreAPP` served by the API, configured from the environment.
+
+    Returns:
+        CoreAPP: The application to load.
+    """
+    return CoreAPP(
+        ZIP_PATH,
+        RAW_DATA_PATH,
+        DB_PATH,
+        VECTORS_PATH,
+        QUERY,
+        TOP_N,
+        None,
+        None,
+        None,
+        None,
+        False,
+        False,
+        INDEX_PATH,
+        search_mode=SEARCH_MODE,
+        ann_lists=ANN_LISTS,
+        ann_nprobe=ANN_NPROBE,
+        quantization=QUANTIZATION,
+        db_threads=DUCKDB_THREADS,
+        db_memory_limit=DUCKDB_MEMORY_LIMIT,
+        build_batch_size=BUILD_BATCH_SIZE,
+        incremental=INCREMENTAL_INDEX,
+    )
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Loads the search service once for the lifetime of the application.
+
+    By default the application only starts serving once the index is loaded and warmed up. With
+    `PRELOAD_IN_BACKGROUND`, it starts serving at once and loads in a background thread, and
+    `/ready/` reports when loading has finished.
+
+    Searches run in a bounded pool of `SEARCH_WORKERS` threads or processes (`SEARCH_EXECUTOR`),
+    so they never block the event loop. Worker processes load their own search service from the
+    index built by the application.
 
+    Concurrent single searches are gathered by a micro-batcher into batches of up to
+    `MICRO_BATCH_MAX_SIZE` queries, waiting at most `MICRO_BATCH_WINDOW_MS`, and are only held
+    back while every worker is busy. A maximum size of 1 disables the micro-batching.
 
-app = FastAPI()
+    Results are cached for `RESULT_CACHE_TTL` seconds in a cache of `RESULT_CACHE_SIZE` entries,
+    keyed by the normalized request and the index fingerprint, and concurrent identical searches
+    share one computation.
+
+    Deep searches keep their ranked results as snapshots for `SNAPSHOT_TTL` seconds, at most
+    `SNAPSHOT_CACHE_SIZE` of them, to serve their pages without ranking again.
+
+    Index builds read the database through one read-only DuckDB connection per database file,
+    kept open by a dedicated query thread for the lifetime of the application and configured
+    with `DUCKDB_THREADS` and `DUCKDB_MEMORY_LIMIT`, in batches of `BUILD_BATCH_SIZE` records.
+
+    Args:
+        app (FastAPI): The application.
+    """
+    app.state.service = SearchService(create_core_app, WARMUP_QUERIES)
+    if SEARCH_EXECUTOR == "process":
+        app.state.executor = BoundedExecutor(
+            SEARCH_WORKERS,
+            SEARCH_QUEUE_SIZE,
+            kind="process",
+            initializer=init_worker_service,
+            initargs=(create_core_app, WARMUP_QUERIES),
+        )
+    else:
+        app.state.executor = BoundedExecutor(SEARCH_WORKERS, SEARCH_QUEUE_SIZE)
+    app.state.results = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+    app.state.snapshots = ResultSnapshots(SNAPSHOT_CACHE_SIZE, SNAPSHOT_TTL)
+    app.state.batcher = None
+    if MICRO_BATCH_MAX_SIZE > 1:
+        app.state.batcher = MicroBatcher(
+            _run_micro_batch,
+            window=MICRO_BATCH_WINDOW_MS / 1000,
+            max_batch_size=MICRO_BATCH_MAX_SIZE,
+            max_in_flight=SEARCH_WORKERS,
+        )
+    if PRELOAD_IN_BACKGROUND:
+        app.state.service.start()
+    else:
+        await run_in_threadpool(app.state.service.load)
+    yield
+    app.state.executor.shutdown()
+    close_query_workers()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 
 class Request(BaseModel):
@@ -39,11 +192,14 @@ class Request(BaseModel):
         db_path (str): Path to the SQLite database file. Defaults to DB_PATH.
         vectors_path (str): Path to the vectors file. Defaults to VECTORS_PATH.
         query (str): Query for performing the search. Defaults to QUERY.
-        top_n (int): Number of top results to return. Defaults to TOP_N.
+        top_n (int): Number of top results to return, at least 1. Defaults to TOP_N.
         min_score (Optional[float]): Minimum score for filtering results. Defaults to None.
         max_score (Optional[float]): Maximum score for filtering results. Defaults to None.
-        min_date (Optional[str]): Minimum date for filtering results. Defaults to None.
-        max_date (Optional[str]): Maximum date for filtering results. Defaults to None.
+        min_date (Optional[date]): Minimum date for filtering results. Defaults to None.
+        max_date (Optional[date]): Maximum date for filtering results. Defaults to None.
+        min_ratings_count (Optional[int]): Minimum number of ratings for filtering results. Defaults to None.
+        categories (Optional[List[str]]): Categories for filtering results; a podcast matches any of them.
+                                          Defaults to None.
         boost_mode (bool): Whether to use boost mode or not. Defaults to False.
         verbose (bool): Whether to enable verbose output. Defaults to False.
     """
@@ -53,15 +209,32 @@ class Request(BaseModel):
     db_path: str = DB_PATH
     vectors_path: str = VECTORS_PATH
     query: str = QUERY
-    top_n: int = TOP_N
+    top_n: int = Field(TOP_N, ge=1)
     min_score: Optional[float] = None
     max_score: Optional[float] = None
-    min_date: Optional[str] = None
-    max_date: Optional[str] = None
+    min_date: Optional[date] = None
+    max_date: Optional[date] = None
+    min_ratings_count: Optional[int] = None
+    categories: Optional[List[str]] = None
     boost_mode: bool = False
     verbose: bool = False
 
 
+class Result(BaseModel):
+    """
+    One ranked podcast of a search response.
+
+    Attributes:
+        id (str): Podcast ID.
+        url (str): iTunes URL of the podcast.
+        score (float): Similarity score, boosted by the average rating in boost mode.
+    """
+
+    id: str
+    url: str
+    score: float
+
+
 class Prediction(BaseModel):
     """
     Response body schema for the /search/ endpoint.
@@ -69,12 +242,135 @@ class Prediction(BaseModel):
     Attributes:
         prediction_id (Optional[UUID]): Unique identifier for the prediction. Defaults to a new UUID.
         top_n_results (int): Number of top results returned.
-        ranks (str): JSON string containing the ranked results.
+        ranks (List[Result]): Ranked results, best first.
     """
 
     prediction_id: Optional[UUID] = uuid4()
     top_n_results: int
-    ranks: str
+    ranks: List[Result]
+
+
+class BatchQuery(BaseModel):
+    """
+    One query of a /search/batch/ request.
+
+    The settings that are set override the shared settings of the request, and an explicit null
+    removes a shared filter; the settings that are not set take the shared value.
+
+    Attributes:
+        query (str): Query for performing the search.
+        top_n (int): Number of top results to return, at least 1.
+        min_score (Optional[float]): Minimum score for filtering results.
+        max_score (Optional[float]): Maximum score for filtering results.
+        min_date (Optional[date]): Minimum date for filtering results.
+        max_date (Optional[date]): Maximum date for filtering results.
+        min_ratings_count (Optional[int]): Minimum number of ratings for filtering results.
+        categories (Optional[List[str]]): Categories for filtering results.
+        boost_mode (Optional[bool]): Whether to use boost mode or not.
+    """
+
+    query: str
+    top_n: int = Field(TOP_N, ge=1)
+    min_score: Optional[float] = None
+    max_score: Optional[float] = None
+    min_date: Optional[date] = None
+    max_date: Optional[date] = None
+    min_ratings_count: Optional[int] = None
+    categories: Optional[List[str]] = None
+    boost_mode: Optional[bool] = None
+
+
+class BatchRequest(BaseModel):
+    """
+    Request body schema for the /search/batch/ endpoint.
+
+    Batches are always served by the preloaded search service.
+
+    Attributes:
+        queries (List[BatchQuery]): Queries to rank, with their own settings.
+        top_n (int): Shared number of top results to return, at least 1. Defaults to TOP_N.
+        min_score (Optional[float]): Shared minimum score for filtering results. Defaults to None.
+        max_score (Optional[float]): Shared maximum score for filtering results. Defaults to None.
+        min_date (Optional[date]): Shared minimum date for filtering results. Defaults to None.
+        max_date (Optional[date]): Shared maximum date for filtering results. Defaults to None.
+        min_ratings_count (Optional[int]): Shared minimum number of ratings for filtering results.
+                                           Defaults to None.
+        categories (Optional[List[str]]): Shared categories for filtering results. Defaults to None.
+        boost_mode (bool): Shared boost mode. Defaults to False.
+    """
+
+    queries: List[BatchQuery]
+    top_n: int = Field(TOP_N, ge=1)
+    min_score: Optional[float] = None
+    max_score: Optional[float] = None
+    min_date: Optional[date] = None
+    max_date: Optional[date] = None
+    min_ratings_count: Optional[int] = None
+    categories: Optional[List[str]] = None
+    boost_mode: bool = False
+
+
+class BatchPrediction(BaseModel):
+    """
+    Response body schema for the /search/batch/ endpoint.
+
+    Attributes:
+        prediction_id (Optional[UUID]): Unique identifier for the batch. Defaults to a new UUID.
+        predictions (List[Prediction]): Prediction of every query, in the order of the request.
+    """
+
+    prediction_id: Optional[UUID] = uuid4()
+    predictions: List[Prediction]
+
+
+class DeepSearchRequest(BaseModel):
+    """
+    Request body schema for the /search/pages/ and /search/stream/ endpoints.
+
+    Deep searches are always served by the preloaded search service.
+
+    Attributes:
+        query (str): Query for performing the search. Defaults to QUERY.
+        max_results (int): Number of ranked results of the search. Defaults to SEARCH_MAX_RESULTS.
+        page_size (int): Number of results of a page, or of a chunk of the stream. Defaults to PAGE_SIZE.
+        min_score (Optional[float]): Minimum score for filtering results. Defaults to None.
+        max_score (Optional[float]): Maximum score for filtering results. Defaults to None.
+        min_date (Optional[date]): Minimum date for filtering results. Defaults to None.
+        max_date (Optional[date]): Maximum date for filtering results. Defaults to None.
+        min_ratings_count (Optional[int]): Minimum number of ratings for filtering results. Defaults to None.
+        categories (Optional[List[str]]): Categories for filtering results. Defaults to None.
+        boost_mode (bool): Whether to use boost mode or not. Defaults to False.
+    """
+
+    query: str = QUERY
+    max_results: int = Field(SEARCH_MAX_RESULTS, ge=1)
+    page_size: int = Field(PAGE_SIZE, ge=1)
+    min_score: Optional[float] = None
+    max_score: Optional[float] = None
+    min_date: Optional[date] = None
+    max_date: Optional[date] = None
+    min_ratings_count: Optional[int] = None
+    categories: Optional[List[str]] = None
+    boost_mode: bool = False
+
+
+class Page(BaseModel):
+    """
+    Response body schema for the /search/pages/ endpoints.
+
+    Attributes:
+        snapshot_id (str): Identifier of the snapshot of the ranked results.
+        offset (int): Position of the first result of the page in the snapshot.
+        total_results (int): Number of ranked results of the snapshot.
+        ranks (List[Result]): Ranked results of the page, best first.
+        next_cursor (Optional[str]): Cursor of the next page, or None on the last page.
+    """
+
+    snapshot_id: str
+    offset: int
+    total_results: int
+    ranks: List[Result]
+    next_cursor: Optional[str] = None
 
 
 @app.get("/")
@@ -88,33 +384,531 @@ async def read_root():
     return "Welcome to the IR example implementation"
 
 
-@app.post("/search/", response_model=Prediction)
-async def search_podcasts(request: Request):
+def _uses_preloaded_state(request):
     """
-    Endpoint for searching podcasts based on the provided request parameters.
+    Checks whether a request targets the data and settings preloaded by the search service.
 
     Args:
         request (Request): Request body containing search parameters.
 
     Returns:
-        Prediction: A Prediction object containing the prediction ID, number of top results, and ranked results.
+        bool: True if the request can be served by the search service.
     """
-    core_app = CoreAPP(
+    return (
         request.zip_path,
         request.extract_to,
         request.db_path,
         request.vectors_path,
-        request.query,
-        request.top_n,
-        request.min_score,
-        request.max_score,
-        request.min_date,
-        request.max_date,
-        request.boost_mode,
-        request.verbose,
+    ) == (
+        ZIP_PATH,
+        RAW_DATA_PATH,
+        DB_PATH,
+        VECTORS_PATH,
+    )
+
+
+@app.get("/ready/")
+async def read_ready():
+    """
+    Readiness endpoint, which succeeds only once the search service has finished loading.
+
+    Returns:
+        dict: Loading status of the search service.
+
+    Raises:
+        HTTPException: 503 while the search service is loading or if it failed to load.
+    """
+    service = app.state.service
+    if not service.ready:
+        raise HTTPException(status_code=503, detail=service.status())
+    return service.status()
+
+
+@app.get("/metrics/")
+async def read_metrics():
+    """
+    Metrics endpoint with the loading status of the search service, the status of the last
+    index rebuild, the executor, micro-batcher, result cache and snapshot counters and the
+    memory of the server process.
+
+    With several server workers, every worker answers with its own counters and memory.
+
+    Returns:
+        dict: Status of the search service, queue depth, task counters and wait times of the
+        search executor, batch sizes and added latency of the micro-batcher, if enabled, hits,
+        misses and coalesced requests of the result cache, hits and expirations of the
+        snapshots of deep searches and resident, shared and private memory of the process.
+    """
+    batcher = app.state.batcher
+    return {
+        "service": app.state.service.status(),
+        "executor": app.state.executor.stats(),
+        "batcher": None if batcher is None else batcher.stats(),
+        "results": app.state.results.stats(),
+        "snapshots": app.state.snapshots.stats(),
+        "rebuild": app.state.service.rebuild_status(),
+        "memory": process_memory(),
+    }
+
+
+def _result_key(request):
+    """
+    Normalizes the settings of a request that change its ranking, to key the result cache.
+
+    The query is lowercased and its whitespace collapsed, like the query cache of the model does,
+    and the categories are sorted into a tuple.
+
+    Args:
+        request (Request): Request body containing search parameters.
+
+    Returns:
+        tuple: Normalized query followed by the values of `BATCH_SETTINGS`.
+    """
+    query = " ".join(request.query.lower().split())
+    settings = {name: getattr(request, name) for name in BATCH_SETTINGS}
+    if settings["categories"] is not None:
+        settings["categories"] = tuple(sorted(set(settings["categories"])))
+    return (query, *settings.values())
+
+
+def _rank_settings(request):
+    """
+    Collects the boost mode and filters of a request, as accepted by `CoreAPP.rank`.
+
+    Args:
+        request (Request or DeepSearchRequest): Request body containing search parameters.
+
+    Returns:
+        dict: Boost mode and rating, date and category filters of the request.
+    """
+    return {
+        "boost_mode": request.boost_mode,
+        "min_score": request.min_score,
+        "max_score": request.max_score,
+        "min_date": request.min_date,
+        "max_date": request.max_date,
+        "min_ratings_count": request.min_ratings_count,
+        "categories": request.categories,
+    }
+
+
+def _encoded_response(body, media_type):
+    """
+    Encodes a response body once, in the format negotiated with the client.
+
+    Args:
+        body (dict): Response body, whose ranked results are already encoded.
+        media_type (str): Media type of the response.
+
+    Returns:
+        Response: The encoded response.
+    """
+    return Response(content=encode(body, media_type), media_type=media_type)
+
+
+async def _search_preloaded(request):
+    """
+    Ranks a request with the search service, through the micro-batcher if it is enabled.
+
+    Args:
+        request (Request): Request body containing search parameters.
+
+    Returns:
+        tuple: Version of the index and tuples with its rows and their scores, best first.
+
+    Raises:
+        QueueFullError: If the search queue is full.
+    """
+    if app.state.batcher is not None:
+        return await app.state.batcher.submit(request)
+    executor = app.state.executor
+    rank = rank_in_worker if executor.kind == "process" else app.state.service.rank
+    return await executor.run(
+        rank, request.query, request.top_n, **_rank_settings(request)
+    )
+
+
+async def _run_search_batch(queries, settings):
+    """
+    Ranks a batch of queries with the search service, in the bounded search executor.
+
+    Args:
+        queries (list of str): Query strings for searching podcasts.
+        settings (dict): List with the value of every query for each of `BATCH_SETTINGS`.
+
+    Returns:
+        tuple: Version of the index and, for every query, tuples with its rows and their scores.
+
+    Raises:
+        QueueFullError: If the search queue is full.
+    """
+    executor = app.state.executor
+    if executor.kind == "process":
+        rank_batch = rank_batch_in_worker
+    else:
+        rank_batch = app.state.service.rank_batch
+    return await executor.run(rank_batch, queries, **settings)
+
+
+async def _run_micro_batch(requests):
+    """
+    Ranks the single search requests gathered by the micro-batcher as one batch.
+
+    Args:
+        requests (list of Request): Request bodies containing search parameters.
+
+    Returns:
+        list: For every request, the version of the index and tuples with its rows and their
+        scores.
+    """
+    settings = {
+        name: [getattr(request, name) for request in requests]
+        for name in BATCH_SETTINGS
+    }
+    version, batch_ranks = await _run_search_batch(
+        [request.query for request in requests], settings
+    )
+    return [(version, ranks) for ranks in batch_ranks]
+
+
+@app.post("/search/", response_model=Prediction)
+async def search_podcasts(request: Request, accept: Optional[str] = Header(None)):
+    """
+    Endpoint for searching podcasts based on the provided request parameters.
+
+    Requests are served by the search service, which only embeds the query and ranks, in the
+    bounded search executor; results are cached, concurrent identical requests share one
+    computation and, with the micro-batcher, concurrent requests are ranked together. No index
+    is loaded or built on the request path, so requests for other data paths are rejected.
+
+    The response is JSON, or MessagePack if the Accept header prefers "application/msgpack".
+
+    Args:
+        request (Request): Request body containing search parameters.
+        accept (Optional[str]): Accept header of the request.
+
+    Returns:
+        Prediction: A Prediction object containing the prediction ID, number of top results, and ranked results.
+
+    Raises:
+        HTTPException: 400 for data paths other than the preloaded ones, or 503 while the search
+            service is loading or when the search queue is full.
+    """
+    if not _uses_preloaded_state(request):
+        raise HTTPException(
+            status_code=400,
+            detail="Only the data paths preloaded by the server can be searched",
+        )
+    service = app.state.service
+    if not service.ready:
+        raise HTTPException(status_code=503, detail=service.status())
+    try:
+        version, ranks = await app.state.results.get_or_compute(
+            _result_key(request),
+            service.index_version,
+            partial(_search_preloaded, request),
+        )
+    except QueueFullError as error:
+        raise HTTPException(status_code=503, detail=str(error))
+    encoder = service.encoder_for(version)
+    media_type = negotiate(accept)
+    return _encoded_response(
+        {
+            "prediction_id": uuid4(),
+            "top_n_results": request.top_n,
+            "ranks": encoder.encode(ranks, media_type),
+        },
+        media_type,
     )
-    ranks = core_app.main_logic()
-    prediction = Prediction(
-        prediction_id=uuid4(), top_n_results=request.top_n, ranks=ranks
+
+
+def _batch_settings(request):
+    """
+    Resolves the settings of every query of a batch request.
+
+    Args:
+        request (BatchRequest): Request body containing the queries and the shared settings.
+
+    Returns:
+        dict: List with the value of every query for each setting.
+    """
+    return {
+        name: [
+            getattr(query if name in query.model_fields_set else request, name)
+            for query in request.queries
+        ]
+        for name in BATCH_SETTINGS
+    }
+
+
+@app.post("/search/batch/", response_model=BatchPrediction)
+async def search_podcasts_batch(
+    request: BatchRequest, accept: Optional[str] = Header(None)
+):
+    """
+    Endpoint for ranking many queries in one call.
+
+    The queries are embedded together and scored with one matrix-matrix product by the search
+    service, in the bounded search executor. The response is JSON, or MessagePack if the Accept
+    header prefers "application/msgpack".
+
+    Args:
+        request (BatchRequest): Request body containing the queries and the shared settings.
+        accept (Optional[str]): Accept header of the request.
+
+    Returns:
+        BatchPrediction: The prediction of every query, in the order of the request.
+
+    Raises:
+        HTTPException: 413 if the batch has more than SEARCH_BATCH_MAX_QUERIES queries, 503 while
+        the search service is loading or when the search queue is full.
+    """
+    if len(request.queries) > SEARCH_BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"A batch can have at most {SEARCH_BATCH_MAX_QUERIES} queries",
+        )
+    service = app.state.service
+    if not service.ready:
+        raise HTTPException(status_code=503, detail=service.status())
+    settings = _batch_settings(request)
+    try:
+        version, batch_ranks = await _run_search_batch(
+            [query.query for query in request.queries], settings
+        )
+    except QueueFullError as error:
+        raise HTTPException(status_code=503, detail=str(error))
+    encoder = service.encoder_for(version)
+    media_type = negotiate(accept)
+    return _encoded_response(
+        {
+            "prediction_id": uuid4(),
+            "predictions": [
+                {
+                    "prediction_id": uuid4(),
+                    "top_n_results": top_n,
+                    "ranks": encoder.encode(ranks, media_type),
+                }
+                for top_n, ranks in zip(settings["top_n"], batch_ranks)
+            ],
+        },
+        media_type,
     )
-    return prediction
+
+
+async def _rank_deep(request):
+    """
+    Ranks the `max_results` best results of a deep search with the search service.
+
+    Args:
+        request (DeepSearchRequest): Request body containing search parameters.
+
+    Returns:
+        tuple: Encoder of the index and the ranked rows with their scores, best first.
+
+    Raises:
+        HTTPException: 413 if more than SEARCH_MAX_RESULTS results are requested, 503 while the
+        search service is loading or when the search queue is full.
+    """
+    if request.max_results > SEARCH_MAX_RESULTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"A search can rank at most {SEARCH_MAX_RESULTS} results",
+        )
+    service = app.state.service
+    if not service.ready:
+        raise HTTPException(status_code=503, detail=service.status())
+    executor = app.state.executor
+    rank = rank_in_worker if executor.kind == "process" else service.rank
+    try:
+        version, ranks = await executor.run(
+            rank, request.query, request.max_results, **_rank_settings(request)
+        )
+    except QueueFullError as error:
+        raise HTTPException(status_code=503, detail=str(error))
+    return service.encoder_for(version), ranks
+
+
+def _get_page(cursor, limit=None, accept=None):
+    """
+    Returns a page of a snapshot of ranked results.
+
+    Args:
+        cursor (str): Cursor "<snapshot_id>-<offset>" of the first result of the page.
+        limit (Optional[int]): Number of results of the page. Defaults to the page size of the snapshot.
+        accept (Optional[str]): Accept header of the request.
+
+    Returns:
+        Response: The encoded page.
+
+    Raises:
+        HTTPException: 400 if the cursor is malformed, 404 if its snapshot does not exist or has expired.
+    """
+    try:
+        page = app.state.snapshots.page(cursor, limit)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    except KeyError:
+        raise HTTPException(
+            status_code=404, detail="The snapshot does not exist or has expired"
+        )
+    media_type = negotiate(accept)
+    encoder = page.pop("encoder")
+    page["ranks"] = encoder.encode(page["ranks"], media_type)
+    return _encoded_response(page, media_type)
+
+
+@app.post("/search/pages/", response_model=Page)
+async def search_podcasts_pages(
+    request: DeepSearchRequest, accept: Optional[str] = Header(None)
+):
+    """
+    Endpoint for paging through the results of a deep search.
+
+    The `max_results` best results are ranked once and kept as a snapshot; the response is the
+    first page, and its `next_cursor` leads to the next page through `GET /search/pages/{cursor}`.
+
+    Args:
+        request (DeepSearchRequest): Request body containing search parameters.
+        accept (Optional[str]): Accept header of the request.
+
+    Returns:
+        Page: The first page of the results.
+
+    Raises:
+        HTTPException: 413 if more than SEARCH_MAX_RESULTS results are requested, 503 while the
+        search service is loading or when the search queue is full.
+    """
+    encoder, ranks = await _rank_deep(request)
+    snapshot_id = app.state.snapshots.create(ranks, request.page_size, encoder)
+    return _get_page(make_cursor(snapshot_id, 0), accept=accept)
+
+
+@app.get("/search/pages/{cursor}", response_model=Page)
+async def read_search_page(
+    cursor: str,
+    limit: Optional[int] = Query(None, ge=1),
+    accept: Optional[str] = Header(None),
+):
+    """
+    Endpoint for a page of a deep search, from the snapshot of its ranked results.
+
+    Args:
+        cursor (str): Cursor "<snapshot_id>-<offset>" of the first result of the page.
+        limit (Optional[int]): Number of results of the page. Defaults to the page size of the search.
+        accept (Optional[str]): Accept header of the request.
+
+    Returns:
+        Page: The page.
+
+    Raises:
+        HTTPException: 400 if the cursor is malformed, 404 if its snapshot does not exist or has expired.
+    """
+    return _get_page(cursor, limit, accept)
+
+
+@app.post("/search/stream/")
+async def search_podcasts_stream(request: DeepSearchRequest):
+    """
+    Endpoint for streaming the results of a deep search as newline-delimited JSON.
+
+    The `max_results` best results are ranked once and every line of the response is one ranked
+    result, best first, written in chunks of `page_size` results.
+
+    Args:
+        request (DeepSearchRequest): Request body containing search parameters.
+
+    Returns:
+        StreamingResponse: The ranked results, as "application/x-ndjson".
+
+    Raises:
+        HTTPException: 413 if more than SEARCH_MAX_RESULTS results are requested, 503 while the
+        search service is loading or when the search queue is full.
+    """
+    encoder, ranks = await _rank_deep(request)
+    return StreamingResponse(
+        encoder.iter_lines(ranks, request.page_size),
+        media_type="application/x-ndjson",
+    )
+
+
+class RebuildRequest(BaseModel):
+    """
+    Request body schema for the /admin/index/rebuild/ endpoint.
+
+    Attributes:
+        force (bool): Whether to build the index from scratch even if the index of the current
+                      database, vectors and settings already exists. Defaults to False.
+    """
+
+    force: bool = False
+
+
+def _require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """
+    Checks the admin token of a request to an admin endpoint.
+
+    The admin endpoints are disabled unless the `ADMIN_TOKEN` env variable is set.
+
+    Args:
+        x_admin_token (Optional[str]): Value of the `X-Admin-Token` header.
+
+    Raises:
+        HTTPException: 403 if the admin endpoints are disabled, or 401 if the token is missing
+            or wrong.
+    """
+    if ADMIN_TOKEN is None:
+        raise HTTPException(status_code=403, detail="The admin endpoints are disabled")
+    if x_admin_token is None or not secrets.compare_digest(
+        x_admin_token.encode(), ADMIN_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@app.post(
+    "/admin/index/rebuild/",
+    status_code=202,
+    dependencies=[Depends(_require_admin_token)],
+)
+async def start_index_rebuild(request: RebuildRequest):
+    """
+    Admin endpoint that starts a rebuild of the document index in the background.
+
+    The new index is built or loaded next to the live one, warmed up and swapped in at once;
+    searches keep being served meanwhile, and the ones in flight finish on the previous index.
+    With process workers, the workers are replaced once the new index is live.
+
+    Args:
+        request (RebuildRequest): Request body containing the rebuild options.
+
+    Returns:
+        dict: Status of the rebuild.
+
+    Raises:
+        HTTPException: 401 or 403 if the admin token is wrong or admin endpoints are disabled,
+            or 409 if a rebuild or the initial loading is already running.
+    """
+    executor = app.state.executor
+    on_swap = executor.restart if executor.kind == "process" else None
+    service = app.state.service
+    if not service.start_rebuild(request.force, on_swap=on_swap):
+        raise HTTPException(
+            status_code=409,
+            detail="A rebuild or the initial loading is already running",
+        )
+    return service.rebuild_status()
+
+
+@app.get("/admin/index/rebuild/", dependencies=[Depends(_require_admin_token)])
+async def read_index_rebuild():
+    """
+    Admin endpoint with the status and progress of the last rebuild of the document index.
+
+    Returns:
+        dict: Status, stage, step out of the number of steps, elapsed seconds, index versions
+        and error of the last rebuild.
+
+    Raises:
+        HTTPException: 401 or 403 if the admin token is wrong or admin endpoints are disabled.
+    """
+    return app.state.service.rebuild_status()
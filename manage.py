@@ -0,0 +1,137 @@
+import argparse
+import os
+import time
+
+import requests
+
+from model.model import RetrievalModel
+from model.vectors import convert_vectors
+from utils.common import LOGGER, ensure_directory_exists
+
+# Environment configuration
+VECTORS_PATH = os.environ.get(
+    "VECTORS_PATH", ensure_directory_exists(f"{os.getcwd()}/dataset/vectors")
+)
+API_URL = os.environ.get("API_URL", "http://127.0.0.1:8000")
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+
+def convert_vectors_command(args):
+    """
+    Converts the GoogleNews vectors to the native, memory-mappable format.
+
+    Args:
+        args (argparse.Namespace): Parsed command-line arguments.
+    """
+    rm = RetrievalModel(args.vectors_path)
+    convert_vectors(rm.vectors_path, rm.native_vectors_path, args.limit)
+
+
+def rebuild_index_command(args):
+    """
+    Starts a rebuild of the document index on a running API and reports its progress.
+
+    Args:
+        args (argparse.Namespace): Parsed command-line arguments.
+
+    Raises:
+        SystemExit: If the rebuild could not start or failed.
+    """
+    url = f"{args.url.rstrip('/')}/admin/index/rebuild/"
+    headers = {"X-Admin-Token": args.token} if args.token else {}
+    response = requests.post(
+        url, json={"force": args.force}, headers=headers, timeout=30
+    )
+    if response.status_code != 202:
+        raise SystemExit(f"Rebuild not started: {response.json()['detail']}")
+    LOGGER.info("Index rebuild started")
+    if not args.wait:
+        return
+    stage = None
+    while True:
+        status = requests.get(url, headers=headers, timeout=30).json()
+        if status["stage"] != stage:
+            stage = status["stage"]
+            LOGGER.info(f"Rebuild step {status['step']}/{status['steps']}: {stage}")
+        if status["status"] != "running":
+            break
+        time.sleep(args.interval)
+    if status["status"] == "failed":
+        raise SystemExit(f"Rebuild failed: {status['error']}")
+    LOGGER.info(
+        f"Index {status['index_version']} live after {status['elapsed_seconds']:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    """
+    Entry point for the maintenance commands of the project.
+
+    Commands:
+    convert-vectors: Converts the GoogleNews vectors once to a memory-mappable format
+        --vectors_path: Directory of the vectors file (default: VECTORS_PATH)
+        --limit: Number of words to keep (default: the limit used by the retrieval model)
+    rebuild-index: Rebuilds the document index of a running API in the background and swaps it in
+        --url: Base URL of the API (default: API_URL)
+        --token: Admin token of the API (default: ADMIN_TOKEN)
+        --force: Build the index from scratch even if the index of the current inputs already exists
+        --wait: Wait for the rebuild to finish, reporting its progress
+        --interval: Seconds between two progress checks (default: 1)
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Maintenance commands for the IR example implementation."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = subparsers.add_parser(
+        "convert-vectors",
+        help="Convert the GoogleNews vectors to a memory-mappable format",
+    )
+    convert_parser.add_argument(
+        "--vectors_path",
+        type=str,
+        nargs="?",
+        default=VECTORS_PATH,
+        help="Directory of the vectors file",
+    )
+    convert_parser.add_argument(
+        "--limit",
+        type=int,
+        nargs="?",
+        default=RetrievalModel.TOKENIZER_CONFIG["vectors_limit"],
+        help="Number of words to keep",
+    )
+    convert_parser.set_defaults(func=convert_vectors_command)
+
+    rebuild_parser = subparsers.add_parser(
+        "rebuild-index",
+        help="Rebuild the document index of a running API and swap it in",
+    )
+    rebuild_parser.add_argument(
+        "--url", type=str, default=API_URL, help="Base URL of the API"
+    )
+    rebuild_parser.add_argument(
+        "--token", type=str, default=ADMIN_TOKEN, help="Admin token of the API"
+    )
+    rebuild_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Build the index from scratch even if the index of the current inputs already exists",
+    )
+    rebuild_parser.add_argument(
+        "--wait",
+        action="store_true",
+        help="Wait for the rebuild to finish, reporting its progress",
+    )
+    rebuild_parser.add_argument(
+        "--interval",
+        type=float,
+        default=1.0,
+        help="Seconds between two progress checks",
+    )
+    rebuild_parser.set_defaults(func=rebuild_index_command)
+
+    args = parser.parse_args()
+    args.func(args)
+    LOGGER.info(f"Command {args.command} finished")
@@ -0,0 +1,333 @@
+import json
+import os
+
+import numpy as np
+import scipy.sparse
+
+from model.ranking import MatrixRanker, select_top_n
+from utils.common import LOGGER
+
+
+def assign_to_centroids(vectors, centroids, chunk_size=65536):
+    """
+    Assigns every vector to its closest centroid in Euclidean distance.
+
+    The closest centroid maximizes `x . c - |c|^2 / 2`, which for unit centroids is the highest
+    cosine similarity. The vectors are processed in chunks, so the score matrix never holds more
+    than `chunk_size` rows.
+
+    Args:
+        vectors (numpy.ndarray): Matrix with one vector per row.
+        centroids (numpy.ndarray): Matrix with one centroid per row.
+        chunk_size (int): Number of vectors scored at once.
+
+    Returns:
+        numpy.ndarray: Centroid of every vector.
+    """
+    half_norms = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        scores = vectors[start : start + chunk_size] @ centroids.T - half_norms
+        assignments[start : start + chunk_size] = np.argmax(scores, axis=1)
+    return assignments
+
+
+def kmeans(vectors, n_clusters, iterations=10, seed=0, spherical=False):
+    """
+    Clusters vectors with Lloyd iterations.
+
+    Centroids are seeded with k-means++, which picks every new centroid with a probability
+    proportional to its squared distance to the closest one already picked. A cluster that
+    becomes empty is restarted at a random vector. Spherical k-means renormalizes the centroids
+    after every iteration, which clusters unit vectors by cosine similarity.
+
+    Args:
+        vectors (numpy.ndarray): Matrix with one vector per row; unit and non-zero if spherical.
+        n_clusters (int): Number of clusters, at most the number of vectors.
+        iterations (int): Number of Lloyd iterations.
+        seed (int): Seed of the random generator, so builds are reproducible.
+        spherical (bool): Whether to keep the centroids at unit length.
+
+    Returns:
+        numpy.ndarray: float32 matrix with one centroid per row.
+    """
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    squared_norms = np.einsum("ij,ij->i", vectors, vectors)
+
+    def squared_distances(centroid):
+        distances = squared_norms - 2.0 * (vectors @ centroid) + centroid @ centroid
+        return np.maximum(distances, 0.0).astype(np.float64)
+
+    centroids = np.empty((n_clusters, vectors.shape[1]), dtype=np.float32)
+    centroids[0] = vectors[rng.integers(len(vectors))]
+    distances = squared_distances(centroids[0])
+    for i in range(1, n_clusters):
+        total = distances.sum()
+        if total > 0:
+            choice = rng.choice(len(vectors), p=distances / total)
+        else:
+            choice = rng.integers(len(vectors))
+        centroids[i] = vectors[choice]
+        distances = np.minimum(distances, squared_distances(centroids[i]))
+    for _ in range(iterations):
+        assignments = assign_to_centroids(vectors, centroids)
+        membership = scipy.sparse.csr_matrix(
+            (
+                np.ones(len(vectors), dtype=np.float32),
+                (assignments, np.arange(len(vectors))),
+            ),
+            shape=(n_clusters, len(vectors)),
+        )
+        sums = np.asarray(membership @ vectors, dtype=np.float32)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        empty = counts == 0
+        if spherical:
+            norms = np.linalg.norm(sums, axis=1)
+            empty |= norms == 0
+            centroids[~empty] = sums[~empty] / norms[~empty, None]
+        else:
+            centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+    return centroids
+
+
+class IVFIndex:
+    """
+    An inverted file (IVF-flat) index over unit-normalized document vectors.
+
+    The documents are clustered with spherical k-means into `n_lists` inverted lists. A query
+    only scores the documents of the `nprobe` lists whose centroids are closest to it, so the
+    cost of a search is about `nprobe / n_lists` of an exact scan. The lists are stored as one
+    array of rows sorted by list plus the offset of every list in it.
+
+    Attributes:
+        centroids (numpy.ndarray): float32 matrix with the unit centroid of every list.
+        list_offsets (numpy.ndarray): Start of every list in `list_rows`, plus the total count.
+        list_rows (numpy.ndarray): Rows of the documents, grouped by list.
+    """
+
+    MANIFEST = "manifest.json"
+    ARRAYS = ("centroids", "list_offsets", "list_rows")
+
+    def __init__(self, centroids, list_offsets, list_rows):
+        """
+        Initializes the IVFIndex instance.
+
+        Args:
+            centroids (numpy.ndarray): Matrix with the unit centroid of every list.
+            list_offsets (numpy.ndarray): Start of every list in `list_rows`, plus the total count.
+            list_rows (numpy.ndarray): Rows of the documents, grouped by list.
+        """
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+
+    def __len__(self):
+        return len(self.list_rows)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(
+        cls, vectors, n_lists=None, iterations=10, seed=0, train_size_per_list=256
+    ):
+        """
+        Clusters the document vectors and builds the inverted lists.
+
+        The centroids are trained on a sample of at most `train_size_per_list` documents per list,
+        and every document is then assigned to its closest centroid.
+
+        Args:
+            vectors (numpy.ndarray): Matrix with the unit-normalized vector of every document.
+            n_lists (Optional[int]): Number of inverted lists. Defaults to the square root of
+                                     the number of documents.
+            iterations (int): Number of k-means iterations.
+            seed (int): Seed of the random generator, so builds are reproducible.
+            train_size_per_list (int): Maximum number of training documents per list.
+
+        Returns:
+            IVFIndex: The new index.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        train = vectors[np.linalg.norm(vectors, axis=1) > 0]
+        if n_lists is None:
+            n_lists = int(np.sqrt(len(vectors)))
+        n_lists = max(1, min(n_lists, len(train)))
+        if len(train) == 0:
+            centroids = np.zeros((1, vectors.shape[1]), dtype=np.float32)
+        else:
+            if len(train) > n_lists * train_size_per_list:
+                rng = np.random.default_rng(seed)
+                sample = rng.choice(
+                    len(train), n_lists * train_size_per_list, replace=False
+                )
+                train = train[np.sort(sample)]
+            centroids = kmeans(train, n_lists, iterations, seed, spherical=True)
+        assignments = assign_to_centroids(vectors, centroids)
+        counts = np.bincount(assignments, minlength=len(centroids))
+        LOGGER.info(
+            f"IVF index built with {len(centroids)} lists, largest list has {counts.max(initial=0)} documents"
+        )
+        return cls(
+            centroids=centroids,
+            list_offsets=np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+            list_rows=np.argsort(assignments, kind="stable").astype(np.int64),
+        )
+
+    def probe(self, query_vector, nprobe):
+        """
+        Retrieves the documents of the lists closest to a query.
+
+        Args:
+            query_vector (numpy.ndarray): Unit query vector.
+            nprobe (int): Number of lists to scan.
+
+        Returns:
+            numpy.ndarray: Rows of the documents in the probed lists.
+        """
+        lists = select_top_n(self.centroids @ query_vector, nprobe)
+        offsets = self.list_offsets
+        return np.concatenate(
+            [self.list_rows[offsets[i] : offsets[i + 1]] for i in lists]
+            or [np.empty(0, dtype=np.int64)]
+        )
+
+    @classmethod
+    def exists(cls, directory):
+        """
+        Checks whether an IVF index has been saved to a directory.
+
+        Args:
+            directory (str): Directory of the IVF index.
+
+        Returns:
+            bool: True if the directory contains a complete IVF index.
+        """
+        return os.path.isfile(os.path.join(directory, cls.MANIFEST))
+
+    def save(self, directory):
+        """
+        Writes the IVF index to a directory.
+
+        The index is written inside the staging directory of its document index, which is what
+        makes the save atomic.
+
+        Args:
+            directory (str): Target directory of the IVF index.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(
+                os.path.join(directory, f"{name}.npy"),
+                np.asarray(getattr(self, name)),
+                allow_pickle=False,
+            )
+        with open(os.path.join(directory, self.MANIFEST), "w") as fh:
+            json.dump({"n_lists": self.n_lists, "count": len(self)}, fh, indent=4)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Loads an IVF index from a directory.
+
+        Args:
+            directory (str): Directory of the IVF index.
+            mmap (bool): Whether to memory map the arrays instead of reading them into memory.
+
+        Returns:
+            IVFIndex: The loaded index.
+        """
+        return cls(
+            **{
+                name: np.load(
+                    os.path.join(directory, f"{name}.npy"),
+                    mmap_mode="r" if mmap else None,
+                    allow_pickle=False,
+                )
+                for name in cls.ARRAYS
+            }
+        )
+
+
+class IVFRanker(MatrixRanker):
+    """
+    Ranks the podcasts of a document index by scanning only the closest inverted lists.
+
+    The probed documents are scored like `MatrixRanker` does, so the results only differ from it
+    when a relevant document sits in a list that was not probed. When the probed lists hold
+    fewer eligible documents than requested, for example with a selective filter, the ranker
+    falls back to the full scan.
+
+    Attributes:
+        index (DocumentIndex): Index with the normalized document vectors and podcast metadata.
+        ann (IVFIndex): Inverted lists of the document vectors.
+        nprobe (int): Number of lists scanned per query.
+    """
+
+    def __init__(self, index, ann, nprobe=8):
+        """
+        Initializes the IVFRanker instance.
+
+        Args:
+            index (DocumentIndex): Index with the normalized document vectors and podcast metadata.
+            ann (IVFIndex): Inverted lists of the document vectors.
+            nprobe (int): Number of lists scanned per query.
+        """
+        super().__init__(index)
+        self.ann = ann
+        self.nprobe = nprobe
+
+    def rank(self, query_vector, top_n, boost_mode, mask=None):
+        """
+        Ranks the documents of the closest lists by similarity to the query vector.
+
+        Args:
+            query_vector (numpy.ndarray): The vector representation of the query.
+            top_n (int): The number of top results to return.
+            boost_mode (bool): If True, multiply the similarity by the average rating score.
+            mask (Optional[numpy.ndarray]): Boolean mask of the documents eligible for ranking.
+
+        Returns:
+            list: List of tuples with the selected row and its score, best first.
+        """
+        unit_query = self.unit_query(query_vector)
+        if unit_query is None:
+            return []
+        rows = self.ann.probe(unit_query, self.nprobe)
+        if mask is not None:
+            rows = rows[mask[rows]]
+        if len(rows) < top_n:
+            return super().rank(query_vector, top_n, boost_mode, mask)
+        scores = self.scores(unit_query, rows)
+        if boost_mode:
+            scores = scores * self.index.average_ratings[rows]
+        selected = select_top_n(scores, top_n)
+        return [(int(rows[i]), float(scores[i])) for i in selected]
+
+    def rank_batch(self, query_vectors, top_n, boost_mode, masks):
+        """
+        Ranks the documents of the closest lists for a batch of queries.
+
+        Every query probes its own lists, so the queries are ranked one at a time.
+
+        Args:
+            query_vectors (numpy.ndarray): Matrix with one query vector per row.
+            top_n (list of int): The number of top results to return for every query.
+            boost_mode (list of bool): Whether to multiply the similarity by the average rating
+                                       score for every query.
+            masks (list of Optional[numpy.ndarray]): Boolean mask of the documents eligible for
+                                                     ranking for every query.
+
+        Returns:
+            list: For every query, a list of tuples with the selected row and its score, best first.
+        """
+        return [
+            self.rank(query_vector, n, boost, mask)
+            for query_vector, n, boost, mask in zip(
+                query_vectors, top_n, boost_mode, masks
+            )
+        ]
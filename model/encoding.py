@@ -0,0 +1,52 @@
+import numpy as np
+import scipy.sparse
+
+
+def build_doc_term_matrix(token_lists, key_to_index):
+    """
+    Builds the CSR document-term matrix that averages the word vectors of each document.
+
+    Every in-vocabulary token of a document gets a weight of one over the number of tokens of the
+    document. Out of vocabulary tokens have no column but still count in the denominator, which
+    matches averaging them as zero vectors. Repeated tokens are stored as repeated entries, which
+    the sparse product adds up.
+
+    Args:
+        token_lists (list of list of str): Tokens of every document.
+        key_to_index (dict): Mapping from word to row of the embedding table.
+
+    Returns:
+        scipy.sparse.csr_matrix: float32 matrix of shape (documents, vocabulary).
+    """
+    indices = []
+    indptr = np.zeros(len(token_lists) + 1, dtype=np.int64)
+    weights = np.zeros(len(token_lists), dtype=np.float32)
+    lookup = key_to_index.get
+    for row, tokens in enumerate(token_lists):
+        ids = [i for i in map(lookup, tokens) if i is not None]
+        indices.extend(ids)
+        indptr[row + 1] = len(indices)
+        if tokens:
+            weights[row] = 1.0 / len(tokens)
+    data = np.repeat(weights, np.diff(indptr))
+    return scipy.sparse.csr_matrix(
+        (data, np.asarray(indices, dtype=np.int64), indptr),
+        shape=(len(token_lists), len(key_to_index)),
+    )
+
+
+def encode_documents(token_lists, table):
+    """
+    Computes the average word vector of every document with one sparse-times-dense product.
+
+    Args:
+        token_lists (list of list of str): Tokens of every document.
+        table (EmbeddingTable or gensim.models.KeyedVectors): Word vectors to average.
+
+    Returns:
+        numpy.ndarray: float32 matrix with the average vector of each document. Documents without
+        tokens get a zero vector.
+    """
+    doc_term = build_doc_term_matrix(token_lists, table.key_to_index)
+    vectors = np.asarray(table.vectors, dtype=np.float32)
+    return np.asarray(doc_term @ vectors, dtype=np.float32)
@@ -0,0 +1,579 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+
+import numpy as np
+
+from model.ann import IVFIndex
+from model.quantization import QuantizedVectors
+from model.ranking import normalize_rows
+from model.vectors import EmbeddingTable
+from utils.common import LOGGER, file_lock, file_signature
+
+
+def compute_fingerprint(db_path, vectors_path, model_config):
+    """
+    Computes the fingerprint that identifies a document index.
+
+    The fingerprint changes whenever the database, the word vectors, the model configuration
+    or the on-disk format of the index change, so a stale artifact is never reused.
+
+    Args:
+        db_path (str): Path to the database file.
+        vectors_path (str): Path to the word vectors file.
+        model_config (dict): Tokenizer and embedding settings used to build the index.
+
+    Returns:
+        str: Hexadecimal fingerprint of the index.
+    """
+    payload = {
+        "format_version": DocumentIndex.FORMAT_VERSION,
+        "database": file_signature(db_path),
+        "vectors": file_signature(vectors_path),
+        "model": model_config,
+    }
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def compute_model_fingerprint(vectors_path, model_config):
+    """
+    Computes the fingerprint of the settings of a document index, regardless of the database.
+
+    Indexes with the same model fingerprint embed a podcast with the same content into the same
+    vector, so a new index can reuse the vectors of an older one, see `DocumentIndex.find_latest`.
+
+    Args:
+        vectors_path (str): Path to the word vectors file.
+        model_config (dict): Tokenizer and embedding settings used to build the index.
+
+    Returns:
+        str: Hexadecimal fingerprint of the settings.
+    """
+    payload = {
+        "format_version": DocumentIndex.FORMAT_VERSION,
+        "vectors": file_signature(vectors_path),
+        "model": model_config,
+    }
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def content_hashes(texts, scraped_at):
+    """
+    Computes the content hash of every podcast from its text and scraping timestamp.
+
+    Args:
+        texts (list of str): Composed text of every podcast.
+        scraped_at (array-like): Scraping timestamp of every podcast.
+
+    Returns:
+        numpy.ndarray: uint64 hash of every podcast.
+    """
+    timestamps = np.asarray(scraped_at, dtype="datetime64[s]").astype(str)
+    return np.array(
+        [
+            int.from_bytes(
+                hashlib.blake2b(
+                    f"{text or ''}\0{timestamp}".encode("utf-8"), digest_size=8
+                ).digest(),
+                "little",
+            )
+            for text, timestamp in zip(texts, timestamps)
+        ],
+        dtype=np.uint64,
+    )
+
+
+def to_datetime64(values):
+    """
+    Converts a sequence of timestamps to a NumPy datetime64 array.
+
+    Args:
+        values (list): Timestamps as `datetime` objects or ISO formatted strings.
+
+    Returns:
+        numpy.ndarray: Array of dtype datetime64[s].
+    """
+    return np.array(
+        [np.datetime64(str(value)[:19].replace(" ", "T")) for value in values],
+        dtype="datetime64[s]",
+    )
+
+
+def group_rows(labels_per_row):
+    """
+    Groups the rows of a table by label, for rows that can have several labels.
+
+    The groups are stored like the inverted lists of `IVFIndex`: one array of rows sorted by
+    label plus the offset of every label in it, so the rows of a label are one contiguous slice.
+
+    Args:
+        labels_per_row (list of list of str): Labels of every row.
+
+    Returns:
+        tuple: Sorted unique labels, offset of every label in the rows plus the total count, and
+        the rows grouped by label.
+    """
+    pairs = [
+        (label, row) for row, labels in enumerate(labels_per_row) for label in labels
+    ]
+    return group_pairs([label for label, _ in pairs], [row for _, row in pairs])
+
+
+def group_pairs(labels, rows):
+    """
+    Groups rows by label from (label, row) pairs, the columnar form of `group_rows`.
+
+    Repeated pairs are kept once.
+
+    Args:
+        labels (array-like of str): Label of every pair.
+        rows (array-like of int): Row of every pair.
+
+    Returns:
+        tuple: Sorted unique labels, offset of every label in the rows plus the total count, and
+        the rows grouped by label.
+    """
+    labels = np.asarray(labels, dtype=str)
+    rows = np.asarray(rows, dtype=np.int64)
+    names, label_ids = np.unique(labels, return_inverse=True)
+    pairs = np.unique(np.stack([label_ids.astype(np.int64), rows], axis=1), axis=0)
+    counts = np.bincount(pairs[:, 0], minlength=len(names))
+    return (
+        names,
+        np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+        pairs[:, 1].astype(np.int64),
+    )
+
+
+def records_to_columns(records_dictionary):
+    """
+    Converts a records dictionary to the columns of `DocumentIndex.from_columns`.
+
+    Args:
+        records_dictionary (dict): Dictionary where keys are podcast IDs and values are dictionaries
+                                    containing 'itunes_url', 'average_rating' and 'scraped_at',
+                                    and optionally 'ratings_count', 'categories' and 'text'.
+
+    Returns:
+        dict: Columns of the podcasts, in the order of the records.
+    """
+    values = list(records_dictionary.values())
+    pairs = [
+        (category, row)
+        for row, value in enumerate(values)
+        for category in value.get("categories") or []
+    ]
+    return {
+        "podcast_ids": np.array(list(records_dictionary.keys()), dtype=str),
+        "itunes_urls": np.array([v["itunes_url"] or "" for v in values], dtype=str),
+        "average_ratings": np.array(
+            [v["average_rating"] for v in values], dtype=np.float64
+        ),
+        "scraped_at": to_datetime64([v["scraped_at"] for v in values]),
+        "ratings_counts": np.array(
+            [int(v.get("ratings_count") or 0) for v in values], dtype=np.int64
+        ),
+        "category_labels": np.array([category for category, _ in pairs], dtype=str),
+        "category_rows": np.array([row for _, row in pairs], dtype=np.int64),
+        "texts": [v.get("text") for v in values],
+    }
+
+
+class DocumentIndex:
+    """
+    A persisted, versioned artifact with the document vectors and the podcast metadata.
+
+    The index is stored in a directory named after its fingerprint, with one `.npy` file per
+    array and a `manifest.json` file. Arrays are loaded with memory mapping, so opening an
+    existing index is almost free and the data is paged in on demand. The index can also carry
+    the compact embedding table used to embed documents and queries, in an `embeddings` folder,
+    the inverted lists of an approximate search, in an `ann` folder, and the compressed document
+    vectors scored in place of `vectors`, in a `quantized` folder.
+
+    Every podcast keeps the hash of its text and scraping timestamp, so a later index built with
+    the same `model_fingerprint` can reuse the vectors of the podcasts that did not change.
+
+    The attributes used by the filters are kept as columnar arrays next to the vectors, so any
+    filter combination is a vectorized mask over the same index. The categories of the podcasts
+    are grouped with `group_rows`, so the rows of a category are a slice of `category_rows`.
+
+    Attributes:
+        vectors (numpy.ndarray): float32 matrix with the unit-normalized average vector of each podcast.
+        norms (numpy.ndarray): Norms of the average vectors before normalization.
+        podcast_ids (numpy.ndarray): Podcast IDs, one per row of `vectors`.
+        itunes_urls (numpy.ndarray): iTunes URLs, one per row of `vectors`.
+        average_ratings (numpy.ndarray): Average rating scores, one per row of `vectors`.
+        scraped_at (numpy.ndarray): Scraping timestamps, one per row of `vectors`.
+        ratings_counts (numpy.ndarray): Number of ratings, one per row of `vectors`.
+        content_hashes (numpy.ndarray): Hash of the content of every podcast, see `content_hashes`.
+        category_names (numpy.ndarray): Sorted names of the categories of the podcasts.
+        category_offsets (numpy.ndarray): Start of every category in `category_rows`, plus the total count.
+        category_rows (numpy.ndarray): Rows of the podcasts, grouped by category.
+        embeddings (Optional[EmbeddingTable]): Word vectors pruned to the corpus vocabulary.
+        ann (Optional[IVFIndex]): Inverted lists used for approximate search.
+        quantized (Optional[QuantizedVectors]): Compressed document vectors used for scoring.
+        fingerprint (str): Fingerprint of the inputs used to build the index.
+        model_fingerprint (Optional[str]): Fingerprint of the settings used to build the index,
+                                           see `compute_model_fingerprint`.
+    """
+
+    FORMAT_VERSION = 5
+    MANIFEST = "manifest.json"
+    # Lock file, scratch vectors and staging directories of a build, next to the indexes
+    BUILD_FILES = re.compile(r"\.(\w+)(\.lock|\.vectors\.npy|-\w+)$")
+    EMBEDDINGS = "embeddings"
+    ANN = "ann"
+    QUANTIZED = "quantized"
+    ARRAYS = (
+        "vectors",
+        "norms",
+        "podcast_ids",
+        "itunes_urls",
+        "average_ratings",
+        "scraped_at",
+        "ratings_counts",
+        "content_hashes",
+        "category_names",
+        "category_offsets",
+        "category_rows",
+    )
+
+    def __init__(
+        self,
+        vectors,
+        norms,
+        podcast_ids,
+        itunes_urls,
+        average_ratings,
+        scraped_at,
+        embeddings=None,
+        fingerprint=None,
+        ann=None,
+        quantized=None,
+        ratings_counts=None,
+        category_names=None,
+        category_offsets=None,
+        category_rows=None,
+        content_hashes=None,
+        model_fingerprint=None,
+    ):
+        """
+        Initializes the DocumentIndex instance.
+
+        Args:
+            vectors (numpy.ndarray): Matrix with the unit-normalized average vector of each podcast.
+            norms (numpy.ndarray): Norms of the average vectors before normalization.
+            podcast_ids (array-like): Podcast IDs.
+            itunes_urls (array-like): iTunes URLs.
+            average_ratings (array-like): Average rating scores.
+            scraped_at (array-like): Scraping timestamps.
+            embeddings (Optional[EmbeddingTable]): Word vectors pruned to the corpus vocabulary.
+            fingerprint (Optional[str]): Fingerprint of the inputs used to build the index.
+            ann (Optional[IVFIndex]): Inverted lists used for approximate search.
+            quantized (Optional[QuantizedVectors]): Compressed document vectors used for scoring.
+            ratings_counts (Optional[array-like]): Number of ratings. Zero for every podcast if None.
+            category_names (Optional[array-like]): Sorted names of the categories. None if no podcast
+                                                   has a category.
+            category_offsets (Optional[array-like]): Start of every category in `category_rows`,
+                                                     plus the total count.
+            category_rows (Optional[array-like]): Rows of the podcasts, grouped by category.
+            content_hashes (Optional[array-like]): Hash of the content of every podcast. Zero for
+                                                   every podcast if None.
+            model_fingerprint (Optional[str]): Fingerprint of the settings used to build the index.
+        """
+        if ratings_counts is None:
+            ratings_counts = np.zeros(len(podcast_ids), dtype=np.int64)
+        if content_hashes is None:
+            content_hashes = np.zeros(len(podcast_ids), dtype=np.uint64)
+        if category_names is None:
+            category_names, category_offsets, category_rows = group_rows([])
+        self.vectors = vectors
+        self.norms = norms
+        self.podcast_ids = podcast_ids
+        self.itunes_urls = itunes_urls
+        self.average_ratings = average_ratings
+        self.scraped_at = scraped_at
+        self.ratings_counts = ratings_counts
+        self.category_names = category_names
+        self.category_offsets = category_offsets
+        self.category_rows = category_rows
+        self.content_hashes = content_hashes
+        self.embeddings = embeddings
+        self.fingerprint = fingerprint
+        self.model_fingerprint = model_fingerprint
+        self.ann = ann
+        self.quantized = quantized
+
+    def __len__(self):
+        return len(self.podcast_ids)
+
+    @classmethod
+    def from_records(
+        cls, vectors, records_dictionary, fingerprint=None, embeddings=None
+    ):
+        """
+        Creates an index from the average vectors of the podcasts and their records.
+
+        The average vectors are normalized to unit length, so ranking only needs a dot product.
+
+        Args:
+            vectors (numpy.ndarray): Average vector of every podcast, in the order of the records.
+            records_dictionary (dict): Dictionary where keys are podcast IDs and values are dictionaries
+                                        containing 'itunes_url', 'average_rating' and 'scraped_at',
+                                        and optionally 'ratings_count' and 'categories'.
+            fingerprint (Optional[str]): Fingerprint of the inputs used to build the vectors.
+            embeddings (Optional[EmbeddingTable]): Word vectors pruned to the corpus vocabulary.
+
+        Returns:
+            DocumentIndex: The new index.
+        """
+        return cls.from_columns(
+            vectors, records_to_columns(records_dictionary), fingerprint, embeddings
+        )
+
+    @classmethod
+    def from_columns(
+        cls, vectors, columns, fingerprint=None, embeddings=None, norms=None
+    ):
+        """
+        Creates an index from the average vectors of the podcasts and their columns.
+
+        The average vectors are normalized to unit length, so ranking only needs a dot product.
+        Vectors that are already normalized are kept as they are when their `norms` are given.
+        The content hashes are computed from the 'texts' unless the columns have them.
+
+        Args:
+            vectors (numpy.ndarray): Average vector of every podcast, in the order of the columns.
+            columns (dict): Arrays with one value per podcast, 'podcast_ids', 'itunes_urls',
+                            'average_ratings', 'scraped_at' and 'ratings_counts', and the
+                            categories as pairs of 'category_labels' and 'category_rows', and
+                            either the 'texts' or their 'content_hashes'.
+            fingerprint (Optional[str]): Fingerprint of the inputs used to build the vectors.
+            embeddings (Optional[EmbeddingTable]): Word vectors pruned to the corpus vocabulary.
+            norms (Optional[numpy.ndarray]): Original norms of already normalized vectors.
+
+        Returns:
+            DocumentIndex: The new index.
+        """
+        if norms is None:
+            vectors, norms = normalize_rows(vectors)
+        hashes = columns.get("content_hashes")
+        if hashes is None:
+            hashes = content_hashes(columns["texts"], columns["scraped_at"])
+        category_names, category_offsets, category_rows = group_pairs(
+            columns["category_labels"], columns["category_rows"]
+        )
+        return cls(
+            vectors=vectors,
+            norms=norms,
+            podcast_ids=np.asarray(columns["podcast_ids"], dtype=str),
+            itunes_urls=np.asarray(columns["itunes_urls"], dtype=str),
+            average_ratings=np.asarray(columns["average_ratings"], dtype=np.float64),
+            scraped_at=np.asarray(columns["scraped_at"], dtype="datetime64[s]"),
+            ratings_counts=np.asarray(columns["ratings_counts"], dtype=np.int64),
+            category_names=category_names,
+            category_offsets=category_offsets,
+            category_rows=category_rows,
+            content_hashes=np.asarray(hashes, dtype=np.uint64),
+            embeddings=embeddings,
+            fingerprint=fingerprint,
+        )
+
+    def category_mask(self, categories):
+        """
+        Builds the boolean mask of the podcasts in any of the given categories.
+
+        Every category is found with a binary search in the sorted names, and its rows are one
+        slice of `category_rows`.
+
+        Args:
+            categories (list of str): Names of the categories.
+
+        Returns:
+            numpy.ndarray: Mask over the rows of the index.
+        """
+        mask = np.zeros(len(self), dtype=bool)
+        names = self.category_names
+        for category in categories:
+            position = int(np.searchsorted(names, category))
+            if position < len(names) and names[position] == category:
+                start, end = self.category_offsets[position : position + 2]
+                mask[self.category_rows[start:end]] = True
+        return mask
+
+    def save(self, index_path):
+        """
+        Writes the index to `index_path/<fingerprint>`.
+
+        The arrays are written to a temporary directory that is renamed into place at the end,
+        so a reader never sees a partially written index.
+
+        Args:
+            index_path (str): Directory where the indexes are stored.
+
+        Returns:
+            str: Directory of the saved index.
+        """
+        os.makedirs(index_path, exist_ok=True)
+        target = os.path.join(index_path, self.fingerprint)
+        staging = tempfile.mkdtemp(prefix=f".{self.fingerprint}-", dir=index_path)
+        try:
+            for name in self.ARRAYS:
+                np.save(
+                    os.path.join(staging, f"{name}.npy"),
+                    np.asarray(getattr(self, name)),
+                    allow_pickle=False,
+                )
+            if self.embeddings is not None:
+                self.embeddings.save(os.path.join(staging, self.EMBEDDINGS))
+            if self.ann is not None:
+                self.ann.save(os.path.join(staging, self.ANN))
+            if self.quantized is not None:
+                self.quantized.save(os.path.join(staging, self.QUANTIZED))
+            manifest = {
+                "format_version": self.FORMAT_VERSION,
+                "fingerprint": self.fingerprint,
+                "count": len(self),
+                "dimension": int(self.vectors.shape[1]),
+                "model_fingerprint": self.model_fingerprint,
+            }
+            with open(os.path.join(staging, self.MANIFEST), "w") as fh:
+                json.dump(manifest, fh, indent=4)
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            os.rename(staging, target)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        LOGGER.info(f"Document index with {len(self)} podcasts saved to {target}")
+        return target
+
+    @classmethod
+    def load(cls, index_path, fingerprint, mmap=True):
+        """
+        Loads the index identified by `fingerprint` from `index_path`.
+
+        Args:
+            index_path (str): Directory where the indexes are stored.
+            fingerprint (str): Fingerprint of the index to load.
+            mmap (bool): Whether to memory map the arrays instead of reading them into memory.
+
+        Returns:
+            Optional[DocumentIndex]: The loaded index, or None if there is no valid index for
+            the fingerprint.
+        """
+        directory = os.path.join(index_path, fingerprint)
+        manifest_path = os.path.join(directory, cls.MANIFEST)
+        if not os.path.isfile(manifest_path):
+            return None
+        with open(manifest_path) as fh:
+            manifest = json.load(fh)
+        if manifest.get("format_version") != cls.FORMAT_VERSION:
+            LOGGER.info(f"Ignoring index {directory} with an outdated format")
+            return None
+        arrays = {
+            name: np.load(
+                os.path.join(directory, f"{name}.npy"),
+                mmap_mode="r" if mmap else None,
+                allow_pickle=False,
+            )
+            for name in cls.ARRAYS
+        }
+        embeddings_path = os.path.join(directory, cls.EMBEDDINGS)
+        if EmbeddingTable.exists(embeddings_path):
+            arrays["embeddings"] = EmbeddingTable.load(embeddings_path, mmap=mmap)
+        ann_path = os.path.join(directory, cls.ANN)
+        if IVFIndex.exists(ann_path):
+            arrays["ann"] = IVFIndex.load(ann_path, mmap=mmap)
+        quantized_path = os.path.join(directory, cls.QUANTIZED)
+        if QuantizedVectors.exists(quantized_path):
+            arrays["quantized"] = QuantizedVectors.load(quantized_path, mmap=mmap)
+        LOGGER.info(
+            f"Document index with {manifest['count']} podcasts loaded from {directory}"
+        )
+        return cls(
+            fingerprint=fingerprint,
+            model_fingerprint=manifest.get("model_fingerprint"),
+            **arrays,
+        )
+
+    @classmethod
+    def find_latest(cls, index_path, model_fingerprint, exclude=None):
+        """
+        Loads the most recently saved index built with the given settings.
+
+        Args:
+            index_path (str): Directory where the indexes are stored.
+            model_fingerprint (str): Fingerprint of the settings, see `compute_model_fingerprint`.
+            exclude (Optional[str]): Fingerprint of an index to skip.
+
+        Returns:
+            Optional[DocumentIndex]: The memory mapped index, or None if there is none.
+        """
+        candidates = []
+        if os.path.isdir(index_path):
+            for name in os.listdir(index_path):
+                manifest_path = os.path.join(index_path, name, cls.MANIFEST)
+                if name == exclude or not os.path.isfile(manifest_path):
+                    continue
+                with open(manifest_path) as fh:
+                    manifest = json.load(fh)
+                if (
+                    manifest.get("format_version") == cls.FORMAT_VERSION
+                    and manifest.get("model_fingerprint") == model_fingerprint
+                ):
+                    candidates.append((os.path.getmtime(manifest_path), name))
+        if not candidates:
+            return None
+        return cls.load(index_path, max(candidates)[1])
+
+    @classmethod
+    def prune(cls, index_path, keep):
+        """
+        Removes the saved indexes and the build files of every fingerprint not in `keep`.
+
+        The build files are the lock file, the scratch vectors and the staging directories left
+        next to the indexes. The files of a fingerprint, its lock file included, are only removed
+        while holding its lock without waiting for it, so an index another process is building is
+        left alone, and `file_lock` lets a process waiting on a removed lock file lock the path
+        again.
+
+        Args:
+            index_path (str): Directory where the indexes are stored.
+            keep (iterable of str): Fingerprints of the indexes to keep.
+
+        Returns:
+            list of str: Fingerprints of the removed indexes.
+        """
+        paths = {}
+        if os.path.isdir(index_path):
+            for name in os.listdir(index_path):
+                match = cls.BUILD_FILES.match(name)
+                if match is not None:
+                    paths.setdefault(match.group(1), []).append(name)
+                elif os.path.isfile(os.path.join(index_path, name, cls.MANIFEST)):
+                    paths.setdefault(name, []).append(name)
+        removed = []
+        for fingerprint in sorted(set(paths) - set(keep)):
+            lock_path = os.path.join(index_path, f".{fingerprint}.lock")
+            with file_lock(lock_path, blocking=False) as locked:
+                if not locked:
+                    continue
+                for name in paths[fingerprint]:
+                    path = os.path.join(index_path, name)
+                    if os.path.isdir(path):
+                        shutil.rmtree(path)
+                    elif path != lock_path:
+                        os.remove(path)
+                # Removed while locked, so a process waiting on it locks a new file instead
+                os.remove(lock_path)
+            if fingerprint in paths[fingerprint]:
+                removed.append(fingerprint)
+        if removed:
+            LOGGER.info(f"Removed the superseded indexes {', '.join(removed)}")
+        return removed
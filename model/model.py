@@ -1,11 +1,52 @@
-import re
+import threading
 
 import gensim
 import nltk
 import numpy as np
-import scipy
 
-from utils.common import LOGGER
+from model.ann import IVFIndex, IVFRanker
+from model.encoding import encode_documents
+from model.index import DocumentIndex, content_hashes, records_to_columns
+from model.parallel import (
+    create_encoding_pool,
+    encode_batch_parallel,
+    encode_documents_parallel,
+)
+from model.quantization import ProductQuantizer, ScalarQuantizer
+from model.ranking import MatrixRanker, normalize_rows
+from model.tokenizer import Tokenizer
+from model.vectors import EmbeddingTable
+from utils.cache import LRUCache
+from utils.common import LOGGER, file_signature
+
+
+def _per_query(value, count, name, sequence=False):
+    """
+    Expands a search setting to one value per query of a batch.
+
+    Args:
+        value: One value shared by every query, or a list or tuple with one value per query.
+        count (int): Number of queries of the batch.
+        name (str): Name of the setting, for the error message.
+        sequence (bool): Whether one value of the setting is itself a list, in which case only a
+                         non-empty list of lists or None values has one value per query.
+
+    Returns:
+        list: One value per query.
+
+    Raises:
+        ValueError: If a list does not have one value per query.
+    """
+    per_query = isinstance(value, (list, tuple))
+    if per_query and sequence:
+        per_query = bool(value) and all(
+            v is None or isinstance(v, (list, tuple)) for v in value
+        )
+    if not per_query:
+        return [value] * count
+    if len(value) != count:
+        raise ValueError(f"{name} must have one value per query ({count})")
+    return list(value)
 
 
 class RetrievalModel:
@@ -15,150 +56,627 @@ class RetrievalModel:
     This class loads pre-trained word vectors, processes text data, and computes similarity
     between query vectors and document vectors for ranking purposes.
 
+    When a document index is built, the rows of the word vectors used by the corpus, plus the
+    `query_vocab_size` most frequent words for query-only terms, are extracted into a compact
+    embedding table stored with the index. Loading an index uses that table for both documents
+    and queries, so the full vectors are not kept in memory. A query word outside the pruned
+    table falls back to the full native table (see `manage.py convert-vectors`), which is
+    memory mapped on first use; without a native table, or with `query_fallback` disabled,
+    the word is treated as out of vocabulary.
+
+    With the "ivf" `search_mode`, the index also carries inverted lists of the document vectors
+    and queries only scan the `ann_nprobe` closest lists; the exact scan stays available with
+    `rankings(..., exact=True)` to compare both. With a `quantization` mode, the document
+    vectors are also stored compressed, as int8 or product-quantized codes, and queries are
+    scored against the codes.
+
     Attributes:
-        model (gensim.models.KeyedVectors): Pre-trained word vectors model.
+        model (EmbeddingTable or gensim.models.KeyedVectors): Pre-trained word vectors model.
         vectors_path (str): Path to the word vectors file.
-        stopword_list (list): List of English stopwords.
-        vectors_dict (dict): Dictionary of podcast vectors and metadata.
+        native_vectors_path (str): Directory of the word vectors converted to the native format.
+        query_vocab_size (int): Number of most frequent words kept in the pruned table for queries.
+        query_fallback (bool): Whether query words outside the pruned table use the full table.
+        fallback_model (Optional[EmbeddingTable]): Full native table used for the fallback.
+        corpus_vocabulary (set): Words of the cleaned corpus, collected while building the index.
+        workers (int): Number of processes used to build the index.
+        shard_size (int): Number of podcasts per shard when building the index with several processes.
+        tokenizer (Tokenizer): Tokenizer shared by documents and queries.
+        index (DocumentIndex): Document index being ranked.
+        ranker (MatrixRanker): Ranking engine over the document index.
+        query_cache (LRUCache): Query vectors by normalized query.
+        search_mode (str): "exact" to score every podcast, "ivf" for the approximate search.
+        ann_lists (Optional[int]): Number of inverted lists of the approximate search.
+        ann_nprobe (int): Number of inverted lists scanned per query.
+        exact_ranker (MatrixRanker): Exact ranking engine, used for comparison in "ivf" mode.
+        quantization (Optional[str]): None for float32 vectors, "int8" or "pq" for compressed ones.
+        pq_subvectors (int): Number of groups of dimensions of the product quantizer.
     """
 
-    def __init__(self, vectors_path):
+    # Settings that change the produced vectors; part of the document index fingerprint
+    TOKENIZER_CONFIG = {
+        "tokenizer": Tokenizer.VERSION,
+        "stopwords": "english",
+        "vectors_limit": 500000,
+    }
+    SEARCH_MODES = ("exact", "ivf")
+    QUANTIZERS = {"int8": ScalarQuantizer, "pq": ProductQuantizer}
+
+    def __init__(
+        self,
+        vectors_path,
+        query_vocab_size=20000,
+        query_fallback=True,
+        workers=1,
+        shard_size=5000,
+        query_cache_size=4096,
+        search_mode="exact",
+        ann_lists=None,
+        ann_nprobe=8,
+        quantization=None,
+        pq_subvectors=50,
+    ):
         """
         Initializes the RetrievalModel instance.
 
         Args:
             vectors_path (str): Directory path where the word vectors file is located.
+            query_vocab_size (int): Number of most frequent words kept in the pruned table for
+                                    query-only words.
+            query_fallback (bool): Whether query words outside the pruned table are looked up in
+                                   the full native table.
+            workers (int): Number of processes used to build the index. Parallel builds need the
+                           vectors converted to the native format.
+            shard_size (int): Number of podcasts per shard when building the index with several processes.
+            query_cache_size (int): Number of query vectors kept in the LRU cache; 0 disables it.
+            search_mode (str): "exact" to score every podcast, "ivf" for the approximate search.
+            ann_lists (Optional[int]): Number of inverted lists of the approximate search.
+                                       Defaults to the square root of the number of podcasts.
+            ann_nprobe (int): Number of inverted lists scanned per query.
+            quantization (Optional[str]): None for float32 vectors, "int8" or "pq" for compressed ones.
+            pq_subvectors (int): Number of groups of dimensions of the product quantizer; must
+                                 divide the dimension of the vectors.
         """
+        if search_mode not in self.SEARCH_MODES:
+            raise ValueError(f"search_mode must be one of {self.SEARCH_MODES}")
+        if quantization is not None and quantization not in self.QUANTIZERS:
+            raise ValueError(
+                f"quantization must be None or one of {tuple(self.QUANTIZERS)}"
+            )
         self.model = None
+        self.tokenizer = None
+        self.query_vocab_size = query_vocab_size
+        self.query_fallback = query_fallback
+        self.fallback_model = None
+        self._fallback_loaded = False
+        self._fallback_lock = threading.Lock()
+        self.corpus_vocabulary = set()
+        self.workers = workers
+        self.shard_size = shard_size
+        self.index = None
+        self.ranker = None
+        self.exact_ranker = None
+        self.search_mode = search_mode
+        self.ann_lists = ann_lists
+        self.ann_nprobe = ann_nprobe
+        self.quantization = quantization
+        self.pq_subvectors = pq_subvectors
+        self.query_cache = LRUCache(query_cache_size)
         self.vectors_path = vectors_path + "/GoogleNews-vectors-negative300.bin.gz"
+        self.native_vectors_path = vectors_path + "/GoogleNews-vectors-negative300"
         nltk.download("stopwords")
-        nltk.download("punkt")
 
-    def _create_stopwords(self):
+    def _create_tokenizer(self):
         """
-        Creates a list of English stopwords and logs the creation.
+        Creates the tokenizer with the English list of stopwords and logs the creation.
         """
-        self.stopword_list = nltk.corpus.stopwords.words("english")
-        LOGGER.info("English list of stopwords created")
+        self.tokenizer = Tokenizer(nltk.corpus.stopwords.words("english"))
+        LOGGER.info("Tokenizer with the English list of stopwords created")
+
+    def _native_vectors_available(self):
+        """
+        Checks whether the word vectors have been converted to the native format.
+
+        A converted table is ignored if it was converted with a word limit other than
+        `TOKENIZER_CONFIG["vectors_limit"]`, or if the original vectors file has changed since
+        the conversion.
+
+        Returns:
+            bool: True if the native table can be used.
+        """
+        if not EmbeddingTable.exists(self.native_vectors_path):
+            return False
+        manifest = EmbeddingTable.load_manifest(self.native_vectors_path)
+        limit = self.TOKENIZER_CONFIG["vectors_limit"]
+        if manifest.get("limit") != limit:
+            LOGGER.warning(
+                f"Native vectors in {self.native_vectors_path} were converted with limit "
+                f"{manifest.get('limit')} instead of {limit}; run `manage.py convert-vectors` "
+                "again to use them"
+            )
+            return False
+        source = file_signature(self.vectors_path)
+        if source is None:
+            return True
+        return manifest["source"] == source
 
     def _load_vectors(self):
         """
-        Loads the word vectors model from the specified path and logs the action.
+        Loads the word vectors model and logs the action.
+
+        The native table is memory mapped when it exists; otherwise the original word2vec file
+        is decompressed and parsed, which is much slower (see `manage.py convert-vectors`).
+        The full vectors need no fallback table.
         """
+        self.fallback_model = None
+        self._fallback_loaded = True
+        self.query_cache.clear()
+        if self._native_vectors_available():
+            self.model = EmbeddingTable.load(self.native_vectors_path)
+            return
+        LOGGER.info(
+            "Native vectors not found, run `python manage.py convert-vectors` to speed up loading"
+        )
         self.model = gensim.models.KeyedVectors.load_word2vec_format(
-            self.vectors_path, binary=True, limit=500000
+            self.vectors_path,
+            binary=True,
+            limit=self.TOKENIZER_CONFIG["vectors_limit"],
         )
         LOGGER.info(f"Vectors loaded from {self.vectors_path}")
 
-    def _data_clean(self, text):
+    def _embeddings(self, word):
         """
-        Cleans and processes the input text.
+        Retrieves the word embedding vector for a given word.
 
         Args:
-            text (list of str): List of words or tokens to be cleaned.
-
-        Returns:
-            str: Cleaned and filtered text with stopwords removed.
-        """
-        for index, word in enumerate(text):
-            if "-" in word:
-                word = word.replace("-", " ")
-                word = word.split()
-                text[index] = word
-        flattened_list = []
-        for item in text:
-            if isinstance(item, list):
-                flattened_list.extend(item)
-            else:
-                flattened_list.append(item)
-        pattern = r"[^a-zA-Z0-9\s]"
-        flattened_list = re.sub(pattern, "", " ".join(flattened_list))
-        tokens = [token.strip() for token in flattened_list.split()]
-        filtered = [
-            token for token in tokens if token.lower() not in self.stopword_list
-        ]
-        filtered = " ".join(filtered)
-        return filtered
+            word (str): The word for which the embedding vector is retrieved.
+
+        Returns:
+            numpy.ndarray: Word embedding vector. Returns a zero vector if the word is neither in the
+                           model nor in the fallback table.
+        """
+        if word in self.model.key_to_index:
+            return self.model.get_vector(word)
+        fallback_model = self._get_fallback_model()
+        if fallback_model is not None and word in fallback_model.key_to_index:
+            return fallback_model.get_vector(word)
+        return np.zeros(300)
+
+    def _get_fallback_model(self):
+        """
+        Returns the full native table used for words outside the pruned table.
+
+        The table is memory mapped the first time it is needed, under a lock, and it is only
+        marked as loaded once it is assigned, so concurrent queries never see a missing table
+        and cache the fallback words as out of vocabulary.
+
+        Returns:
+            Optional[EmbeddingTable]: The full table, or None if the fallback is not available.
+        """
+        if not self._fallback_loaded:
+            with self._fallback_lock:
+                if not self._fallback_loaded:
+                    if self.query_fallback and self._native_vectors_available():
+                        self.fallback_model = EmbeddingTable.load(
+                            self.native_vectors_path
+                        )
+                    self._fallback_loaded = True
+        return self.fallback_model
 
-    def _tokenize_text(self, text):
+    def index_config(self):
         """
-        Tokenizes and cleans the input text.
+        Returns the settings that change the content of a document index.
+
+        Returns:
+            dict: Tokenizer and embedding settings, part of the index fingerprint.
+        """
+        config = dict(self.TOKENIZER_CONFIG, query_vocab_size=self.query_vocab_size)
+        if self.search_mode == "ivf":
+            config["ann"] = {"type": "ivf", "n_lists": self.ann_lists}
+        if self.quantization == "int8":
+            config["quantization"] = {"type": "int8"}
+        elif self.quantization == "pq":
+            config["quantization"] = {"type": "pq", "n_subvectors": self.pq_subvectors}
+        return config
+
+    def _build_quantized(self, vectors):
+        """
+        Compresses the document vectors with the configured quantization.
 
         Args:
-            text (str): Input text to be tokenized and cleaned.
+            vectors (numpy.ndarray): Matrix with the unit-normalized vector of every podcast.
 
         Returns:
-            str: Cleaned and tokenized text.
+            QuantizedVectors: The compressed document vectors.
         """
-        return self._data_clean(nltk.word_tokenize(text))
+        if self.quantization == "pq":
+            return ProductQuantizer.build(vectors, self.pq_subvectors)
+        return ScalarQuantizer.build(vectors)
 
-    def _embeddings(self, word):
+    def _prune_vectors(self, words=()):
         """
-        Retrieves the word embedding vector for a given word.
+        Extracts the rows of the word vectors used by the corpus into a compact table.
+
+        The `query_vocab_size` most frequent words of the model are kept as well, so that common
+        query words missing from the corpus still have a vector.
 
         Args:
-            word (str): The word for which the embedding vector is retrieved.
+            words (iterable of str): Other words to keep, like the words of an older index whose
+                                     document vectors are reused.
 
         Returns:
-            numpy.ndarray: Word embedding vector. Returns a zero vector if the word is not in the model.
+            EmbeddingTable: The pruned table.
         """
-        if word in self.model.key_to_index:
-            return self.model.get_vector(word)
-        else:
+        key_to_index = self.model.key_to_index
+        rows = {key_to_index[w] for w in self.corpus_vocabulary if w in key_to_index}
+        rows.update(key_to_index[w] for w in words if w in key_to_index)
+        rows.update(range(min(self.query_vocab_size, len(self.model.index_to_key))))
+        table = EmbeddingTable.from_rows(self.model, sorted(rows))
+        LOGGER.info(
+            f"Pruned word vectors from {len(self.model.index_to_key)} to {len(table)} words"
+        )
+        return table
+
+    def _average_embedding(self, words):
+        """
+        Computes the average embedding of a list of words.
+
+        Args:
+            words (list of str): Words to average. Out of vocabulary words count as zero vectors.
+
+        Returns:
+            numpy.ndarray: Average vector, or a zero vector if there are no words.
+        """
+        if not words:
             return np.zeros(300)
+        return np.mean(
+            np.array([self._embeddings(x) for x in words], dtype=float), axis=0
+        )
 
-    def compute_vectors_dict(self, records_dictionary):
+    def build_index(self, records_dictionary, fingerprint):
         """
-        Computes the average vector representation for each podcast in the records dictionary.
+        Builds a document index from a records dictionary, see `build_index_from_columns`.
 
         Args:
             records_dictionary (dict): Dictionary where keys are podcast IDs and values are dictionaries
-                                        containing 'itunes_url', 'average_rating', and 'text'.
+                                        containing 'itunes_url', 'average_rating', 'scraped_at' and 'text'.
+            fingerprint (str): Fingerprint of the inputs used to build the index.
+
+        Returns:
+            DocumentIndex: The new document index.
+        """
+        return self.build_index_from_columns(
+            records_to_columns(records_dictionary), fingerprint
+        )
+
+    def build_index_from_columns(self, columns, fingerprint):
+        """
+        Computes the average vector representation of every podcast and packs it into a document index.
+
+        All texts are tokenized first, then the word vectors are pruned to the corpus vocabulary
+        and every average is computed at once as a sparse document-term matrix times the pruned
+        embedding table. With several `workers` and the vectors converted to the native format,
+        the texts are instead sharded across a process pool that writes to a shared output matrix;
+        the vectors are identical to the serial path.
+
+        Args:
+            columns (dict): Columns of the podcasts with their 'texts', as accepted by
+                            `DocumentIndex.from_columns`.
+            fingerprint (str): Fingerprint of the inputs used to build the index.
+
+        Returns:
+            DocumentIndex: Index with the document vectors, podcast metadata and pruned word vectors,
+            plus the inverted lists in "ivf" mode and the compressed vectors with a quantization.
+        """
+        self._create_tokenizer()
+        self._load_vectors()
+        texts = columns["texts"]
+        if self.workers > 1 and isinstance(self.model, EmbeddingTable):
+            vectors, self.corpus_vocabulary = encode_documents_parallel(
+                texts,
+                self.tokenizer.tokenize,
+                self.native_vectors_path,
+                self.workers,
+                self.shard_size,
+            )
+            embeddings = self._prune_vectors()
+        else:
+            if self.workers > 1:
+                LOGGER.info(
+                    "Parallel build needs the native vectors, building with a single process"
+                )
+            token_lists = self.tokenizer.tokenize_batch(texts)
+            self.corpus_vocabulary = set().union(*token_lists)
+            embeddings = self._prune_vectors()
+            vectors = encode_documents(token_lists, embeddings)
+        LOGGER.info(f"Document vectors computed with a total len of {len(vectors)}")
+        index = DocumentIndex.from_columns(
+            vectors, columns, fingerprint, embeddings=embeddings
+        )
+        return self._build_search_structures(index)
 
-        Updates:
-            self.vectors_dict: Dictionary with podcast IDs as keys and vectors and metadata as values.
+    def build_index_from_batches(
+        self, batches, count, fingerprint, vectors_path, base=None
+    ):
         """
-        self._create_stopwords()
+        Builds a document index from batches of podcasts, with memory bounded by the batch size.
+
+        Every batch is tokenized and encoded against the full word vectors as soon as it arrives,
+        and its normalized vectors are written to a memory mapped `.npy` file at `vectors_path`;
+        only its vocabulary and metadata columns are kept. The word vectors are pruned once all
+        batches are encoded. The pruned table keeps the order of the rows, so the vectors are
+        identical to `build_index_from_columns`. With several `workers` and the native vectors,
+        one process pool encodes all the batches and writes straight into the file.
+
+        With a `base` index built with the same settings, only the podcasts that are new or whose
+        content hash changed are tokenized and encoded; the others copy their vector from the
+        base, and the pruned word vectors keep the words of the base as well. The few changed
+        podcasts are encoded in this process.
+
+        Args:
+            batches (iterable of dict): Columns of the podcasts of every batch with their 'texts',
+                                        as accepted by `DocumentIndex.from_columns`, with
+                                        'category_rows' relative to the batch.
+            count (int): Total number of podcasts of the batches.
+            fingerprint (str): Fingerprint of the inputs used to build the index.
+            vectors_path (str): Path of the file the document vectors are written to, which the
+                                index memory maps until it is saved.
+            base (Optional[DocumentIndex]): Older index whose document vectors are reused.
+
+        Returns:
+            DocumentIndex: Index like the one of `build_index_from_columns`.
+
+        Raises:
+            ValueError: If the batches do not have `count` podcasts in total.
+        """
+        self._create_tokenizer()
         self._load_vectors()
-        vectors_dict = {}
-        for podcast_id, value in records_dictionary.items():
-            average_vector = np.mean(
-                np.array(
-                    [
-                        self._embeddings(x)
-                        for x in self._tokenize_text(value["text"]).split()
-                    ]
-                ),
-                axis=0,
+        dimension = self.model.vectors.shape[1]
+        if count == 0:
+            output = np.zeros((0, dimension), dtype=np.float32)
+        else:
+            output = np.lib.format.open_memmap(
+                vectors_path, mode="w+", dtype=np.float32, shape=(count, dimension)
+            )
+        parallel = self.workers > 1 and isinstance(self.model, EmbeddingTable)
+        if self.workers > 1 and not parallel:
+            LOGGER.info(
+                "Parallel build needs the native vectors, building with a single process"
+            )
+        if base is not None and len(base) > 0:
+            base_order = np.argsort(base.podcast_ids)
+            base_ids = np.asarray(base.podcast_ids)[base_order]
+        else:
+            base = None
+        pool = None
+        if parallel and count and base is None:
+            pool = create_encoding_pool(
+                self.tokenizer.tokenize,
+                self.native_vectors_path,
+                vectors_path,
+                self.workers,
             )
-            output = {
-                podcast_id: {
-                    "itunes_url": value["itunes_url"],
-                    "average_rating": value["average_rating"],
-                    "average_vector": (average_vector),
+        self.corpus_vocabulary = set()
+        parts, norms = [], []
+        start = reused_count = 0
+        try:
+            for batch in batches:
+                texts = batch["texts"]
+                end = start + len(texts)
+                if end > count:
+                    raise ValueError(f"The batches have more than {count} podcasts")
+                hashes = content_hashes(texts, batch["scraped_at"])
+                reused = np.zeros(len(texts), dtype=bool)
+                if base is not None:
+                    ids = np.asarray(batch["podcast_ids"], dtype=str)
+                    positions = np.minimum(
+                        np.searchsorted(base_ids, ids), len(base_ids) - 1
+                    )
+                    base_rows = base_order[positions]
+                    reused = (base_ids[positions] == ids) & (
+                        base.content_hashes[base_rows] == hashes
+                    )
+                if pool is not None:
+                    self.corpus_vocabulary.update(
+                        encode_batch_parallel(pool, texts, start, self.shard_size)
+                    )
+                    output[start:end], batch_norms = normalize_rows(output[start:end])
+                else:
+                    changed = np.flatnonzero(~reused)
+                    token_lists = self.tokenizer.tokenize_batch(
+                        [texts[row] for row in changed]
+                    )
+                    self.corpus_vocabulary.update(*token_lists)
+                    batch_vectors = np.empty((len(texts), dimension), dtype=np.float32)
+                    batch_norms = np.empty(len(texts), dtype=np.float32)
+                    batch_vectors[changed], batch_norms[changed] = normalize_rows(
+                        encode_documents(token_lists, self.model)
+                    )
+                    if reused.any():
+                        batch_vectors[reused] = base.vectors[base_rows[reused]]
+                        batch_norms[reused] = base.norms[base_rows[reused]]
+                    output[start:end] = batch_vectors
+                norms.append(batch_norms)
+                part = {
+                    name: values for name, values in batch.items() if name != "texts"
                 }
+                part["category_rows"] = np.asarray(batch["category_rows"]) + start
+                part["content_hashes"] = hashes
+                parts.append(part)
+                reused_count += int(reused.sum())
+                start = end
+                LOGGER.info(f"Encoded {end}/{count} documents")
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        if start != count:
+            raise ValueError(f"The batches have {start} podcasts instead of {count}")
+        if count:
+            output.flush()
+        if parts:
+            columns = {
+                name: np.concatenate([part[name] for part in parts])
+                for name in parts[0]
             }
-            vectors_dict.update(output)
-        self.vectors_dict = vectors_dict
+        else:
+            columns = records_to_columns({})
+        base_words = ()
+        if base is not None and base.embeddings is not None:
+            base_words = base.embeddings.index_to_key
+        embeddings = self._prune_vectors(base_words)
+        LOGGER.info(f"Document vectors computed with a total len of {count}")
+        if base is not None:
+            LOGGER.info(
+                f"Reused {reused_count} document vectors of index {base.fingerprint}, "
+                f"encoded {count - reused_count}"
+            )
+        index = DocumentIndex.from_columns(
+            output,
+            columns,
+            fingerprint,
+            embeddings=embeddings,
+            norms=np.concatenate(norms) if norms else np.zeros(0, dtype=np.float32),
+        )
+        return self._build_search_structures(index)
+
+    def _build_search_structures(self, index):
+        """
+        Adds the inverted lists in "ivf" mode and the compressed vectors with a quantization.
+
+        Args:
+            index (DocumentIndex): Index with the normalized document vectors.
+
+        Returns:
+            DocumentIndex: The same index.
+        """
+        if self.search_mode == "ivf":
+            index.ann = IVFIndex.build(index.vectors, self.ann_lists)
+        if self.quantization is not None:
+            index.quantized = self._build_quantized(index.vectors)
+        return index
+
+    def load_index(self, index):
+        """
+        Prepares the model to rank the podcasts of a document index.
+
+        Queries are embedded with the pruned word vectors of the index when it has them, and the
+        full word vectors are loaded only otherwise; documents are never re-embedded.
+
+        Args:
+            index (DocumentIndex): The document index to rank.
+        """
+        if self.tokenizer is None:
+            self._create_tokenizer()
+        if index.embeddings is not None:
+            self.model = index.embeddings
+            self.fallback_model = None
+            self._fallback_loaded = False
+            self.query_cache.clear()
+        elif self.model is None:
+            self._load_vectors()
+        if self.search_mode == "ivf" and index.ann is None:
+            LOGGER.info("Index without inverted lists, building them in memory")
+            index.ann = IVFIndex.build(index.vectors, self.ann_lists)
+        if self.quantization is not None and index.quantized is None:
+            LOGGER.info("Index without quantized vectors, building them in memory")
+            index.quantized = self._build_quantized(index.vectors)
+        self.index = index
+        self.exact_ranker = MatrixRanker(index)
+        if self.search_mode == "ivf":
+            self.ranker = IVFRanker(index, index.ann, self.ann_nprobe)
+        else:
+            self.ranker = self.exact_ranker
         LOGGER.info(
-            f"Internal vectors dictionary created with a total len of {len(self.vectors_dict)}"
+            f"Ranking engine loaded from index {index.fingerprint} with a total len of {len(index)}"
         )
 
-    def _get_similarity(self, query_embedding, average_vec):
+    def _filter_mask(
+        self,
+        min_score,
+        max_score,
+        min_date,
+        max_date,
+        min_ratings_count=None,
+        categories=None,
+    ):
         """
-        Computes the cosine similarity between the query embedding and a document vector.
+        Builds the boolean mask of the podcasts that satisfy the filters.
+
+        Every filter is answered from the columnar attributes of the index: the rating, date and
+        ratings count filters are vectorized comparisons and the category filter reads the rows
+        of every category from the grouped category rows.
+
+        Args:
+            min_score (Optional[float]): Minimum average rating.
+            max_score (Optional[float]): Maximum average rating.
+            min_date (Optional[str]): Minimum scraping date.
+            max_date (Optional[str]): Maximum scraping date.
+            min_ratings_count (Optional[int]): Minimum number of ratings.
+            categories (Optional[list of str]): Categories; a podcast matches any of them. No
+                                                filter if empty.
+
+        Returns:
+            Optional[numpy.ndarray]: Mask over the rows of the index, or None if no filter is set.
+        """
+        if (
+            min_score is None
+            and max_score is None
+            and min_date is None
+            and max_date is None
+            and min_ratings_count is None
+            and not categories
+        ):
+            return None
+        mask = np.ones(len(self.index), dtype=bool)
+        if min_score is not None:
+            mask &= self.index.average_ratings >= min_score
+        if max_score is not None:
+            mask &= self.index.average_ratings <= max_score
+        if min_date is not None:
+            mask &= self.index.scraped_at >= np.datetime64(min_date)
+        if max_date is not None:
+            mask &= self.index.scraped_at <= np.datetime64(max_date)
+        if min_ratings_count is not None:
+            mask &= self.index.ratings_counts >= min_ratings_count
+        if categories:
+            mask &= self.index.category_mask(categories)
+        return mask
+
+    def _embed_query(self, query):
+        """
+        Computes the vector representation of a query.
+
+        The query is lowercased and then goes through the same tokenizer as the documents. Vectors
+        are cached by normalized query, and the cache is cleared whenever the word vectors change.
 
         Args:
-            query_embedding (numpy.ndarray): The vector representation of the query.
-            average_vec (numpy.ndarray): The vector representation of the document.
+            query (str): The query text.
 
         Returns:
-            list: List containing the cosine similarity score.
+            numpy.ndarray: Average embedding of the query words, read-only when cached.
         """
-        sim = [(1 - scipy.spatial.distance.cosine(query_embedding, average_vec))]
-        return sim
+        key = " ".join(query.lower().split())
+        query_vector = self.query_cache.get(key)
+        if query_vector is None:
+            query_vector = self._average_embedding(self.tokenizer.tokenize(key))
+            query_vector.flags.writeable = False
+            self.query_cache.put(key, query_vector)
+        return query_vector
 
-    def rankings(self, query, top_n, boost_mode):
+    def rankings(
+        self,
+        query,
+        top_n,
+        boost_mode,
+        min_score=None,
+        max_score=None,
+        min_date=None,
+        max_date=None,
+        min_ratings_count=None,
+        categories=None,
+        exact=False,
+        rows=False,
+    ):
         """
         Ranks the podcasts based on the similarity of their vectors to the query vector.
 
@@ -166,34 +684,132 @@ class RetrievalModel:
             query (str): The query text for which rankings are computed.
             top_n (int): The number of top results to return.
             boost_mode (bool): If True, rank higher results with a bigger average rating score.
+            min_score (Optional[float]): Minimum average rating of the ranked podcasts.
+            max_score (Optional[float]): Maximum average rating of the ranked podcasts.
+            min_date (Optional[str]): Minimum scraping date of the ranked podcasts.
+            max_date (Optional[str]): Maximum scraping date of the ranked podcasts.
+            min_ratings_count (Optional[int]): Minimum number of ratings of the ranked podcasts.
+            categories (Optional[list of str]): Categories of the ranked podcasts; a podcast
+                                                matches any of them.
+            exact (bool): If True, score every podcast even in "ivf" mode.
+            rows (bool): If True, return the rows of the document index instead of the URLs.
 
         Returns:
             list: List of tuples where each tuple contains the podcast URL and similarity score.
+                  Without boost mode the score is wrapped in a single element list. With `rows`,
+                  tuples with the row of the document index and the score. Empty if no query
+                  word is in the vocabulary.
         """
-        query_words = np.mean(
-            np.array(
-                [self._embeddings(x) for x in nltk.word_tokenize(query.lower())],
-                dtype=float,
-            ),
-            axis=0,
+        query_vector = self._embed_query(query)
+        mask = self._filter_mask(
+            min_score, max_score, min_date, max_date, min_ratings_count, categories
         )
-        ranks = []
-        if not boost_mode:
-            for k, v in self.vectors_dict.items():
-                ranks.append(
-                    (
-                        v["itunes_url"],
-                        self._get_similarity(query_words, v["average_vector"]),
-                    )
-                )
-        else:
-            for k, v in self.vectors_dict.items():
-                ranks.append(
-                    (
-                        v["itunes_url"],
-                        self._get_similarity(query_words, v["average_vector"])[0]
-                        * v["average_rating"],
+        ranker = self.exact_ranker if exact else self.ranker
+        ranks = ranker.rank(query_vector, top_n, boost_mode, mask)
+        return self._format_ranks(query, ranks, boost_mode, rows)
+
+    def rankings_batch(
+        self,
+        queries,
+        top_n,
+        boost_mode,
+        min_score=None,
+        max_score=None,
+        min_date=None,
+        max_date=None,
+        min_ratings_count=None,
+        categories=None,
+        exact=False,
+        rows=False,
+    ):
+        """
+        Ranks the podcasts for a batch of queries.
+
+        All queries are embedded first and scored against the document vectors with one
+        matrix-matrix product, so a large batch is much faster than calling `rankings` for every
+        query. Every setting but `queries` and `exact` is either one value shared by every query
+        or a list with one value per query; since a value of `categories` is already a list,
+        its values per query are given as a list of lists.
+
+        Args:
+            queries (list of str): The query texts for which rankings are computed.
+            top_n (int or list of int): The number of top results to return.
+            boost_mode (bool or list of bool): If True, rank higher results with a bigger average
+                                               rating score.
+            min_score (Optional[float] or list): Minimum average rating of the ranked podcasts.
+            max_score (Optional[float] or list): Maximum average rating of the ranked podcasts.
+            min_date (Optional[str] or list): Minimum scraping date of the ranked podcasts.
+            max_date (Optional[str] or list): Maximum scraping date of the ranked podcasts.
+            min_ratings_count (Optional[int] or list): Minimum number of ratings of the ranked
+                                                       podcasts.
+            categories (Optional[list of str] or list of lists): Categories of the ranked
+                                                                 podcasts.
+            exact (bool): If True, score every podcast even in "ivf" mode.
+            rows (bool): If True, return the rows of the document index instead of the URLs.
+
+        Returns:
+            list: For every query, the rankings in the format returned by `rankings`.
+
+        Raises:
+            ValueError: If a list setting does not have one value per query.
+        """
+        count = len(queries)
+        top_n = _per_query(top_n, count, "top_n")
+        boost_mode = _per_query(boost_mode, count, "boost_mode")
+        filters = list(
+            zip(
+                _per_query(min_score, count, "min_score"),
+                _per_query(max_score, count, "max_score"),
+                _per_query(min_date, count, "min_date"),
+                _per_query(max_date, count, "max_date"),
+                _per_query(min_ratings_count, count, "min_ratings_count"),
+                [
+                    None if categories is None else tuple(categories)
+                    for categories in _per_query(
+                        categories, count, "categories", sequence=True
                     )
-                )
-        ranks = sorted(ranks, key=lambda t: t[1], reverse=True)
-        return ranks[:top_n]
+                ],
+            )
+        )
+        masks_by_filter = {
+            query_filter: self._filter_mask(*query_filter)
+            for query_filter in set(filters)
+        }
+        query_vectors = np.zeros((count, 300), dtype=np.float32)
+        for i, query in enumerate(queries):
+            query_vectors[i] = self._embed_query(query)
+        ranker = self.exact_ranker if exact else self.ranker
+        batch_ranks = ranker.rank_batch(
+            query_vectors,
+            top_n,
+            boost_mode,
+            [masks_by_filter[query_filter] for query_filter in filters],
+        )
+        return [
+            self._format_ranks(query, ranks, boost, rows)
+            for query, ranks, boost in zip(queries, batch_ranks, boost_mode)
+        ]
+
+    def _format_ranks(self, query, ranks, boost_mode, rows=False):
+        """
+        Converts the rows selected by the ranker to podcast URLs and scores.
+
+        Args:
+            query (str): The query text, for logging.
+            ranks (list): List of tuples with the selected row and its score, best first.
+            boost_mode (bool): Whether the scores are boosted by the average rating score.
+            rows (bool): If True, keep the rows instead of converting them to URLs.
+
+        Returns:
+            list: List of tuples where each tuple contains the podcast URL and similarity score.
+                  Without boost mode the score is wrapped in a single element list. With `rows`,
+                  the selected rows and their scores as they are.
+        """
+        if not ranks:
+            LOGGER.info(f"No podcasts ranked for query '{query}'")
+        if rows:
+            return ranks
+        urls = self.index.itunes_urls
+        if not boost_mode:
+            return [(str(urls[row]), [score]) for row, score in ranks]
+        return [(str(urls[row]), score) for row, score in ranks]
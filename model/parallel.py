@@ -0,0 +1,167 @@
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from model.encoding import encode_documents
+from model.vectors import EmbeddingTable
+from utils.common import LOGGER
+
+# State of a worker process, set once by `_init_worker`
+_WORKER = {}
+
+
+def _init_worker(tokenize, table_path, shm_name, shape):
+    """
+    Initializes a worker process of the encoding pool.
+
+    The embedding table is memory mapped, so every worker shares the same pages of the OS page
+    cache, and the output matrix is attached from shared memory.
+
+    Args:
+        tokenize (callable): Function that returns the tokens of a text.
+        table_path (str): Directory of the native embedding table.
+        shm_name (str): Name of the shared memory block with the output matrix.
+        shape (tuple): Shape of the output matrix.
+    """
+    _WORKER["tokenize"] = tokenize
+    _WORKER["table"] = EmbeddingTable.load(table_path)
+    _WORKER["shm"] = shared_memory.SharedMemory(name=shm_name)
+    _WORKER["output"] = np.ndarray(shape, dtype=np.float32, buffer=_WORKER["shm"].buf)
+
+
+def _init_file_worker(tokenize, table_path, output_path):
+    """
+    Initializes a worker process of a pool that encodes batches into a `.npy` file.
+
+    Like `_init_worker`, but the output matrix is the memory mapped file, so its rows are shared
+    through the OS page cache and are visible to the parent as soon as they are written.
+
+    Args:
+        tokenize (callable): Function that returns the tokens of a text.
+        table_path (str): Directory of the native embedding table.
+        output_path (str): Path of the `.npy` file with the output matrix.
+    """
+    _WORKER["tokenize"] = tokenize
+    _WORKER["table"] = EmbeddingTable.load(table_path)
+    _WORKER["output"] = np.load(output_path, mmap_mode="r+")
+
+
+def _encode_shard(shard):
+    """
+    Tokenizes and encodes one shard of documents into its rows of the shared output matrix.
+
+    Args:
+        shard (tuple): Index of the shard, first row of the shard and texts of the shard.
+
+    Returns:
+        tuple: Index of the shard, number of documents encoded and vocabulary of the shard.
+    """
+    number, start, texts = shard
+    token_lists = [_WORKER["tokenize"](text) for text in texts]
+    _WORKER["output"][start : start + len(texts)] = encode_documents(
+        token_lists, _WORKER["table"]
+    )
+    return number, len(texts), set().union(*token_lists)
+
+
+def encode_documents_parallel(texts, tokenize, table_path, workers, shard_size):
+    """
+    Computes the average word vector of every document with a pool of processes.
+
+    The texts are split in shards of `shard_size` documents. Each worker tokenizes a shard,
+    encodes it against the memory mapped embedding table and writes the result straight into
+    a shared output matrix, so only the texts and the shard vocabularies are sent between
+    processes. Each row is computed exactly as `encode_documents` would do it, so the output is
+    identical to the serial path.
+
+    Args:
+        texts (list of str): Text of every document.
+        tokenize (callable): Picklable function that returns the tokens of a text.
+        table_path (str): Directory of the native embedding table.
+        workers (int): Number of worker processes.
+        shard_size (int): Number of documents per shard.
+
+    Returns:
+        tuple: float32 matrix with the average vector of each document and the set of words of
+        the corpus.
+    """
+    dimension = EmbeddingTable.load_manifest(table_path)["dimension"]
+    shape = (len(texts), dimension)
+    shards = [
+        (number, start, texts[start : start + shard_size])
+        for number, start in enumerate(range(0, len(texts), shard_size))
+    ]
+    shm = shared_memory.SharedMemory(
+        create=True, size=max(1, len(texts) * dimension * 4)
+    )
+    try:
+        vocabulary = set()
+        done = 0
+        with multiprocessing.Pool(
+            workers,
+            initializer=_init_worker,
+            initargs=(tokenize, table_path, shm.name, shape),
+        ) as pool:
+            for number, count, shard_vocabulary in pool.imap_unordered(
+                _encode_shard, shards
+            ):
+                vocabulary.update(shard_vocabulary)
+                done += count
+                LOGGER.info(
+                    f"Shard {number + 1}/{len(shards)} encoded ({done}/{len(texts)} documents)"
+                )
+        vectors = np.ndarray(shape, dtype=np.float32, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+    return vectors, vocabulary
+
+
+def create_encoding_pool(tokenize, table_path, output_path, workers):
+    """
+    Creates a pool of processes that encode batches of documents into a `.npy` file.
+
+    The pool is meant to be kept for all the batches of a build, see `encode_batch_parallel`.
+
+    Args:
+        tokenize (callable): Picklable function that returns the tokens of a text.
+        table_path (str): Directory of the native embedding table.
+        output_path (str): Path of the `.npy` float32 matrix with one row per document.
+        workers (int): Number of worker processes.
+
+    Returns:
+        multiprocessing.pool.Pool: The pool, to be closed by the caller.
+    """
+    return multiprocessing.Pool(
+        workers,
+        initializer=_init_file_worker,
+        initargs=(tokenize, table_path, output_path),
+    )
+
+
+def encode_batch_parallel(pool, texts, start, shard_size):
+    """
+    Computes the average word vector of a batch of documents with a pool of `create_encoding_pool`.
+
+    The batch is split in shards of `shard_size` documents and the vectors are written to the
+    rows `start` to `start + len(texts)` of the output file of the pool. The shards of one batch
+    are all encoded before returning, so only one batch of texts is ever queued.
+
+    Args:
+        pool (multiprocessing.pool.Pool): Pool created by `create_encoding_pool`.
+        texts (list of str): Text of every document of the batch.
+        start (int): Row of the output matrix of the first document.
+        shard_size (int): Number of documents per shard.
+
+    Returns:
+        set: Words of the batch.
+    """
+    shards = [
+        (number, start + offset, texts[offset : offset + shard_size])
+        for number, offset in enumerate(range(0, len(texts), shard_size))
+    ]
+    vocabulary = set()
+    for _, _, shard_vocabulary in pool.imap_unordered(_encode_shard, shards):
+        vocabulary.update(shard_vocabulary)
+    return vocabulary
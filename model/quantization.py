@@ -0,0 +1,316 @@
+import json
+import os
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from model.ann import assign_to_centroids, kmeans
+from utils.common import LOGGER
+
+
+class QuantizedVectors(ABC):
+    """
+    Base class of the compressed document vectors.
+
+    A quantizer keeps small integer codes per document plus the parameters needed to decode
+    them, and scores a query directly against the codes (asymmetric distance computation): the
+    query stays in float32 and the documents are never decompressed as a whole.
+
+    Subclasses define `KIND`, the names of their arrays in `ARRAYS` and `score`.
+
+    Attributes:
+        codes (numpy.ndarray): Integer codes of the documents.
+    """
+
+    KIND = None
+    ARRAYS = ()
+    MANIFEST = "manifest.json"
+
+    def __len__(self):
+        return len(self.codes)
+
+    @abstractmethod
+    def score(self, query_vector, rows=None):
+        """
+        Computes the approximate dot product between the query vector and the documents.
+
+        Args:
+            query_vector (numpy.ndarray): Unit query vector.
+            rows (Optional[numpy.ndarray]): Rows of the documents to score. All rows if None.
+
+        Returns:
+            numpy.ndarray: float32 approximate score of every selected document.
+        """
+
+    def score_batch(self, query_vectors):
+        """
+        Computes the approximate dot product between a batch of query vectors and every document.
+
+        Scores one query at a time; subclasses override it to share the work across the batch.
+
+        Args:
+            query_vectors (numpy.ndarray): Matrix with one unit query vector per row.
+
+        Returns:
+            numpy.ndarray: float32 score matrix, one row per query and one column per document.
+        """
+        scores = np.empty((len(query_vectors), len(self)), dtype=np.float32)
+        for i, query_vector in enumerate(query_vectors):
+            scores[i] = self.score(query_vector)
+        return scores
+
+    @classmethod
+    def exists(cls, directory):
+        """
+        Checks whether quantized vectors have been saved to a directory.
+
+        Args:
+            directory (str): Directory of the quantized vectors.
+
+        Returns:
+            bool: True if the directory contains complete quantized vectors.
+        """
+        return os.path.isfile(os.path.join(directory, cls.MANIFEST))
+
+    def save(self, directory):
+        """
+        Writes the quantized vectors to a directory.
+
+        The vectors are written inside the staging directory of their document index, which is
+        what makes the save atomic.
+
+        Args:
+            directory (str): Target directory of the quantized vectors.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(
+                os.path.join(directory, f"{name}.npy"),
+                np.asarray(getattr(self, name)),
+                allow_pickle=False,
+            )
+        with open(os.path.join(directory, self.MANIFEST), "w") as fh:
+            json.dump({"kind": self.KIND, "count": len(self)}, fh, indent=4)
+
+    @staticmethod
+    def load(directory, mmap=True):
+        """
+        Loads quantized vectors from a directory, with the class recorded in its manifest.
+
+        Args:
+            directory (str): Directory of the quantized vectors.
+            mmap (bool): Whether to memory map the arrays instead of reading them into memory.
+
+        Returns:
+            QuantizedVectors: The loaded vectors.
+        """
+        with open(os.path.join(directory, QuantizedVectors.MANIFEST)) as fh:
+            quantizer = QUANTIZERS[json.load(fh)["kind"]]
+        return quantizer(
+            **{
+                name: np.load(
+                    os.path.join(directory, f"{name}.npy"),
+                    mmap_mode="r" if mmap else None,
+                    allow_pickle=False,
+                )
+                for name in quantizer.ARRAYS
+            }
+        )
+
+
+class ScalarQuantizer(QuantizedVectors):
+    """
+    Document vectors stored as int8, with one symmetric scale per dimension.
+
+    Every dimension is scaled so that its largest absolute value maps to 127, which keeps a
+    quarter of the float32 size. The query is multiplied by the scales once, so scoring is a
+    product of the raw codes with a float32 vector. The codes are converted to float32 in chunks
+    small enough to stay in the CPU cache.
+
+    Attributes:
+        scales (numpy.ndarray): float32 scale of every dimension.
+        codes (numpy.ndarray): int8 codes, one row per document.
+    """
+
+    KIND = "int8"
+    ARRAYS = ("scales", "codes")
+    CHUNK_SIZE = 1024
+
+    def __init__(self, scales, codes):
+        """
+        Initializes the ScalarQuantizer instance.
+
+        Args:
+            scales (numpy.ndarray): Scale of every dimension.
+            codes (numpy.ndarray): int8 codes, one row per document.
+        """
+        self.scales = scales
+        self.codes = codes
+
+    @classmethod
+    def build(cls, vectors):
+        """
+        Fits the scales and encodes the document vectors.
+
+        The vectors are read in blocks of `CHUNK_SIZE` rows and encoded into a preallocated int8
+        array, so no float copy of the whole matrix is made and memory mapped vectors are read
+        from disk block by block.
+
+        Args:
+            vectors (numpy.ndarray): Matrix with the unit-normalized vector of every document.
+
+        Returns:
+            ScalarQuantizer: The quantized vectors.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        scales = np.zeros(vectors.shape[1], dtype=np.float32)
+        for start in range(0, len(vectors), cls.CHUNK_SIZE):
+            block = np.abs(vectors[start : start + cls.CHUNK_SIZE])
+            np.maximum(scales, block.max(axis=0), out=scales)
+        scales /= 127.0
+        scales[scales == 0] = 1.0
+        codes = np.empty(vectors.shape, dtype=np.int8)
+        for start in range(0, len(vectors), cls.CHUNK_SIZE):
+            block = vectors[start : start + cls.CHUNK_SIZE] / scales
+            np.rint(block, out=block)
+            np.clip(block, -127, 127, out=block)
+            codes[start : start + cls.CHUNK_SIZE] = block
+        return cls(scales, codes)
+
+    def score(self, query_vector, rows=None):
+        weights = np.asarray(query_vector, dtype=np.float32) * self.scales
+        count = len(self) if rows is None else len(rows)
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, self.CHUNK_SIZE):
+            if rows is None:
+                chunk = self.codes[start : start + self.CHUNK_SIZE]
+            else:
+                chunk = self.codes[rows[start : start + self.CHUNK_SIZE]]
+            scores[start : start + self.CHUNK_SIZE] = chunk.astype(np.float32) @ weights
+        return scores
+
+    def score_batch(self, query_vectors):
+        weights = np.asarray(query_vectors, dtype=np.float32) * self.scales
+        scores = np.empty((len(weights), len(self)), dtype=np.float32)
+        for start in range(0, len(self), self.CHUNK_SIZE):
+            chunk = self.codes[start : start + self.CHUNK_SIZE].astype(np.float32)
+            scores[:, start : start + self.CHUNK_SIZE] = weights @ chunk.T
+        return scores
+
+
+class ProductQuantizer(QuantizedVectors):
+    """
+    Document vectors stored with product quantization.
+
+    The dimensions are split in `n_subvectors` contiguous groups and every group has its own
+    codebook of up to 256 centroids, trained with k-means; a document is stored as the uint8 index
+    of the closest centroid of each group, one byte per group. At query time the dot product of
+    every query group with every centroid is computed once into a lookup table, and the score of
+    a document is the sum of its table entries. The codes are stored one row per group, so the
+    lookups of a group read contiguous memory.
+
+    Attributes:
+        codebooks (numpy.ndarray): float32 centroids, of shape (groups, centroids, group size).
+        codes (numpy.ndarray): uint8 codes, one row per group and one column per document.
+    """
+
+    KIND = "pq"
+    ARRAYS = ("codebooks", "codes")
+
+    def __init__(self, codebooks, codes):
+        """
+        Initializes the ProductQuantizer instance.
+
+        Args:
+            codebooks (numpy.ndarray): Centroids, of shape (groups, centroids, group size).
+            codes (numpy.ndarray): uint8 codes, one row per group and one column per document.
+        """
+        self.codebooks = codebooks
+        self.codes = codes
+
+    def __len__(self):
+        return self.codes.shape[1]
+
+    @classmethod
+    def build(
+        cls,
+        vectors,
+        n_subvectors=50,
+        n_centroids=256,
+        iterations=10,
+        seed=0,
+        train_size=65536,
+    ):
+        """
+        Trains the codebooks and encodes the document vectors.
+
+        Args:
+            vectors (numpy.ndarray): Matrix with the unit-normalized vector of every document.
+            n_subvectors (int): Number of groups of dimensions; must divide the dimension.
+            n_centroids (int): Number of centroids per group, at most 256.
+            iterations (int): Number of k-means iterations.
+            seed (int): Seed of the random generator, so builds are reproducible.
+            train_size (int): Maximum number of documents used to train the codebooks.
+
+        Returns:
+            ProductQuantizer: The quantized vectors.
+
+        Raises:
+            ValueError: If `n_subvectors` does not divide the dimension of the vectors.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        count, dimension = vectors.shape
+        if n_subvectors <= 0 or dimension % n_subvectors:
+            raise ValueError(
+                f"n_subvectors must divide the dimension of the vectors ({dimension})"
+            )
+        group_size = dimension // n_subvectors
+        groups = vectors.reshape(count, n_subvectors, group_size)
+        train = groups
+        if count > train_size:
+            rng = np.random.default_rng(seed)
+            train = groups[np.sort(rng.choice(count, train_size, replace=False))]
+        n_centroids = max(1, min(n_centroids, 256, len(train)))
+        codebooks = np.zeros((n_subvectors, n_centroids, group_size), dtype=np.float32)
+        codes = np.zeros((n_subvectors, count), dtype=np.uint8)
+        for group in range(n_subvectors):
+            if len(train):
+                codebooks[group] = kmeans(
+                    train[:, group], n_centroids, iterations, seed + group
+                )
+            codes[group] = assign_to_centroids(groups[:, group], codebooks[group])
+        LOGGER.info(
+            f"Product quantizer built with {n_subvectors} groups of {n_centroids} centroids"
+        )
+        return cls(codebooks, codes)
+
+    def score(self, query_vector, rows=None):
+        n_subvectors, _, group_size = self.codebooks.shape
+        query_groups = np.asarray(query_vector, dtype=np.float32).reshape(
+            n_subvectors, group_size
+        )
+        table = np.einsum("gcd,gd->gc", self.codebooks, query_groups)
+        scores = np.zeros(len(self) if rows is None else len(rows), dtype=np.float32)
+        for group, codes in enumerate(self.codes):
+            if rows is not None:
+                codes = codes[rows]
+            scores += table[group].take(codes)
+        return scores
+
+    def score_batch(self, query_vectors):
+        n_subvectors, _, group_size = self.codebooks.shape
+        query_groups = np.asarray(query_vectors, dtype=np.float32).reshape(
+            len(query_vectors), n_subvectors, group_size
+        )
+        tables = np.einsum("gcd,qgd->gqc", self.codebooks, query_groups)
+        scores = np.zeros((len(query_vectors), len(self)), dtype=np.float32)
+        for group, codes in enumerate(self.codes):
+            scores += tables[group][:, codes]
+        return scores
+
+
+# Quantizers by the kind recorded in their manifest
+QUANTIZERS = {
+    ScalarQuantizer.KIND: ScalarQuantizer,
+    ProductQuantizer.KIND: ProductQuantizer,
+}
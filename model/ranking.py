@@ -0,0 +1,229 @@
+import numpy as np
+
+
+def normalize_rows(vectors):
+    """
+    Scales every row of a matrix to unit length.
+
+    Rows with a zero or non-finite norm are set to zero, so they score 0 against any query
+    instead of producing NaN values.
+
+    Args:
+        vectors (numpy.ndarray): Matrix with one vector per row.
+
+    Returns:
+        tuple: The float32 normalized matrix and the float32 array with the original norms.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1)
+    valid = np.isfinite(norms) & (norms > 0)
+    normalized = np.zeros_like(vectors)
+    normalized[valid] = vectors[valid] / norms[valid, None]
+    norms[~valid] = 0.0
+    return np.ascontiguousarray(normalized), norms.astype(np.float32)
+
+
+def select_top_n(scores, top_n, candidates=None):
+    """
+    Selects the rows with the highest scores, sorted by descending score.
+
+    Uses a partial selection, so only the `top_n` selected rows are fully sorted.
+
+    Args:
+        scores (numpy.ndarray): Score of every row.
+        top_n (int): Number of rows to select.
+        candidates (Optional[numpy.ndarray]): Rows eligible for selection. All rows if None.
+
+    Returns:
+        numpy.ndarray: Selected rows, best first.
+    """
+    if candidates is None:
+        candidates = np.arange(len(scores))
+    candidate_scores = scores[candidates]
+    top_n = min(top_n, len(candidates))
+    if top_n <= 0:
+        return np.empty(0, dtype=np.int64)
+    if top_n < len(candidates):
+        selected = np.argpartition(-candidate_scores, top_n - 1)[:top_n]
+    else:
+        selected = np.arange(len(candidates))
+    order = np.argsort(-candidate_scores[selected], kind="stable")
+    return candidates[selected[order]]
+
+
+def select_top_n_rows(scores, top_n):
+    """
+    Selects the columns with the highest scores in every row of a score matrix, sorted by
+    descending score.
+
+    Uses a partial selection along the rows, so a whole batch of queries is selected at once.
+
+    Args:
+        scores (numpy.ndarray): Score matrix, one row per query and one column per document.
+        top_n (int): Number of columns to select per row.
+
+    Returns:
+        numpy.ndarray: Selected columns of every row, best first.
+    """
+    top_n = min(top_n, scores.shape[1])
+    if top_n <= 0:
+        return np.empty((len(scores), 0), dtype=np.int64)
+    if top_n < scores.shape[1]:
+        selected = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+    else:
+        selected = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    selected_scores = np.take_along_axis(scores, selected, axis=1)
+    order = np.argsort(-selected_scores, axis=1, kind="stable")
+    return np.take_along_axis(selected, order, axis=1)
+
+
+class MatrixRanker:
+    """
+    Ranks the podcasts of a document index with a single matrix-vector product.
+
+    The document vectors of the index are unit-normalized, so the product of the matrix with a
+    normalized query vector is the cosine similarity of every podcast at once. When the index
+    has quantized vectors, they are scored instead and the float32 matrix is not read.
+
+    A batch of queries is scored with one matrix-matrix product, `BATCH_SIZE` queries at a time
+    so the score matrix stays bounded.
+
+    Attributes:
+        index (DocumentIndex): Index with the normalized document vectors and podcast metadata.
+    """
+
+    BATCH_SIZE = 256
+
+    def __init__(self, index):
+        """
+        Initializes the MatrixRanker instance.
+
+        Args:
+            index (DocumentIndex): Index with the normalized document vectors and podcast metadata.
+        """
+        self.index = index
+
+    @staticmethod
+    def unit_query(query_vector):
+        """
+        Scales the query vector to unit length.
+
+        Args:
+            query_vector (numpy.ndarray): The vector representation of the query.
+
+        Returns:
+            Optional[numpy.ndarray]: float32 unit query vector, or None if the query vector has no
+            direction (e.g. every query word is out of vocabulary).
+        """
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query_vector)
+        if not np.isfinite(norm) or norm == 0:
+            return None
+        return query_vector / norm
+
+    def scores(self, unit_query, rows=None):
+        """
+        Computes the dot product between a unit query vector and the documents.
+
+        Args:
+            unit_query (numpy.ndarray): Unit query vector.
+            rows (Optional[numpy.ndarray]): Rows of the documents to score. All rows if None.
+
+        Returns:
+            numpy.ndarray: float32 score of every selected document.
+        """
+        if self.index.quantized is not None:
+            return self.index.quantized.score(unit_query, rows)
+        if rows is None:
+            return self.index.vectors @ unit_query
+        return self.index.vectors[rows] @ unit_query
+
+    def similarities(self, query_vector):
+        """
+        Computes the cosine similarity between the query vector and every document.
+
+        Args:
+            query_vector (numpy.ndarray): The vector representation of the query.
+
+        Returns:
+            Optional[numpy.ndarray]: float32 similarity of every document, or None if the query
+            vector has no direction (e.g. every query word is out of vocabulary).
+        """
+        query_vector = self.unit_query(query_vector)
+        if query_vector is None:
+            return None
+        return self.scores(query_vector)
+
+    def rank(self, query_vector, top_n, boost_mode, mask=None):
+        """
+        Ranks the documents by similarity to the query vector.
+
+        Args:
+            query_vector (numpy.ndarray): The vector representation of the query.
+            top_n (int): The number of top results to return.
+            boost_mode (bool): If True, multiply the similarity by the average rating score.
+            mask (Optional[numpy.ndarray]): Boolean mask of the documents eligible for ranking.
+
+        Returns:
+            list: List of tuples with the selected row and its score, best first.
+        """
+        scores = self.similarities(query_vector)
+        if scores is None:
+            return []
+        if boost_mode:
+            scores = scores * self.index.average_ratings
+        candidates = None if mask is None else np.flatnonzero(mask)
+        rows = select_top_n(scores, top_n, candidates)
+        return [(int(row), float(scores[row])) for row in rows]
+
+    def scores_batch(self, unit_queries):
+        """
+        Computes the dot product between a batch of unit query vectors and every document.
+
+        Args:
+            unit_queries (numpy.ndarray): Matrix with one unit query vector per row.
+
+        Returns:
+            numpy.ndarray: float32 score matrix, one row per query and one column per document.
+        """
+        if self.index.quantized is not None:
+            return self.index.quantized.score_batch(unit_queries)
+        return unit_queries @ self.index.vectors.T
+
+    def rank_batch(self, query_vectors, top_n, boost_mode, masks):
+        """
+        Ranks the documents for a batch of queries.
+
+        The results are the same as ranking every query with `rank`, but the queries are scored
+        together with a matrix-matrix product and selected with a batched partial selection.
+
+        Args:
+            query_vectors (numpy.ndarray): Matrix with one query vector per row.
+            top_n (list of int): The number of top results to return for every query.
+            boost_mode (list of bool): Whether to multiply the similarity by the average rating
+                                       score for every query.
+            masks (list of Optional[numpy.ndarray]): Boolean mask of the documents eligible for
+                                                     ranking for every query.
+
+        Returns:
+            list: For every query, a list of tuples with the selected row and its score, best first.
+        """
+        unit_queries, norms = normalize_rows(query_vectors)
+        ranks = []
+        for start in range(0, len(unit_queries), self.BATCH_SIZE):
+            batch = slice(start, start + self.BATCH_SIZE)
+            scores = self.scores_batch(unit_queries[batch])
+            boosted = np.asarray(boost_mode[batch], dtype=bool)
+            scores[boosted] *= self.index.average_ratings
+            for i, mask in enumerate(masks[batch]):
+                if mask is not None:
+                    scores[i, ~mask] = -np.inf
+            selected = select_top_n_rows(scores, max(top_n[batch], default=0))
+            for i, norm in enumerate(norms[batch]):
+                if norm == 0:
+                    ranks.append([])
+                    continue
+                rows = selected[i, : max(top_n[start + i], 0)]
+                rows = rows[np.isfinite(scores[i, rows])]
+                ranks.append([(int(row), float(scores[i, row])) for row in rows])
+        return ranks
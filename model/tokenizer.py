@@ -0,0 +1,65 @@
+import re
+
+
+class Tokenizer:
+    """
+    A single-pass tokenizer shared by documents and queries.
+
+    It reproduces the previous `nltk.word_tokenize` plus cleaning pipeline with a few precompiled
+    patterns: contractions are split off ("don't" -> "do nt"), punctuation that nltk splits on
+    and hyphens become separators, every other non-alphanumeric character is dropped, and
+    stopwords are removed with a case-insensitive set lookup.
+
+    Attributes:
+        stopwords (frozenset): Lowercase stopwords removed from the tokens.
+    """
+
+    # Bump when the produced tokens change; part of the document index fingerprint
+    VERSION = 1
+
+    _NOT = re.compile(r"(?i)\b(can)(not)\b")
+    _CONTRACTIONS = re.compile(r"(?i)(?<=\w)(n't|'s|'m|'d|'ll|'re|'ve)\b")
+    _SEPARATORS = re.compile(r"[\-;@#$%&?!()\[\]{}<>\"]+|[:,](?!\d)")
+    _NON_ALPHANUMERIC = re.compile(r"[^a-zA-Z0-9\s]")
+
+    def __init__(self, stopwords):
+        """
+        Initializes the Tokenizer instance.
+
+        Args:
+            stopwords (iterable of str): Stopwords to remove from the tokens.
+        """
+        self.stopwords = frozenset(word.lower() for word in stopwords)
+
+    def tokenize(self, text):
+        """
+        Tokenizes and cleans a text.
+
+        Args:
+            text (str): Input text to be tokenized and cleaned.
+
+        Returns:
+            list of str: Cleaned tokens, with stopwords removed.
+        """
+        # The rarely needed patterns only run when their trigger is in the text
+        if "'" in text:
+            text = self._CONTRACTIONS.sub(r" \1", text)
+        if "nnot" in text.lower():
+            text = self._NOT.sub(r"\1 \2", text)
+        text = self._SEPARATORS.sub(" ", text)
+        text = self._NON_ALPHANUMERIC.sub("", text)
+        stopwords = self.stopwords
+        return [token for token in text.split() if token.lower() not in stopwords]
+
+    def tokenize_batch(self, texts):
+        """
+        Tokenizes and cleans many texts.
+
+        Args:
+            texts (iterable of str): Input texts to be tokenized and cleaned.
+
+        Returns:
+            list of list of str: Cleaned tokens of every text.
+        """
+        tokenize = self.tokenize
+        return [tokenize(text) for text in texts]
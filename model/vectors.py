@@ -0,0 +1,239 @@
+import json
+import os
+import shutil
+import tempfile
+
+import gensim
+import numpy as np
+
+from utils.common import LOGGER, file_signature
+
+
+class EmbeddingTable:
+    """
+    Word vectors stored in a native, memory-mappable format.
+
+    The table is a directory with a float32 `vectors.npy` matrix, a `vocab.txt` file with one
+    word per row of the matrix and a `manifest.json` file. The matrix is opened read-only with
+    memory mapping, so loading is almost instant and the pages are shared through the OS page
+    cache by every process using the same table.
+
+    The table exposes `key_to_index` and `get_vector` like `gensim.models.KeyedVectors`, so it
+    can be used in its place.
+
+    Attributes:
+        index_to_key (list of str): Word of every row of the matrix.
+        key_to_index (dict): Mapping from word to row of the matrix.
+        vectors (numpy.ndarray): float32 matrix with one word vector per row.
+        source (Optional[list]): Signature of the file the table was converted from.
+        limit (Optional[int]): Maximum number of words read from the source file.
+    """
+
+    VECTORS = "vectors.npy"
+    VOCAB = "vocab.txt"
+    MANIFEST = "manifest.json"
+
+    def __init__(self, index_to_key, vectors, source=None, limit=None):
+        """
+        Initializes the EmbeddingTable instance.
+
+        Args:
+            index_to_key (list of str): Word of every row of the matrix.
+            vectors (numpy.ndarray): Matrix with one word vector per row.
+            source (Optional[list]): Signature of the file the table was converted from.
+            limit (Optional[int]): Maximum number of words read from the source file.
+        """
+        self.index_to_key = list(index_to_key)
+        self.key_to_index = {key: i for i, key in enumerate(self.index_to_key)}
+        self.vectors = vectors
+        self.source = source
+        self.limit = limit
+
+    def __len__(self):
+        return len(self.index_to_key)
+
+    def __contains__(self, word):
+        return word in self.key_to_index
+
+    @property
+    def vector_size(self):
+        return self.vectors.shape[1]
+
+    def get_vector(self, word):
+        """
+        Retrieves the vector of a word.
+
+        Args:
+            word (str): The word to look up.
+
+        Returns:
+            numpy.ndarray: The word vector.
+
+        Raises:
+            KeyError: If the word is not in the table.
+        """
+        return self.vectors[self.key_to_index[word]]
+
+    @classmethod
+    def from_keyed_vectors(cls, keyed_vectors, source=None, limit=None):
+        """
+        Creates a table from a gensim KeyedVectors model.
+
+        Args:
+            keyed_vectors (gensim.models.KeyedVectors): The word vectors model.
+            source (Optional[list]): Signature of the file the model was loaded from.
+            limit (Optional[int]): Maximum number of words read from that file.
+
+        Returns:
+            EmbeddingTable: The new table.
+        """
+        return cls(
+            keyed_vectors.index_to_key,
+            np.asarray(keyed_vectors.vectors, dtype=np.float32),
+            source=source,
+            limit=limit,
+        )
+
+    @classmethod
+    def from_rows(cls, model, rows):
+        """
+        Creates a table with a subset of the rows of a word vectors model.
+
+        Args:
+            model (EmbeddingTable or gensim.models.KeyedVectors): The full word vectors model.
+            rows (array-like): Rows of the model to keep, in the order they are stored.
+
+        Returns:
+            EmbeddingTable: The new, compact table.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        return cls(
+            [model.index_to_key[row] for row in rows],
+            np.asarray(model.vectors[rows], dtype=np.float32),
+        )
+
+    @classmethod
+    def exists(cls, directory):
+        """
+        Checks whether a table has been saved to a directory.
+
+        Args:
+            directory (str): Directory of the table.
+
+        Returns:
+            bool: True if the directory contains a complete table.
+        """
+        return os.path.isfile(os.path.join(directory, cls.MANIFEST))
+
+    @classmethod
+    def load_manifest(cls, directory):
+        """
+        Reads the manifest of a saved table.
+
+        Args:
+            directory (str): Directory of the table.
+
+        Returns:
+            dict: Number of words, dimension, source signature and word limit of the table.
+        """
+        with open(os.path.join(directory, cls.MANIFEST)) as fh:
+            return json.load(fh)
+
+    def save(self, directory):
+        """
+        Writes the table to a directory.
+
+        The files are written to a temporary directory that is renamed into place at the end,
+        so a reader never sees a partially written table.
+
+        Args:
+            directory (str): Target directory of the table.
+
+        Returns:
+            str: Directory of the saved table.
+        """
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=".vectors-", dir=parent)
+        try:
+            np.save(
+                os.path.join(staging, self.VECTORS),
+                np.asarray(self.vectors, dtype=np.float32),
+                allow_pickle=False,
+            )
+            with open(os.path.join(staging, self.VOCAB), "w", encoding="utf-8") as fh:
+                fh.write("\n".join(self.index_to_key))
+            with open(os.path.join(staging, self.MANIFEST), "w") as fh:
+                json.dump(
+                    {
+                        "count": len(self),
+                        "dimension": int(self.vectors.shape[1]),
+                        "source": self.source,
+                        "limit": self.limit,
+                    },
+                    fh,
+                    indent=4,
+                )
+            if os.path.isdir(directory):
+                shutil.rmtree(directory)
+            os.rename(staging, directory)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        LOGGER.info(f"Embedding table with {len(self)} words saved to {directory}")
+        return directory
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Loads a table from a directory.
+
+        Args:
+            directory (str): Directory of the table.
+            mmap (bool): Whether to memory map the matrix read-only instead of reading it into memory.
+
+        Returns:
+            EmbeddingTable: The loaded table.
+        """
+        manifest = cls.load_manifest(directory)
+        with open(os.path.join(directory, cls.VOCAB), encoding="utf-8") as fh:
+            index_to_key = fh.read().split("\n") if manifest["count"] else []
+        vectors = np.load(
+            os.path.join(directory, cls.VECTORS),
+            mmap_mode="r" if mmap else None,
+            allow_pickle=False,
+        )
+        LOGGER.info(
+            f"Embedding table with {len(index_to_key)} words loaded from {directory}"
+        )
+        return cls(
+            index_to_key,
+            vectors,
+            source=manifest.get("source"),
+            limit=manifest.get("limit"),
+        )
+
+
+def convert_vectors(source_path, target_directory, limit):
+    """
+    Converts word2vec binary vectors to the native embedding table format.
+
+    This is a one-time step: the slow decompression and parsing of the word2vec file happens
+    here, and every later load memory maps the result.
+
+    Args:
+        source_path (str): Path to the word2vec binary file (optionally gzipped).
+        target_directory (str): Directory where the embedding table is written.
+        limit (int): Maximum number of words to keep, in the order of the source file.
+
+    Returns:
+        str: Directory of the saved table.
+    """
+    keyed_vectors = gensim.models.KeyedVectors.load_word2vec_format(
+        source_path, binary=True, limit=limit
+    )
+    LOGGER.info(f"Vectors loaded from {source_path}")
+    table = EmbeddingTable.from_keyed_vectors(
+        keyed_vectors, source=file_signature(source_path), limit=limit
+    )
+    return table.save(target_directory)
@@ -0,0 +1,129 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+sys.path.append(os.getcwd())
+from model.ann import IVFIndex, IVFRanker, assign_to_centroids, kmeans
+from model.ranking import MatrixRanker, normalize_rows
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(4, 16))
+    points = np.repeat(centers, 50, axis=0) + 0.05 * rng.normal(size=(200, 16))
+    return normalize_rows(points)[0]
+
+
+@pytest.fixture
+def index(vectors):
+    return SimpleNamespace(
+        vectors=vectors,
+        average_ratings=np.linspace(1.0, 5.0, len(vectors)),
+        quantized=None,
+    )
+
+
+def test_assign_to_centroids():
+    vectors = np.array([[1.0, 0.0], [0.0, 1.0], [0.8, 0.6]], dtype=np.float32)
+    centroids = np.array([[0.0, 1.0], [1.0, 0.0]], dtype=np.float32)
+    assert list(assign_to_centroids(vectors, centroids, chunk_size=2)) == [1, 0, 1]
+
+
+def test_spherical_kmeans(vectors):
+    centroids = kmeans(vectors, 4, seed=0, spherical=True)
+
+    assert centroids.shape == (4, 16)
+    assert np.allclose(np.linalg.norm(centroids, axis=1), 1.0)
+    assignments = assign_to_centroids(vectors, centroids)
+    for start in range(0, 200, 50):
+        assert len(set(assignments[start : start + 50])) == 1
+
+
+def test_kmeans():
+    rng = np.random.default_rng(0)
+    vectors = np.concatenate([rng.normal(size=(30, 2)), 10 + rng.normal(size=(30, 2))])
+    centroids = kmeans(vectors, 2, seed=0)
+
+    assert sorted(np.round(centroids.mean(axis=1) / 10)) == [0.0, 1.0]
+    assert len(set(assign_to_centroids(vectors[:30], centroids))) == 1
+
+
+def test_build(vectors):
+    ann = IVFIndex.build(vectors, n_lists=4)
+
+    assert ann.n_lists == 4
+    assert len(ann) == 200
+    assert ann.list_offsets[-1] == 200
+    assert sorted(ann.list_rows) == list(range(200))
+
+
+def test_build_defaults_and_zero_vectors():
+    vectors = np.zeros((9, 3), dtype=np.float32)
+    vectors[:3] = normalize_rows(np.eye(3))[0]
+
+    assert IVFIndex.build(vectors).n_lists == 3
+    assert len(IVFIndex.build(np.zeros((4, 3), dtype=np.float32))) == 4
+
+
+def test_probe(vectors):
+    ann = IVFIndex.build(vectors, n_lists=4)
+
+    rows = ann.probe(vectors[0], nprobe=1)
+    assert sorted(rows) == list(range(50))
+    assert len(ann.probe(vectors[0], nprobe=4)) == 200
+
+
+def test_save_and_load(tmp_path, vectors):
+    ann = IVFIndex.build(vectors, n_lists=4)
+    ann.save(str(tmp_path / "ann"))
+
+    assert IVFIndex.exists(str(tmp_path / "ann"))
+    loaded = IVFIndex.load(str(tmp_path / "ann"))
+    assert np.array_equal(loaded.centroids, ann.centroids)
+    assert np.array_equal(loaded.list_offsets, ann.list_offsets)
+    assert np.array_equal(loaded.list_rows, ann.list_rows)
+
+
+def test_ivf_ranker_matches_exact_when_probing_all_lists(index):
+    ann = IVFIndex.build(index.vectors, n_lists=4)
+    query = index.vectors[10] + index.vectors[60]
+
+    for boost_mode in (False, True):
+        expected = MatrixRanker(index).rank(query, 10, boost_mode)
+        ranks = IVFRanker(index, ann, nprobe=4).rank(query, 10, boost_mode)
+        assert [row for row, _ in ranks] == [row for row, _ in expected]
+        assert np.allclose([s for _, s in ranks], [s for _, s in expected])
+
+
+def test_ivf_ranker_scans_closest_lists(index):
+    ann = IVFIndex.build(index.vectors, n_lists=4)
+    ranks = IVFRanker(index, ann, nprobe=1).rank(index.vectors[120], 5, False)
+
+    assert ranks[0][0] == 120
+    assert all(100 <= row < 150 for row, _ in ranks)
+
+
+def test_ivf_ranker_falls_back_to_exact_scan(index):
+    ann = IVFIndex.build(index.vectors, n_lists=4)
+    mask = np.zeros(len(index.vectors), dtype=bool)
+    mask[[3, 160]] = True
+
+    ranks = IVFRanker(index, ann, nprobe=1).rank(index.vectors[0], 2, False, mask)
+    assert sorted(row for row, _ in ranks) == [3, 160]
+    assert IVFRanker(index, ann).rank(np.zeros(16), 2, False) == []
+
+
+def test_ivf_ranker_rank_batch(index):
+    ann = IVFIndex.build(index.vectors, n_lists=4)
+    ranker = IVFRanker(index, ann, nprobe=1)
+    queries = index.vectors[[0, 120]]
+
+    batch_ranks = ranker.rank_batch(queries, [3, 5], [False, True], [None, None])
+    assert batch_ranks == [
+        ranker.rank(queries[0], 3, False),
+        ranker.rank(queries[1], 5, True),
+    ]
@@ -1,11 +1,19 @@
+import asyncio
+import json
 import os
 import sys
+from datetime import date
+from unittest.mock import MagicMock
 
+import msgpack
 import pytest
 from fastapi.testclient import TestClient
 
 sys.path.append(os.getcwd())
-from main import app
+from core.batcher import MicroBatcher
+from core.executor import QueueFullError
+from core.service import SearchService
+from main import Request, _run_micro_batch, app
 
 client = TestClient(app)
 
@@ -38,7 +46,7 @@ def test_search_podcasts(setup_client):
     data = response.json()
     assert "prediction_id" in data
     assert data["top_n_results"] == dummy_request["top_n"]
-    assert isinstance(data["ranks"], str)
+    assert isinstance(data["ranks"], list)
 
 
 def test_search_podcasts_with_optional_parameters(setup_client):
@@ -52,7 +60,7 @@ def test_search_podcasts_with_optional_parameters(setup_client):
     data = response.json()
     assert "prediction_id" in data
     assert data["top_n_results"] == modified_request["top_n"]
-    assert isinstance(data["ranks"], str)
+    assert isinstance(data["ranks"], list)
 
 
 def test_search_podcasts_with_invalid_data(setup_client):
@@ -60,3 +68,301 @@ def test_search_podcasts_with_invalid_data(setup_client):
     invalid_request["boost_mode"] = -1
     response = setup_client.post("/search/", json=invalid_request)
     assert response.status_code == 422
+
+
+def test_search_podcasts_with_invalid_date(setup_client):
+    invalid_request = dict(dummy_request, min_date="2019-13-45")
+    response = setup_client.post("/search/", json=invalid_request)
+    assert response.status_code == 422
+
+
+def test_read_ready(setup_client):
+    response = setup_client.get("/ready/")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ready", "error": None}
+
+
+def test_search_podcasts_while_loading(setup_client):
+    service = setup_client.app.state.service
+    setup_client.app.state.service = SearchService(MagicMock())
+    try:
+        assert setup_client.get("/ready/").status_code == 503
+        response = setup_client.post("/search/", json=dummy_request)
+        assert response.status_code == 503
+        assert response.json()["detail"]["status"] == "idle"
+    finally:
+        setup_client.app.state.service = service
+
+
+def test_search_podcasts_with_other_paths(mocker, setup_client):
+    mock_core_app = mocker.patch("main.CoreAPP")
+    modified_request = dict(dummy_request, vectors_path="/other/vectors")
+
+    response = setup_client.post("/search/", json=modified_request)
+    assert response.status_code == 400
+    mock_core_app.assert_not_called()
+
+
+def test_search_podcasts_ignores_search_settings(mocker, setup_client):
+    mock_core_app = mocker.patch("main.CoreAPP")
+    modified_request = dict(dummy_request, search_mode="ivf", ann_nprobe=1)
+
+    response = setup_client.post("/search/", json=modified_request)
+    assert response.status_code == 200
+    mock_core_app.assert_not_called()
+
+
+def test_search_podcasts_ignores_index_path(mocker, setup_client):
+    spy = mocker.spy(setup_client.app.state.results, "get_or_compute")
+    modified_request = dict(dummy_request, index_path="/tmp/other")
+
+    response = setup_client.post("/search/", json=modified_request)
+    assert response.status_code == 200
+    spy.assert_called_once()
+
+
+def test_read_metrics(setup_client):
+    setup_client.post("/search/", json=dummy_request)
+    response = setup_client.get("/metrics/")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["service"]["status"] == "ready"
+    assert data["executor"]["completed"] >= 1
+    assert data["executor"]["queue_depth"] == 0
+    assert data["batcher"]["requests"] >= 1
+    assert sum(data["batcher"]["batch_sizes"].values()) == data["batcher"]["batches"]
+    assert data["memory"]["pid"] == os.getpid()
+    assert data["memory"]["rss_mb"] > 0
+
+
+def test_micro_batch_keeps_errors_per_request(setup_client):
+    batcher = MicroBatcher(_run_micro_batch, window=0.05, max_batch_size=8)
+    valid = Request(**dummy_request)
+    invalid = Request.model_construct(**dict(dummy_request, min_date="2019-13-45"))
+
+    async def scenario():
+        return await asyncio.gather(
+            batcher.submit(valid), batcher.submit(invalid), return_exceptions=True
+        )
+
+    (version, ranks), error = asyncio.run(scenario())
+    assert version == setup_client.app.state.service.index_version
+    assert len(ranks) == dummy_request["top_n"]
+    assert isinstance(error, ValueError)
+
+
+def test_search_podcasts_queue_full(mocker, setup_client):
+    mocker.patch.object(
+        setup_client.app.state.executor, "run", side_effect=QueueFullError("full")
+    )
+    response = setup_client.post("/search/", json=dummy_request)
+    assert response.status_code == 503
+    assert response.json()["detail"] == "full"
+
+
+def test_search_podcasts_batch(setup_client):
+    batch_request = {
+        "queries": [
+            {"query": dummy_request["query"]},
+            {"query": "comedy news", "top_n": 2, "min_score": None},
+        ],
+        "top_n": 3,
+        "min_score": 3.0,
+        "boost_mode": True,
+    }
+    response = setup_client.post("/search/batch/", json=batch_request)
+    assert response.status_code == 200
+    predictions = response.json()["predictions"]
+    assert [p["top_n_results"] for p in predictions] == [3, 2]
+
+    single = setup_client.post(
+        "/search/",
+        json=dict(dummy_request, top_n=3, min_score=3.0, max_score=None),
+    )
+    expected = single.json()["ranks"]
+    ranks = predictions[0]["ranks"]
+    assert [rank["id"] for rank in ranks] == [rank["id"] for rank in expected]
+    assert [rank["score"] for rank in ranks] == pytest.approx(
+        [rank["score"] for rank in expected]
+    )
+
+
+def test_search_podcasts_batch_settings(mocker, setup_client):
+    service = setup_client.app.state.service
+    mock_rank_batch = mocker.patch.object(
+        service, "rank_batch", return_value=(service.index_version, [[], []])
+    )
+    batch_request = {
+        "queries": [{"query": "first"}, {"query": "second", "max_date": None}],
+        "max_date": "2019-07-08",
+    }
+
+    response = setup_client.post("/search/batch/", json=batch_request)
+    assert response.status_code == 200
+    mock_rank_batch.assert_called_once_with(
+        ["first", "second"],
+        top_n=[5, 5],
+        min_score=[None, None],
+        max_score=[None, None],
+        min_date=[None, None],
+        max_date=[date(2019, 7, 8), None],
+        min_ratings_count=[None, None],
+        categories=[None, None],
+        boost_mode=[False, False],
+    )
+
+
+@pytest.mark.parametrize("top_n", [None, 0, -1])
+def test_search_podcasts_invalid_top_n(setup_client, top_n):
+    response = setup_client.post("/search/", json=dict(dummy_request, top_n=top_n))
+    assert response.status_code == 422
+    batch_request = {"queries": [{"query": "videogames", "top_n": top_n}]}
+    response = setup_client.post("/search/batch/", json=batch_request)
+    assert response.status_code == 422
+
+
+def test_search_podcasts_batch_too_large(mocker, setup_client):
+    mocker.patch("main.SEARCH_BATCH_MAX_QUERIES", 1)
+    batch_request = {"queries": [{"query": "first"}, {"query": "second"}]}
+    response = setup_client.post("/search/batch/", json=batch_request)
+    assert response.status_code == 413
+
+
+def test_search_podcasts_is_cached(mocker, setup_client):
+    spy = mocker.spy(setup_client.app.state.service, "rank_batch")
+    request = dict(dummy_request, query="Comedy   podcasts")
+
+    first = setup_client.post("/search/", json=request)
+    second = setup_client.post("/search/", json=dict(request, query="comedy podcasts"))
+    assert first.json()["ranks"] == second.json()["ranks"]
+    assert spy.call_count == 1
+    assert setup_client.get("/metrics/").json()["results"]["hits"] == 1
+
+
+def test_search_podcasts_pages(setup_client):
+    deep_request = {"query": "comedy podcasts", "max_results": 25, "page_size": 10}
+    response = setup_client.post("/search/pages/", json=deep_request)
+    assert response.status_code == 200
+    first = response.json()
+    assert first["offset"] == 0
+    assert len(first["ranks"]) == 10
+
+    ranks = first["ranks"]
+    cursor = first["next_cursor"]
+    while cursor is not None:
+        page = setup_client.get(f"/search/pages/{cursor}").json()
+        assert page["snapshot_id"] == first["snapshot_id"]
+        ranks.extend(page["ranks"])
+        cursor = page["next_cursor"]
+    assert len(ranks) == first["total_results"]
+
+    full = setup_client.post(
+        "/search/", json={"query": "comedy podcasts", "top_n": 25}
+    ).json()
+    assert [rank["id"] for rank in ranks] == [rank["id"] for rank in full["ranks"]]
+
+
+def test_read_search_page_with_offset_and_limit(setup_client):
+    deep_request = {"query": "comedy podcasts", "max_results": 25}
+    snapshot_id = setup_client.post("/search/pages/", json=deep_request).json()[
+        "snapshot_id"
+    ]
+    response = setup_client.get(f"/search/pages/{snapshot_id}-5", params={"limit": 3})
+    assert response.status_code == 200
+    page = response.json()
+    assert page["offset"] == 5
+    assert len(page["ranks"]) == 3
+    assert page["next_cursor"] == f"{snapshot_id}-8"
+
+
+def test_read_search_page_invalid_cursor(setup_client):
+    assert setup_client.get("/search/pages/unknown-0").status_code == 404
+    assert setup_client.get("/search/pages/malformed").status_code == 400
+
+
+def test_search_podcasts_pages_too_deep(mocker, setup_client):
+    mocker.patch("main.SEARCH_MAX_RESULTS", 10)
+    response = setup_client.post("/search/pages/", json={"max_results": 11})
+    assert response.status_code == 413
+
+
+def test_search_podcasts_stream(setup_client):
+    deep_request = {"query": "comedy podcasts", "max_results": 25, "page_size": 10}
+    response = setup_client.post("/search/stream/", json=deep_request)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    ranks = [json.loads(line) for line in response.text.splitlines()]
+    page = setup_client.post("/search/pages/", json=dict(deep_request, page_size=25))
+    assert ranks == page.json()["ranks"]
+
+
+def test_search_podcasts_msgpack(setup_client):
+    response = setup_client.post(
+        "/search/", json=dummy_request, headers={"Accept": "application/msgpack"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/msgpack"
+    data = msgpack.unpackb(response.content)
+    assert data["top_n_results"] == dummy_request["top_n"]
+
+    expected = setup_client.post("/search/", json=dummy_request).json()
+    assert data["ranks"] == expected["ranks"]
+
+
+def test_search_podcasts_batch_msgpack(setup_client):
+    batch_request = {"queries": [{"query": "first"}, {"query": "second"}]}
+    response = setup_client.post(
+        "/search/batch/",
+        json=batch_request,
+        headers={"Accept": "application/x-msgpack"},
+    )
+    assert response.status_code == 200
+    predictions = msgpack.unpackb(response.content)["predictions"]
+    assert [p["top_n_results"] for p in predictions] == [5, 5]
+
+
+def test_index_rebuild(mocker, setup_client):
+    mocker.patch("main.ADMIN_TOKEN", "secret")
+    service = setup_client.app.state.service
+    mock_start_rebuild = mocker.patch.object(
+        service, "start_rebuild", side_effect=[True, False]
+    )
+    headers = {"X-Admin-Token": "secret"}
+
+    response = setup_client.post(
+        "/admin/index/rebuild/", json={"force": True}, headers=headers
+    )
+    assert response.status_code == 202
+    mock_start_rebuild.assert_called_once_with(True, on_swap=None)
+
+    response = setup_client.post("/admin/index/rebuild/", json={}, headers=headers)
+    assert response.status_code == 409
+
+
+def test_index_rebuild_requires_admin_token(mocker, setup_client):
+    mock_start_rebuild = mocker.patch.object(
+        setup_client.app.state.service, "start_rebuild"
+    )
+
+    response = setup_client.post("/admin/index/rebuild/", json={})
+    assert response.status_code == 403
+
+    mocker.patch("main.ADMIN_TOKEN", "secret")
+    response = setup_client.post("/admin/index/rebuild/", json={})
+    assert response.status_code == 401
+    response = setup_client.get(
+        "/admin/index/rebuild/", headers={"X-Admin-Token": "wrong"}
+    )
+    assert response.status_code == 401
+    mock_start_rebuild.assert_not_called()
+
+
+def test_read_index_rebuild(mocker, setup_client):
+    mocker.patch("main.ADMIN_TOKEN", "secret")
+    response = setup_client.get(
+        "/admin/index/rebuild/", headers={"X-Admin-Token": "secret"}
+    )
+    assert response.status_code == 200
+    assert response.json()["status"] == "idle"
+    assert setup_client.get("/metrics/").json()["rebuild"] == {"status": "idle"}
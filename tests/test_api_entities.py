@@ -1,6 +1,6 @@
-import json
 import os
 import sys
+from datetime import date
 
 import pytest
 from pydantic import ValidationError
@@ -29,7 +29,10 @@ dummy_request_data = {
 dummy_prediction_data = {
     "prediction_id": uuid4(),
     "top_n_results": 5,
-    "ranks": json.dumps([["result1", 1.0], ["result2", 0.87]]),
+    "ranks": [
+        {"id": "id1", "url": "result1", "score": 1.0},
+        {"id": "id2", "url": "result2", "score": 0.87},
+    ],
 }
 
 
@@ -44,8 +47,8 @@ def test_request_model_validation():
     assert request_model.top_n == dummy_request_data["top_n"]
     assert request_model.min_score == dummy_request_data["min_score"]
     assert request_model.max_score == dummy_request_data["max_score"]
-    assert request_model.min_date == dummy_request_data["min_date"]
-    assert request_model.max_date == dummy_request_data["max_date"]
+    assert request_model.min_date == date.fromisoformat(dummy_request_data["min_date"])
+    assert request_model.max_date == date.fromisoformat(dummy_request_data["max_date"])
     assert request_model.boost_mode == dummy_request_data["boost_mode"]
     assert request_model.verbose == dummy_request_data["verbose"]
 
@@ -73,13 +76,19 @@ def test_request_model_validation():
     with pytest.raises(ValidationError):
         Request(**invalid_request_data)
 
+    invalid_request_data = dict(dummy_request_data, max_date="2019-07-32")
+    with pytest.raises(ValidationError):
+        Request(**invalid_request_data)
+
 
 def test_prediction_model_validation():
     # Test successful creation
     prediction_model = Prediction(**dummy_prediction_data)
     assert prediction_model.prediction_id == dummy_prediction_data["prediction_id"]
     assert prediction_model.top_n_results == dummy_prediction_data["top_n_results"]
-    assert prediction_model.ranks == dummy_prediction_data["ranks"]
+    assert [rank.model_dump() for rank in prediction_model.ranks] == (
+        dummy_prediction_data["ranks"]
+    )
 
     # Test validation error
     invalid_prediction_data = dummy_prediction_data.copy()
@@ -87,19 +96,19 @@ def test_prediction_model_validation():
     with pytest.raises(ValidationError):
         Prediction(**invalid_prediction_data)
 
-    # Test ranks must be a list of lists
-    invalid_prediction_data["ranks"] = ["result1", "result2"]
+    # Test ranks must be a list of results
+    invalid_prediction_data["ranks"] = [["result1", 1.0], ["result2", 0.87]]
     with pytest.raises(ValidationError):
         Prediction(**invalid_prediction_data)
 
     # Test default values
     minimal_prediction_data = {
         "top_n_results": 3,
-        "ranks": json.dumps([["result1"], ["result2"]]),
+        "ranks": [{"id": "id1", "url": "result1", "score": 0.5}],
     }
     prediction_model = Prediction(**minimal_prediction_data)
     assert isinstance(
         prediction_model.prediction_id, uuid4().__class__
     )  # Check that it's a UUID instance
     assert prediction_model.top_n_results == 3
-    assert prediction_model.ranks == json.dumps([["result1"], ["result2"]])
+    assert prediction_model.ranks[0].url == "result1"
@@ -0,0 +1,118 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.getcwd())
+from core.batcher import MicroBatcher
+from core.executor import QueueFullError
+
+
+class Recorder:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+
+    async def __call__(self, items):
+        self.batches.append(list(items))
+        await asyncio.sleep(self.delay)
+        return [item * 10 for item in items]
+
+
+def test_gathers_requests_within_window():
+    run_batch = Recorder()
+    batcher = MicroBatcher(run_batch, window=0.05, max_batch_size=8)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(3)))
+
+    assert asyncio.run(scenario()) == [0, 10, 20]
+    assert run_batch.batches == [[0, 1, 2]]
+    stats = batcher.stats()
+    assert stats["batches"] == 1
+    assert stats["requests"] == 3
+    assert stats["batch_sizes"] == {3: 1}
+    assert stats["added_latency_seconds"]["max"] > 0.0
+
+
+def test_dispatches_full_batches():
+    run_batch = Recorder()
+    batcher = MicroBatcher(run_batch, window=10.0, max_batch_size=2)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(4)))
+
+    assert asyncio.run(scenario()) == [0, 10, 20, 30]
+    assert run_batch.batches == [[0, 1], [2, 3]]
+
+
+def test_adaptive_dispatch_only_batches_while_busy():
+    run_batch = Recorder(delay=0.05)
+    batcher = MicroBatcher(run_batch, window=10.0, max_batch_size=8, max_in_flight=1)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(4)))
+
+    assert asyncio.run(scenario()) == [0, 10, 20, 30]
+    assert run_batch.batches == [[0], [1, 2, 3]]
+    assert batcher.stats()["batch_sizes"] == {1: 1, 3: 1}
+
+
+def test_errors_reach_every_request_of_the_batch():
+    async def run_batch(items):
+        raise RuntimeError("boom")
+
+    batcher = MicroBatcher(run_batch, window=0.01)
+
+    async def scenario():
+        return await asyncio.gather(
+            *(batcher.submit(i) for i in range(2)), return_exceptions=True
+        )
+
+    errors = asyncio.run(scenario())
+    assert [str(error) for error in errors] == ["boom", "boom"]
+    assert batcher.stats()["in_flight"] == 0
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(batcher.submit(0))
+
+
+def test_errors_stay_with_their_request():
+    async def run_batch(items):
+        if any(item < 0 for item in items):
+            raise ValueError(f"invalid item in {items}")
+        return [item * 10 for item in items]
+
+    batcher = MicroBatcher(run_batch, window=0.05, max_batch_size=8)
+
+    async def scenario():
+        return await asyncio.gather(
+            batcher.submit(1), batcher.submit(-1), return_exceptions=True
+        )
+
+    result, error = asyncio.run(scenario())
+    assert result == 10
+    assert isinstance(error, ValueError)
+    assert str(error) == "invalid item in [-1]"
+    assert batcher.stats()["retried_batches"] == 1
+
+
+def test_full_queue_is_not_retried():
+    calls = []
+
+    async def run_batch(items):
+        calls.append(items)
+        raise QueueFullError("The search queue is full")
+
+    batcher = MicroBatcher(run_batch, window=0.05, max_batch_size=8)
+
+    async def scenario():
+        return await asyncio.gather(
+            batcher.submit(1), batcher.submit(2), return_exceptions=True
+        )
+
+    errors = asyncio.run(scenario())
+    assert all(isinstance(error, QueueFullError) for error in errors)
+    assert calls == [[1, 2]]
+    assert batcher.stats()["retried_batches"] == 0
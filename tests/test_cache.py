@@ -0,0 +1,105 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.append(os.getcwd())
+from utils.cache import LRUCache, TTLCache
+
+
+@pytest.fixture
+def cache():
+    return LRUCache(maxsize=2)
+
+
+def test_get_missing_key(cache):
+    assert cache.get("missing") is None
+    assert cache.get("missing", "default") == "default"
+    assert cache.stats()["misses"] == 2
+
+
+def test_put_and_get(cache):
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    assert cache.stats() == {
+        "hits": 1,
+        "misses": 0,
+        "evictions": 0,
+        "size": 1,
+        "maxsize": 2,
+    }
+
+
+def test_evicts_least_recently_used(cache):
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_clear_keeps_counters(cache):
+    cache.put("a", 1)
+    cache.get("a")
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_zero_size_disables_cache():
+    cache = LRUCache(maxsize=0)
+    cache.put("a", 1)
+    assert len(cache) == 0
+    assert cache.get("a") is None
+
+
+def test_concurrent_access():
+    cache = LRUCache(maxsize=50)
+
+    def worker(offset):
+        for i in range(1000):
+            cache.put((offset + i) % 100, i)
+            cache.get(i % 100)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = cache.stats()
+    assert stats["size"] == 50
+    assert stats["hits"] + stats["misses"] == 8000
+
+
+def test_ttl_cache_expires_entries(mocker):
+    clock = mocker.patch("utils.cache.time.monotonic", return_value=100.0)
+    cache = TTLCache(maxsize=2, ttl=10.0)
+    cache.put("a", 1)
+
+    clock.return_value = 109.0
+    assert cache.get("a") == 1
+    clock.return_value = 110.0
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    stats = cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["ttl"] == 10.0
+
+
+def test_ttl_cache_without_ttl():
+    cache = TTLCache(maxsize=1)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.stats()["evictions"] == 1
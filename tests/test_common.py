@@ -0,0 +1,85 @@
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.getcwd())
+from utils.common import file_lock, process_memory
+
+
+def _append_under_lock(lock_path, log_path):
+    with file_lock(lock_path):
+        with open(log_path, "a") as fh:
+            fh.write("start\n")
+        time.sleep(0.05)
+        with open(log_path, "a") as fh:
+            fh.write("end\n")
+
+
+def test_file_lock_serializes_processes(tmp_path):
+    lock_path = str(tmp_path / "build.lock")
+    log_path = str(tmp_path / "log.txt")
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_append_under_lock, args=(lock_path, log_path))
+        for _ in range(3)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    with open(log_path) as fh:
+        lines = fh.read().split()
+    assert lines == ["start", "end"] * 3
+
+
+def test_file_lock_is_released_on_error(tmp_path):
+    lock_path = str(tmp_path / "build.lock")
+    try:
+        with file_lock(lock_path):
+            raise ValueError("build failed")
+    except ValueError:
+        pass
+
+    with file_lock(lock_path):
+        pass
+
+
+def test_file_lock_without_waiting(tmp_path):
+    lock_path = str(tmp_path / "build.lock")
+    with file_lock(lock_path) as locked:
+        assert locked
+        with file_lock(lock_path, blocking=False) as other:
+            assert not other
+
+    with file_lock(lock_path, blocking=False) as locked:
+        assert locked
+
+
+def test_file_lock_relocks_a_removed_file(tmp_path):
+    lock_path = str(tmp_path / "build.lock")
+    held = []
+
+    def wait_for_lock():
+        with file_lock(lock_path):
+            held.append(os.path.exists(lock_path))
+
+    with file_lock(lock_path):
+        waiter = threading.Thread(target=wait_for_lock)
+        waiter.start()
+        time.sleep(0.1)
+        os.remove(lock_path)
+    waiter.join(5)
+
+    assert held == [True]
+
+
+def test_process_memory():
+    memory = process_memory()
+    if memory is None:
+        return
+    assert memory["pid"] == os.getpid()
+    assert memory["rss_mb"] > 0
+    assert memory["shared_mb"] + memory["private_mb"] <= memory["rss_mb"] + 0.2
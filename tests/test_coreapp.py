@@ -1,7 +1,9 @@
 import json
 import os
 import sys
+from unittest.mock import MagicMock
 
+import numpy as np
 import pytest
 
 sys.path.append(os.getcwd())
@@ -48,24 +50,32 @@ def test_extract_zip_file(mocker, core_app):
 def test_set_database(mocker, core_app):
     mock_database = mocker.patch("core.core.Database")
     core_app._set_database()
-    mock_database.assert_called_once_with(core_app.db_path, core_app.verbose)
+    mock_database.assert_called_once_with(
+        core_app.db_path, core_app.verbose, connection=None
+    )
     assert core_app.db is not None
 
 
 def test_get_records_from_database(mocker, core_app):
+    connection = MagicMock()
+    mock_get_worker = mocker.patch("core.core.get_query_worker")
+    mock_get_worker.return_value.run.side_effect = lambda fn: fn(connection)
     mock_database = mocker.patch("core.core.Database")
     mock_db_instance = mock_database.return_value
     mock_db_instance.filter_podcasts.return_value = "filtered_podcasts"
     mock_db_instance.join_and_select.return_value = "joined_table"
     mock_db_instance.add_composed_column.return_value = "composed_table"
-    mock_db_instance.fetch_column_records.return_value = [
-        (1, 4.5, "https://example.com", "info1"),
-        (2, 4.2, "https://example.com", "info2"),
-    ]
+    batches = [{"podcast_id": np.array(["1", "2"], dtype=object)}]
+    mock_db_instance.fetch_column_batches.return_value = (2, iter(batches))
 
     core_app._get_records_from_database()
 
-    mock_database.assert_called_once_with(core_app.db_path, core_app.verbose)
+    mock_get_worker.assert_called_once_with(
+        core_app.db_path, core_app.db_threads, core_app.db_memory_limit
+    )
+    mock_database.assert_called_once_with(
+        core_app.db_path, core_app.verbose, connection=connection
+    )
     mock_db_instance.show_all_tables.assert_called_once()
     mock_db_instance.filter_podcasts.assert_called_once()
     mock_db_instance.join_and_select.assert_called_once_with(
@@ -84,74 +94,223 @@ def test_get_records_from_database(mocker, core_app):
             "ratings_count",
             "scraped_at",
         ],
-        min_filter=core_app.min_score,
-        max_filter=core_app.max_score,
-        min_date=core_app.min_date,
-        max_date=core_app.max_date,
     )
     mock_db_instance.add_composed_column.assert_called_once_with(
         table="joined_table",
         columns=["category", "slug", "title", "author", "description"],
         new_column_name="full_info",
+        keep_columns=["category"],
     )
-    mock_db_instance.fetch_column_records.assert_called_once_with(
+    mock_db_instance.fetch_column_batches.assert_called_once_with(
         table_name="composed_table",
-        columns=["podcast_id", "average_rating", "itunes_url", "full_info"],
+        columns=[
+            "podcast_id",
+            "average_rating",
+            "itunes_url",
+            "full_info",
+            "scraped_at",
+            "ratings_count",
+            "category",
+        ],
+        key="podcast_id",
+        batch_size=core_app.build_batch_size,
+        order_by="podcast_id, category",
     )
-    mock_db_instance.close_connection.assert_called_once()
-    assert core_app.records == [
-        (1, 4.5, "https://example.com", "info1"),
-        (2, 4.2, "https://example.com", "info2"),
-    ]
+    mock_db_instance.close_connection.assert_not_called()
+    assert core_app.podcasts_count == 2
+    assert list(core_app.records) == batches
 
 
 def test_transform_records_from_database(core_app):
-    core_app.records = [
-        (1, 4.5, "https://example.com", "info1"),
-        (2, 4.2, "https://example.com", "info2"),
-    ]
-    core_app._transform_records_from_database()
-    expected_dictionary = {
-        "1": {
-            "itunes_url": "https://example.com",
-            "average_rating": 4.5,
-            "text": "info1",
-        },
-        "2": {
-            "itunes_url": "https://example.com",
-            "average_rating": 4.2,
-            "text": "info2",
-        },
+    records = {
+        "podcast_id": np.array(["1", "2", "1", "3"], dtype=object),
+        "average_rating": np.array([4.5, 4.2, 4.5, 3.0]),
+        "itunes_url": np.ma.masked_array(
+            ["https://example.com", "https://example.org", "https://example.com", ""],
+            mask=[False, False, False, True],
+            dtype=object,
+        ),
+        "full_info": np.array(["info1", "info2", "info1b", "info3"], dtype=object),
+        "scraped_at": np.array(
+            [
+                "2019-07-07T10:00:00",
+                "2019-07-08T10:00:00",
+                "2019-07-07T10:00:00",
+                "2019-07-09T10:00:00",
+            ],
+            dtype="datetime64[us]",
+        ),
+        "ratings_count": np.ma.masked_array([12, 3, 12, 0], mask=[0, 0, 0, 1]),
+        "category": np.ma.masked_array(
+            ["Arts", "News", "Music", ""], mask=[0, 0, 0, 1], dtype=object
+        ),
     }
-    assert core_app.records_dictionary == expected_dictionary
+    core_app.records = iter([records])
+    core_app._transform_records_from_database()
+    (columns,) = list(core_app.records_columns)
+    assert columns["podcast_ids"].tolist() == ["1", "2", "3"]
+    assert columns["itunes_urls"].tolist() == [
+        "https://example.com",
+        "https://example.org",
+        "",
+    ]
+    assert columns["average_ratings"].tolist() == [4.5, 4.2, 3.0]
+    assert columns["scraped_at"].dtype == np.dtype("datetime64[s]")
+    assert columns["scraped_at"].astype(str).tolist() == [
+        "2019-07-07T10:00:00",
+        "2019-07-08T10:00:00",
+        "2019-07-09T10:00:00",
+    ]
+    assert columns["ratings_counts"].tolist() == [12, 3, 0]
+    assert sorted(
+        zip(columns["category_labels"].tolist(), columns["category_rows"].tolist())
+    ) == [("Arts", 0), ("Music", 0), ("News", 1)]
+    assert columns["texts"] == ["info1b", "info2", "info3"]
 
 
 def test_set_model(mocker, core_app):
     mock_retrieval_model = mocker.patch("core.core.RetrievalModel")
     core_app._set_model()
-    mock_retrieval_model.assert_called_once_with(core_app.vectors_path)
+    mock_retrieval_model.assert_called_once_with(
+        core_app.vectors_path,
+        workers=core_app.workers,
+        search_mode="exact",
+        ann_lists=None,
+        ann_nprobe=8,
+        quantization=None,
+    )
     assert core_app.rm is not None
 
 
-def test_create_vectors_dictionary(mocker, core_app):
+def test_build_index(mocker, core_app):
+    mock_rm_instance = mocker.Mock()
+    core_app.rm = mock_rm_instance
+    core_app.records_columns = iter(
+        [{"podcast_ids": np.array(["1"]), "texts": ["info1"]}]
+    )
+    core_app.podcasts_count = 1
+    mocker.patch("core.core.compute_model_fingerprint", return_value="model")
+    base = MagicMock()
+    index = core_app._build_index("abc", "vectors.npy", base)
+    mock_rm_instance.build_index_from_batches.assert_called_once_with(
+        core_app.records_columns, 1, "abc", "vectors.npy", base=base
+    )
+    assert index == mock_rm_instance.build_index_from_batches.return_value
+    assert index.model_fingerprint == "model"
+
+
+def test_load_or_build_index_loads_existing_index(mocker, core_app):
     mock_retrieval_model = mocker.patch("core.core.RetrievalModel")
     mock_rm_instance = mock_retrieval_model.return_value
-    core_app.records_dictionary = {
-        "1": {
-            "itunes_url": "https://example.com",
-            "average_rating": 4.5,
-            "text": "info1",
-        },
-        "2": {
-            "itunes_url": "https://example.com",
-            "average_rating": 4.2,
-            "text": "info2",
-        },
-    }
-    core_app._create_vectors_dictionary()
-    mock_retrieval_model.assert_called_once_with(core_app.vectors_path)
-    mock_rm_instance.compute_vectors_dict.assert_called_once_with(
-        core_app.records_dictionary
+    mock_index = mocker.patch("core.core.DocumentIndex")
+    mocker.patch("core.core.compute_fingerprint", return_value="abc")
+    mock_get_records = mocker.patch.object(core_app, "_get_records_from_database")
+
+    core_app._load_or_build_index()
+
+    mock_index.load.assert_called_once_with(core_app.index_path, "abc")
+    mock_rm_instance.load_index.assert_called_once_with(mock_index.load.return_value)
+    mock_get_records.assert_not_called()
+
+
+def test_load_or_build_index_builds_missing_index(mocker, core_app, tmp_path):
+    core_app.index_path = str(tmp_path)
+    mock_retrieval_model = mocker.patch("core.core.RetrievalModel")
+    mock_rm_instance = mock_retrieval_model.return_value
+    mock_index = mocker.patch("core.core.DocumentIndex")
+    saved_index = MagicMock()
+    mock_index.load.side_effect = [None, None, saved_index]
+    mocker.patch("core.core.compute_fingerprint", return_value="abc")
+    mocker.patch("core.core.compute_model_fingerprint", return_value="model")
+    mock_get_records = mocker.patch.object(core_app, "_get_records_from_database")
+    mock_transform = mocker.patch.object(core_app, "_transform_records_from_database")
+    vectors_path = os.path.join(str(tmp_path), ".abc.vectors.npy")
+    built_index = MagicMock()
+
+    def build_index(fingerprint, path, base):
+        open(path, "wb").close()
+        return built_index
+
+    mock_build_index = mocker.patch.object(
+        core_app, "_build_index", side_effect=build_index
+    )
+    stages = []
+
+    core_app._load_or_build_index(progress=stages.append)
+
+    mock_get_records.assert_called_once()
+    mock_transform.assert_called_once()
+    mock_index.find_latest.assert_called_once_with(core_app.index_path, "model", "abc")
+    mock_build_index.assert_called_once_with(
+        "abc", vectors_path, mock_index.find_latest.return_value
+    )
+    built_index.save.assert_called_once_with(core_app.index_path)
+    assert not os.path.exists(vectors_path)
+    mock_rm_instance.load_index.assert_called_once_with(saved_index)
+    assert core_app.records_columns is None
+    assert core_app.index_built
+    assert core_app.base_fingerprint == mock_index.find_latest.return_value.fingerprint
+    assert stages == [
+        "reading records",
+        "building index",
+        "saving index",
+        "loading index",
+    ]
+
+
+def test_load_or_build_index_loads_index_built_while_waiting(
+    mocker, core_app, tmp_path
+):
+    core_app.index_path = str(tmp_path)
+    mock_retrieval_model = mocker.patch("core.core.RetrievalModel")
+    mock_rm_instance = mock_retrieval_model.return_value
+    mock_index = mocker.patch("core.core.DocumentIndex")
+    built_index = MagicMock()
+    mock_index.load.side_effect = [None, built_index]
+    mocker.patch("core.core.compute_fingerprint", return_value="abc")
+    mock_get_records = mocker.patch.object(core_app, "_get_records_from_database")
+    mock_build_index = mocker.patch.object(core_app, "_build_index")
+    stages = []
+
+    core_app._load_or_build_index(progress=stages.append)
+
+    mock_get_records.assert_not_called()
+    mock_build_index.assert_not_called()
+    mock_rm_instance.load_index.assert_called_once_with(built_index)
+    assert stages == ["loading index"]
+
+
+def test_load_or_build_index_rebuilds_existing_index(mocker, core_app, tmp_path):
+    core_app.index_path = str(tmp_path)
+    mocker.patch("core.core.RetrievalModel")
+    mock_index = mocker.patch("core.core.DocumentIndex")
+    mocker.patch("core.core.compute_fingerprint", return_value="abc")
+    mocker.patch.object(core_app, "_get_records_from_database")
+    mocker.patch.object(core_app, "_transform_records_from_database")
+    mock_build_index = mocker.patch.object(core_app, "_build_index")
+
+    core_app.load(rebuild=True)
+
+    mock_build_index.assert_called_once_with(
+        "abc", os.path.join(str(tmp_path), ".abc.vectors.npy"), None
+    )
+    mock_index.find_latest.assert_not_called()
+    mock_index.load.assert_called_once_with(core_app.index_path, "abc")
+
+
+def test_prune_indexes(mocker, core_app):
+    mock_index = mocker.patch("core.core.DocumentIndex")
+    core_app.rm = MagicMock()
+    core_app.rm.index.fingerprint = "new"
+
+    assert core_app.prune_indexes() == []
+    mock_index.prune.assert_not_called()
+
+    core_app.index_built = True
+    core_app.base_fingerprint = "base"
+    assert core_app.prune_indexes(keep=["old"]) == mock_index.prune.return_value
+    mock_index.prune.assert_called_once_with(
+        core_app.index_path, {"new", "base", "old"}
     )
 
 
@@ -163,22 +322,95 @@ def test_serialize(core_app):
 
 
 def test_main_logic(mocker, core_app):
-    mock_get_records_from_database = mocker.patch.object(
-        core_app, "_get_records_from_database"
-    )
-    mock_transform_records_from_database = mocker.patch.object(
-        core_app, "_transform_records_from_database"
-    )
-    mock_create_vectors_dictionary = mocker.patch.object(
-        core_app, "_create_vectors_dictionary"
-    )
+    mock_load_or_build_index = mocker.patch.object(core_app, "_load_or_build_index")
     mock_get_ranking = mocker.patch.object(core_app, "_get_ranking")
     mock_get_ranking.return_value = "ranks"
 
     result = core_app.main_logic()
 
-    mock_get_records_from_database.assert_called_once()
-    mock_transform_records_from_database.assert_called_once()
-    mock_create_vectors_dictionary.assert_called_once()
+    mock_load_or_build_index.assert_called_once()
     mock_get_ranking.assert_called_once()
     assert result == "ranks"
+
+
+def test_search(core_app):
+    core_app.rm = MagicMock()
+    core_app.rm.rankings.return_value = [["url1", 0.9]]
+
+    result = core_app.search("query", 3, boost_mode=True, min_score=4.0)
+
+    core_app.rm.rankings.assert_called_once_with(
+        "query",
+        top_n=3,
+        boost_mode=True,
+        min_score=4.0,
+        max_score=None,
+        min_date=None,
+        max_date=None,
+        min_ratings_count=None,
+        categories=None,
+    )
+    assert result == json.dumps([["url1", 0.9]], indent=4)
+
+
+def test_search_batch(core_app):
+    core_app.rm = MagicMock()
+    core_app.rm.rankings_batch.return_value = [[["url1", 0.9]], []]
+
+    result = core_app.search_batch(["first", "second"], [3, 1], min_score=4.0)
+
+    core_app.rm.rankings_batch.assert_called_once_with(
+        ["first", "second"],
+        top_n=[3, 1],
+        boost_mode=False,
+        min_score=4.0,
+        max_score=None,
+        min_date=None,
+        max_date=None,
+        min_ratings_count=None,
+        categories=None,
+    )
+    assert result == [json.dumps([["url1", 0.9]], indent=4), json.dumps([], indent=4)]
+
+
+def test_get_ranking(mocker, core_app):
+    mock_search = mocker.patch.object(core_app, "search", return_value="ranks")
+
+    assert core_app._get_ranking() == "ranks"
+    mock_search.assert_called_once_with(
+        core_app.query,
+        core_app.top_n,
+        boost_mode=core_app.boost_mode,
+        min_score=core_app.min_score,
+        max_score=core_app.max_score,
+        min_date=core_app.min_date,
+        max_date=core_app.max_date,
+        min_ratings_count=core_app.min_ratings_count,
+        categories=core_app.categories,
+    )
+
+
+def test_warm_up(core_app):
+    core_app.rm = MagicMock()
+    core_app.warm_up(["first", "second"])
+    assert core_app.rm.rankings.call_count == 4
+
+
+def test_rank(core_app):
+    core_app.rm = MagicMock()
+    core_app.rm.rankings.return_value = [(0, 0.9), (3, 0.8)]
+
+    assert core_app.rank("query", 2, min_score=4.0) == [(0, 0.9), (3, 0.8)]
+    core_app.rm.rankings.assert_called_once_with(
+        "query", top_n=2, boost_mode=False, rows=True, min_score=4.0
+    )
+
+
+def test_rank_batch(core_app):
+    core_app.rm = MagicMock()
+    core_app.rm.rankings_batch.return_value = [[(0, 0.9)], []]
+
+    assert core_app.rank_batch(["first", "second"], 1) == [[(0, 0.9)], []]
+    core_app.rm.rankings_batch.assert_called_once_with(
+        ["first", "second"], top_n=1, boost_mode=False, rows=True
+    )
@@ -1,13 +1,15 @@
 import os
 import sys
+import threading
 
 import duckdb
+import numpy as np
 import pytest
 
 sys.path.append(os.getcwd())
 from unittest.mock import MagicMock, patch
 
-from data.database import Database
+from data.database import Database, QueryWorker, close_query_workers, get_query_worker
 
 
 @pytest.fixture
@@ -98,15 +100,145 @@ def test_join_and_select(db):
     # Assert correct project call on table1 and table2
     mock_table2.project.assert_called_with("podcast_id, slug")
 
-    # Assert filter call on selected_table2
-    mock_selected_table2.filter.assert_called_with(
-        "average_rating >= 1 AND average_rating <= 5 AND scraped_at >= '2019-07-07' AND scraped_at <= '2019-07-07'"
+    # Assert filter call on selected_table2, with the values bound as constants
+    (condition,), _ = mock_selected_table2.filter.call_args
+    assert str(condition) == str(
+        (duckdb.ColumnExpression("average_rating") >= duckdb.ConstantExpression(1))
+        & (duckdb.ColumnExpression("average_rating") <= duckdb.ConstantExpression(5))
+        & (
+            duckdb.ColumnExpression("scraped_at")
+            >= duckdb.ConstantExpression("2019-07-07")
+        )
+        & (
+            duckdb.ColumnExpression("scraped_at")
+            <= duckdb.ConstantExpression("2019-07-07")
+        )
     )
 
     # Assert join call
     mock_selected_table1.join.assert_called_with(mock_filtered_table2, "podcast_id")
 
 
+def test_join_and_select_reuses_projections(db):
+    db.join_and_select("categories", "podcasts", "podcast_id", ["a"], ["b"])
+    db.join_and_select(
+        "categories", "podcasts", "podcast_id", ["a"], ["b"], min_filter=4.0
+    )
+
+    assert db.connection.table.call_count == 2
+
+
+@pytest.fixture
+def podcasts_db(tmp_path):
+    connection = duckdb.connect(str(tmp_path / "podcasts.db"))
+    connection.execute(
+        "CREATE TABLE podcasts AS SELECT range::VARCHAR AS podcast_id, "
+        "range / 2.0 AS average_rating, "
+        "TIMESTAMP '2019-07-07' + INTERVAL (range % 3) DAY AS scraped_at "
+        "FROM range(10)"
+    )
+    connection.execute(
+        "CREATE TABLE categories AS SELECT range::VARCHAR AS podcast_id, "
+        "'Arts' AS category FROM range(10)"
+    )
+    db = Database(str(tmp_path / "podcasts.db"), verbose=False, connection=connection)
+    yield db
+    connection.close()
+
+
+def test_join_and_select_filters(podcasts_db):
+    def join(**filters):
+        return podcasts_db.join_and_select(
+            "categories",
+            "podcasts",
+            "podcast_id",
+            ["podcast_id", "category"],
+            ["podcast_id", "average_rating", "scraped_at"],
+            **filters,
+        )
+
+    assert len(join().fetchall()) == 10
+    assert sorted(
+        row[0] for row in join(min_filter=3.0, max_filter=4.0).fetchall()
+    ) == [
+        "6",
+        "7",
+        "8",
+    ]
+    assert len(join(min_date="2019-07-08", max_date="2019-07-08").fetchall()) == 3
+
+
+def test_join_and_select_binds_values(podcasts_db):
+    joined = podcasts_db.join_and_select(
+        "categories",
+        "podcasts",
+        "podcast_id",
+        ["podcast_id", "category"],
+        ["podcast_id", "scraped_at"],
+        min_date="2019-07-07' OR 1=1 --",
+    )
+
+    with pytest.raises(duckdb.Error):
+        joined.fetchall()
+
+
+def test_fetch_columns(podcasts_db):
+    columns = podcasts_db.fetch_columns(
+        "podcasts", ["podcast_id", "average_rating", "scraped_at"]
+    )
+
+    assert list(columns) == ["podcast_id", "average_rating", "scraped_at"]
+    assert columns["average_rating"].dtype == np.float64
+    assert columns["average_rating"].tolist() == [row / 2 for row in range(10)]
+    assert np.issubdtype(columns["scraped_at"].dtype, np.datetime64)
+    assert podcasts_db.fetch_columns("podcasts", "podcast_id")["podcast_id"][3] == "3"
+
+
+def test_fetch_column_batches(podcasts_db):
+    podcasts_db.connection.execute(
+        "INSERT INTO categories VALUES ('3', 'News'), ('3', 'Music'), ('3', 'Games')"
+    )
+
+    count, batches = podcasts_db.fetch_column_batches(
+        "categories",
+        ["podcast_id", "category"],
+        key="podcast_id",
+        batch_size=3,
+        order_by="podcast_id, category",
+    )
+    batches = list(batches)
+
+    assert count == 10
+    assert [batch["podcast_id"].tolist() for batch in batches] == [
+        ["0", "1", "2"],
+        ["3", "3", "3", "3"],
+        ["4", "5", "6"],
+        ["7", "8", "9"],
+    ]
+    assert batches[1]["category"].tolist() == ["Arts", "Games", "Music", "News"]
+
+
+def test_fetch_column_batches_matches_fetch_columns(podcasts_db):
+    columns = ["podcast_id", "average_rating", "scraped_at"]
+
+    count, batches = podcasts_db.fetch_column_batches(
+        "podcasts", columns, key="podcast_id", batch_size=4
+    )
+    batches = list(batches)
+    expected = podcasts_db.fetch_columns("podcasts", columns)
+
+    assert count == 10
+    for name in columns:
+        values = np.concatenate([batch[name] for batch in batches])
+        assert values.dtype == expected[name].dtype
+        assert values.tolist() == expected[name].tolist()
+
+
+def test_fetch_columns_invalid_table(db):
+    with pytest.raises(ValueError):
+        db.fetch_columns(42, ["podcast_id"])
+
+
 def test_add_composed_column(db):
     mock_table = MagicMock()
     mock_project = mock_table.project
@@ -118,6 +250,19 @@ def test_add_composed_column(db):
     )
 
 
+def test_add_composed_column_keep_columns(db):
+    mock_table = MagicMock()
+    mock_table.columns = ["podcast_id", "category", "slug"]
+
+    db.add_composed_column(
+        mock_table, ["category", "slug"], "full_info", keep_columns=["category"]
+    )
+
+    mock_table.project.assert_called_once_with(
+        "podcast_id, category, COALESCE(category, '') || ' ' || COALESCE(slug, '') AS full_info"
+    )
+
+
 def test_fetch_column_records(db):
     mock_table = db.connection.table.return_value
     mock_project = mock_table.project.return_value
@@ -134,3 +279,80 @@ def test_fetch_column_records(db):
 
     mock_relation.project.assert_called_with("column1, column2")
     mock_relation.project().fetchall.assert_called_once()
+
+
+def test_shared_connection_is_not_closed():
+    connection = MagicMock()
+    db = Database("unused.db", verbose=False, connection=connection)
+
+    db.close_connection()
+
+    assert db.connection is connection
+    connection.close.assert_not_called()
+
+
+@pytest.fixture
+def database_file(tmp_path):
+    path = str(tmp_path / "podcasts.db")
+    connection = duckdb.connect(path)
+    connection.execute("CREATE TABLE podcasts AS SELECT range AS id FROM range(10)")
+    connection.close()
+    yield path
+    close_query_workers()
+
+
+def test_query_worker_runs_queries_in_its_thread(database_file):
+    worker = QueryWorker(database_file, threads=2, memory_limit="256MB")
+
+    count, thread_name = worker.run(
+        lambda connection: (
+            connection.execute("SELECT count(*) FROM podcasts").fetchone()[0],
+            threading.current_thread().name,
+        )
+    )
+    threads = worker.run(
+        lambda connection: connection.execute(
+            "SELECT current_setting('threads')"
+        ).fetchone()[0]
+    )
+    worker.close()
+
+    assert count == 10
+    assert thread_name.startswith("duckdb")
+    assert threads == 2
+
+
+def test_query_worker_is_read_only(database_file):
+    worker = QueryWorker(database_file)
+
+    with pytest.raises(duckdb.Error):
+        worker.run(lambda connection: connection.execute("DELETE FROM podcasts"))
+    worker.close()
+
+
+def test_get_query_worker_is_shared(database_file):
+    worker = get_query_worker(database_file)
+
+    assert get_query_worker(database_file) is worker
+    assert get_query_worker(database_file, threads=1) is not worker
+
+
+def test_get_query_worker_reopens_changed_database(database_file):
+    worker = get_query_worker(database_file)
+    worker.close()
+    connection = duckdb.connect(database_file)
+    connection.execute("INSERT INTO podcasts VALUES (10)")
+    connection.close()
+    os.utime(database_file, ns=(0, 0))
+
+    reopened = get_query_worker(database_file)
+
+    assert reopened is not worker
+    assert (
+        reopened.run(
+            lambda connection: connection.execute(
+                "SELECT count(*) FROM podcasts"
+            ).fetchone()[0]
+        )
+        == 11
+    )
@@ -0,0 +1,34 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.append(os.getcwd())
+from model.encoding import build_doc_term_matrix, encode_documents
+
+
+def test_build_doc_term_matrix():
+    key_to_index = {"a": 0, "b": 1}
+    doc_term = build_doc_term_matrix(
+        [["a", "b", "a", "oov"], [], ["oov"]], key_to_index
+    )
+
+    assert doc_term.shape == (3, 2)
+    assert np.allclose(doc_term.toarray(), [[0.5, 0.25], [0.0, 0.0], [0.0, 0.0]])
+
+
+def test_encode_documents_matches_mean():
+    table = SimpleNamespace(
+        key_to_index={"a": 0, "b": 1},
+        vectors=np.array([[1.0, 2.0], [3.0, 5.0]], dtype=np.float32),
+    )
+    token_lists = [["a", "b", "oov"], ["b"], []]
+
+    vectors = encode_documents(token_lists, table)
+
+    assert vectors.dtype == np.float32
+    expected = np.mean([[1.0, 2.0], [3.0, 5.0], [0.0, 0.0]], axis=0)
+    assert np.allclose(vectors[0], expected)
+    assert np.allclose(vectors[1], [3.0, 5.0])
+    assert np.array_equal(vectors[2], [0.0, 0.0])
@@ -1,4 +1,3 @@
-import json
 import os
 import sys
 
@@ -77,21 +76,21 @@ def test_search_podcasts(client, setup_environment):
     assert "top_n_results" in response_json
     assert "ranks" in response_json
     assert isinstance(response_json["top_n_results"], int)
-    assert isinstance(response_json["ranks"], str)
+    assert isinstance(response_json["ranks"], list)
 
     # Additional assertions depending on expected results
     response_ranks = response_json["ranks"]
-    response_ranks = json.loads(response_ranks)
     assert response_json["top_n_results"] == setup_environment["top_n"]
     assert len(response_ranks) == setup_environment["top_n"]
-    assert type(response_ranks[0][0]) == str  # Assert url is valid
-    assert type(response_ranks[0][1][0]) == float  # Assert score is valid
+    assert type(response_ranks[0]["id"]) == str  # Assert id is valid
+    assert type(response_ranks[0]["url"]) == str  # Assert url is valid
+    assert type(response_ranks[0]["score"]) == float  # Assert score is valid
     assert (
-        response_ranks[0][1]
-        > response_ranks[1][1]
-        > response_ranks[2][1]
-        > response_ranks[3][1]
-        > response_ranks[4][1]
+        response_ranks[0]["score"]
+        > response_ranks[1]["score"]
+        > response_ranks[2]["score"]
+        > response_ranks[3]["score"]
+        > response_ranks[4]["score"]
     )  # Assert results are valid
 
 
@@ -105,7 +104,6 @@ def test_boost_mode_difference(client, setup_environment):
     assert response_no_boost.status_code == 200
     response_no_boost_json = response_no_boost.json()
     response_no_boost_ranks = response_no_boost_json["ranks"]
-    response_no_boost_ranks = json.loads(response_no_boost_ranks)
 
     # Prepare payload with boost_mode=True
     payload_with_boost = setup_environment.copy()
@@ -116,7 +114,6 @@ def test_boost_mode_difference(client, setup_environment):
     assert response_with_boost.status_code == 200
     response_with_boost_json = response_with_boost.json()
     response_with_boost_ranks = response_with_boost_json["ranks"]
-    response_with_boost_ranks = json.loads(response_with_boost_ranks)
 
     # Validate that results are different
     assert response_no_boost_ranks != response_with_boost_ranks
@@ -0,0 +1,91 @@
+import asyncio
+import math
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.append(os.getcwd())
+from core.executor import BoundedExecutor, QueueFullError
+
+
+@pytest.fixture
+def executor():
+    executor = BoundedExecutor(workers=1, max_queue=1)
+    yield executor
+    executor.shutdown()
+
+
+def test_invalid_kind():
+    with pytest.raises(ValueError):
+        BoundedExecutor(kind="fiber")
+
+
+def test_run(executor):
+    assert asyncio.run(executor.run(pow, 2, 10)) == 1024
+
+    stats = executor.stats()
+    assert stats["submitted"] == 1
+    assert stats["completed"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["wait_seconds"]["max"] >= 0.0
+
+
+def test_run_does_not_block_event_loop(executor):
+    release = threading.Event()
+
+    async def scenario():
+        task = asyncio.ensure_future(executor.run(release.wait, 5))
+        await asyncio.sleep(0.01)
+        assert not task.done()
+        release.set()
+        return await task
+
+    assert asyncio.run(scenario()) is True
+
+
+def test_queue_full(executor):
+    release = threading.Event()
+    running = executor.submit(release.wait, 5)
+    queued = executor.submit(release.wait, 5)
+
+    with pytest.raises(QueueFullError):
+        executor.submit(release.wait, 5)
+    stats = executor.stats()
+    assert stats["in_flight"] == 2
+    assert stats["queue_depth"] == 1
+    assert stats["rejected"] == 1
+
+    release.set()
+    running.result(5)
+    queued.result(5)
+    assert asyncio.run(executor.run(pow, 2, 2)) == 4
+
+
+def test_failed_task(executor):
+    with pytest.raises(ValueError):
+        asyncio.run(executor.run(int, "not a number"))
+    assert executor.stats()["failed"] == 1
+    assert executor.stats()["in_flight"] == 0
+
+
+def test_restart(executor):
+    release = threading.Event()
+    running = executor.submit(release.wait, 5)
+
+    executor.restart()
+    assert asyncio.run(executor.run(pow, 2, 3)) == 8
+    release.set()
+    assert running.result(5)[1] is True
+    assert executor.stats()["restarts"] == 1
+    assert executor.stats()["completed"] == 2
+
+
+def test_process_pool():
+    executor = BoundedExecutor(workers=1, max_queue=1, kind="process")
+    try:
+        assert asyncio.run(executor.run(math.sqrt, 16.0)) == 4.0
+        assert executor.stats()["kind"] == "process"
+    finally:
+        executor.shutdown()
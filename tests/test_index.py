@@ -0,0 +1,268 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.getcwd())
+from model.ann import IVFIndex
+from model.index import (
+    DocumentIndex,
+    compute_fingerprint,
+    compute_model_fingerprint,
+    content_hashes,
+    group_pairs,
+    group_rows,
+    records_to_columns,
+    to_datetime64,
+)
+from model.quantization import ScalarQuantizer
+from model.vectors import EmbeddingTable
+from utils.common import file_lock
+
+
+@pytest.fixture
+def index():
+    return DocumentIndex(
+        vectors=np.arange(6, dtype=np.float32).reshape(2, 3),
+        norms=np.ones(2, dtype=np.float32),
+        podcast_ids=np.array(["a", "b"]),
+        itunes_urls=np.array(["url_a", "url_b"]),
+        average_ratings=np.array([4.5, 3.0]),
+        scraped_at=to_datetime64(["2019-07-07 10:00:00", "2019-07-08 11:00:00"]),
+        fingerprint="abc",
+    )
+
+
+def test_compute_fingerprint(tmp_path):
+    db_path = tmp_path / "database.db"
+    db_path.write_bytes(b"data")
+    config = {"tokenizer": "test"}
+
+    fingerprint = compute_fingerprint(str(db_path), str(tmp_path / "missing"), config)
+    assert fingerprint == compute_fingerprint(
+        str(db_path), str(tmp_path / "missing"), config
+    )
+    assert fingerprint != compute_fingerprint(
+        str(db_path), str(tmp_path / "missing"), {"tokenizer": "other"}
+    )
+
+    db_path.write_bytes(b"more data")
+    assert fingerprint != compute_fingerprint(
+        str(db_path), str(tmp_path / "missing"), config
+    )
+
+
+def test_compute_model_fingerprint(tmp_path):
+    config = {"tokenizer": "test"}
+    fingerprint = compute_model_fingerprint(str(tmp_path / "missing"), config)
+
+    assert fingerprint == compute_model_fingerprint(str(tmp_path / "missing"), config)
+    assert fingerprint != compute_model_fingerprint(
+        str(tmp_path / "missing"), {"tokenizer": "other"}
+    )
+
+
+def test_content_hashes():
+    scraped_at = to_datetime64(["2019-07-07 10:00:00"] * 2)
+    hashes = content_hashes(["text a", "text b"], scraped_at)
+
+    assert hashes.dtype == np.uint64
+    assert hashes[0] != hashes[1]
+    assert np.array_equal(hashes, content_hashes(["text a", "text b"], scraped_at))
+    assert (
+        content_hashes(["text a"], to_datetime64(["2019-07-08 10:00:00"]))[0]
+        != hashes[0]
+    )
+
+
+def test_to_datetime64():
+    result = to_datetime64(["2019-07-07 10:00:00", "2019-07-08T11:00:00-07:00"])
+    assert result.dtype == np.dtype("datetime64[s]")
+    assert result[1] == np.datetime64("2019-07-08T11:00:00")
+
+
+def test_from_records():
+    records_dictionary = {
+        "a": {
+            "itunes_url": "url_a",
+            "average_rating": 4.5,
+            "scraped_at": "2019-07-07 10:00:00",
+            "text": "text",
+        }
+    }
+    index = DocumentIndex.from_records(np.full((1, 3), 2.0), records_dictionary, "abc")
+    assert len(index) == 1
+    assert index.vectors.dtype == np.float32
+    assert np.allclose(np.linalg.norm(index.vectors, axis=1), 1.0)
+    assert index.norms[0] == pytest.approx(np.sqrt(12))
+    assert index.podcast_ids[0] == "a"
+    assert index.itunes_urls[0] == "url_a"
+
+
+def test_from_records_with_attributes():
+    records_dictionary = {
+        "a": {
+            "itunes_url": "url_a",
+            "average_rating": 4.5,
+            "scraped_at": "2019-07-07 10:00:00",
+            "ratings_count": 12,
+            "categories": ["News", "Arts"],
+            "text": "text",
+        },
+        "b": {
+            "itunes_url": "url_b",
+            "average_rating": 3.0,
+            "scraped_at": "2019-07-07 10:00:00",
+            "ratings_count": None,
+            "categories": ["News"],
+            "text": "text",
+        },
+    }
+    index = DocumentIndex.from_records(np.ones((2, 3)), records_dictionary, "abc")
+
+    assert list(index.ratings_counts) == [12, 0]
+    assert list(index.category_names) == ["Arts", "News"]
+    assert list(index.category_mask(["Arts"])) == [True, False]
+    assert list(index.category_mask(["News", "Missing"])) == [True, True]
+    assert not index.category_mask(["Missing"]).any()
+
+
+def test_group_rows():
+    names, offsets, rows = group_rows([["b", "a"], [], ["b", "b"]])
+    assert list(names) == ["a", "b"]
+    assert list(offsets) == [0, 1, 3]
+    assert list(rows) == [0, 0, 2]
+
+    names, offsets, rows = group_rows([])
+    assert len(names) == 0
+    assert list(offsets) == [0]
+    assert len(rows) == 0
+
+
+def test_group_pairs():
+    names, offsets, rows = group_pairs(["b", "a", "b", "b", "a"], [2, 0, 0, 2, 0])
+    assert list(names) == ["a", "b"]
+    assert list(offsets) == [0, 1, 3]
+    assert list(rows) == [0, 0, 2]
+
+
+def test_from_columns_matches_from_records():
+    records_dictionary = {
+        "a": {
+            "itunes_url": "url_a",
+            "average_rating": 4.5,
+            "scraped_at": "2019-07-07 10:00:00",
+            "ratings_count": 12,
+            "categories": ["News", "Arts"],
+            "text": "text a",
+        },
+        "b": {
+            "itunes_url": None,
+            "average_rating": 3.0,
+            "scraped_at": "2019-07-08 10:00:00",
+            "ratings_count": None,
+            "categories": [],
+            "text": "text b",
+        },
+    }
+    vectors = np.arange(6, dtype=np.float32).reshape(2, 3) + 1
+    columns = records_to_columns(records_dictionary)
+
+    assert columns["texts"] == ["text a", "text b"]
+    expected = DocumentIndex.from_records(vectors, records_dictionary, "abc")
+    index = DocumentIndex.from_columns(vectors, columns, "abc")
+    for name in DocumentIndex.ARRAYS:
+        assert np.array_equal(getattr(index, name), getattr(expected, name))
+
+
+def test_save_and_load(tmp_path, index):
+    directory = index.save(str(tmp_path))
+    assert directory == os.path.join(str(tmp_path), "abc")
+
+    loaded = DocumentIndex.load(str(tmp_path), "abc")
+    assert isinstance(loaded.vectors, np.memmap)
+    assert np.array_equal(loaded.vectors, index.vectors)
+    assert list(loaded.podcast_ids) == ["a", "b"]
+    assert list(loaded.average_ratings) == [4.5, 3.0]
+    assert loaded.itunes_urls[1] == "url_b"
+    assert list(loaded.ratings_counts) == [0, 0]
+    assert len(loaded.category_names) == 0
+    assert loaded.ann is None
+    assert list(loaded.content_hashes) == [0, 0]
+
+
+def test_find_latest(tmp_path, index):
+    assert DocumentIndex.find_latest(str(tmp_path / "missing"), "model") is None
+    index.model_fingerprint = "model"
+    index.save(str(tmp_path))
+    index.fingerprint = "def"
+    index.save(str(tmp_path))
+    os.utime(os.path.join(str(tmp_path), "abc", DocumentIndex.MANIFEST), (0, 0))
+    index.fingerprint = "other"
+    index.model_fingerprint = "other model"
+    index.save(str(tmp_path))
+
+    assert DocumentIndex.find_latest(str(tmp_path), "model").fingerprint == "def"
+    latest = DocumentIndex.find_latest(str(tmp_path), "model", exclude="def")
+    assert latest.fingerprint == "abc"
+    assert latest.model_fingerprint == "model"
+    assert DocumentIndex.find_latest(str(tmp_path), "missing") is None
+
+
+def test_prune(tmp_path, index):
+    index_path = str(tmp_path)
+    for fingerprint in ["abc", "base", "old", "building"]:
+        index.fingerprint = fingerprint
+        index.save(index_path)
+        open(os.path.join(index_path, f".{fingerprint}.lock"), "w").close()
+    open(os.path.join(index_path, ".stale.lock"), "w").close()
+    open(os.path.join(index_path, ".stale.vectors.npy"), "w").close()
+    os.mkdir(os.path.join(index_path, ".stale-x1y2"))
+    os.mkdir(os.path.join(index_path, "unknown"))
+
+    with file_lock(os.path.join(index_path, ".building.lock")):
+        removed = DocumentIndex.prune(index_path, ["abc", "base"])
+
+    assert removed == ["old"]
+    assert sorted(os.listdir(index_path)) == [
+        ".abc.lock",
+        ".base.lock",
+        ".building.lock",
+        "abc",
+        "base",
+        "building",
+        "unknown",
+    ]
+    assert DocumentIndex.prune(str(tmp_path / "missing"), []) == []
+
+
+def test_save_and_load_embeddings(tmp_path, index):
+    index.embeddings = EmbeddingTable(["word"], np.ones((1, 3), dtype=np.float32))
+    index.save(str(tmp_path))
+
+    loaded = DocumentIndex.load(str(tmp_path), "abc")
+    assert loaded.embeddings.index_to_key == ["word"]
+    assert isinstance(loaded.embeddings.vectors, np.memmap)
+
+
+def test_load_missing_index(tmp_path):
+    assert DocumentIndex.load(str(tmp_path), "missing") is None
+
+
+def test_save_and_load_ann(tmp_path, index):
+    index.ann = IVFIndex.build(index.vectors, n_lists=2)
+    index.save(str(tmp_path))
+
+    loaded = DocumentIndex.load(str(tmp_path), "abc")
+    assert np.array_equal(loaded.ann.centroids, index.ann.centroids)
+    assert np.array_equal(loaded.ann.list_rows, index.ann.list_rows)
+
+
+def test_save_and_load_quantized(tmp_path, index):
+    index.quantized = ScalarQuantizer.build(index.vectors)
+    index.save(str(tmp_path))
+
+    loaded = DocumentIndex.load(str(tmp_path), "abc")
+    assert isinstance(loaded.quantized, ScalarQuantizer)
+    assert np.array_equal(loaded.quantized.codes, index.quantized.codes)
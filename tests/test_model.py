@@ -1,26 +1,33 @@
 import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock, patch
 
 import numpy as np
 import pytest
 
 sys.path.append(os.getcwd())
+from model.ann import IVFRanker
+from model.index import DocumentIndex, records_to_columns
 from model.model import RetrievalModel
+from model.vectors import EmbeddingTable
 
 
 @pytest.fixture
 def retrieval_model():
     with patch("model.model.gensim") as mock_gensim, patch(
         "model.model.nltk"
-    ) as mock_nltk, patch("model.model.scipy") as mock_scipy:
+    ) as mock_nltk:
 
         # Mocking gensim KeyedVectors
         mock_keyed_vectors = MagicMock()
         mock_gensim.models.KeyedVectors.load_word2vec_format.return_value = (
             mock_keyed_vectors
         )
-        mock_keyed_vectors.key_to_index = {"test": 0}
+        mock_keyed_vectors.key_to_index = {"test": 0, "frequent": 1, "rare": 2}
+        mock_keyed_vectors.index_to_key = ["test", "frequent", "rare"]
+        mock_keyed_vectors.vectors = np.ones((3, 300), dtype=np.float32)
         mock_keyed_vectors.get_vector.return_value = np.array([1.0] * 300)
 
         # Mocking nltk downloads
@@ -31,19 +38,15 @@ def retrieval_model():
             "in",
             "and",
         ]
-        mock_nltk.word_tokenize = MagicMock(side_effect=lambda text: text.split())
 
-        # Mocking scipy distance
-        mock_scipy.spatial.distance.cosine = MagicMock(return_value=0.1)
-
-        model = RetrievalModel(vectors_path="/mock/path")
+        model = RetrievalModel(vectors_path="/mock/path", query_vocab_size=2)
 
         yield model
 
 
-def test_create_stopwords(retrieval_model):
-    retrieval_model._create_stopwords()
-    assert retrieval_model.stopword_list == ["the", "is", "in", "and"]
+def test_create_tokenizer(retrieval_model):
+    retrieval_model._create_tokenizer()
+    assert retrieval_model.tokenizer.stopwords == {"the", "is", "in", "and"}
 
 
 def test_load_vectors(retrieval_model):
@@ -51,19 +54,45 @@ def test_load_vectors(retrieval_model):
     assert retrieval_model.model is not None
 
 
-def test_data_clean(retrieval_model):
-    retrieval_model._create_stopwords()
+def test_load_vectors_native(retrieval_model):
+    with patch("model.model.EmbeddingTable") as mock_table, patch(
+        "model.model.file_signature", return_value=[1, 2]
+    ):
+        mock_table.exists.return_value = True
+        mock_table.load_manifest.return_value = {
+            "source": [1, 2],
+            "limit": retrieval_model.TOKENIZER_CONFIG["vectors_limit"],
+        }
+        retrieval_model._load_vectors()
+
+        mock_table.load.assert_called_once_with(retrieval_model.native_vectors_path)
+        assert retrieval_model.model == mock_table.load.return_value
+
 
-    text = ["This", "is", "a", "test-", "example"]
-    cleaned_text = retrieval_model._data_clean(text)
-    assert cleaned_text == "This a test example"
+def test_load_vectors_stale_native(retrieval_model):
+    with patch("model.model.EmbeddingTable") as mock_table, patch(
+        "model.model.file_signature", return_value=[1, 3]
+    ):
+        mock_table.exists.return_value = True
+        mock_table.load_manifest.return_value = {
+            "source": [1, 2],
+            "limit": retrieval_model.TOKENIZER_CONFIG["vectors_limit"],
+        }
+        retrieval_model._load_vectors()
+
+        mock_table.load.assert_not_called()
 
 
-def test_tokenize_text(retrieval_model):
-    retrieval_model._create_stopwords()
-    text = "This is a test example"
-    tokenized_text = retrieval_model._tokenize_text(text)
-    assert tokenized_text == "This a test example"
+@pytest.mark.parametrize("limit", [None, 10])
+def test_load_vectors_native_other_limit(retrieval_model, limit):
+    with patch("model.model.EmbeddingTable") as mock_table, patch(
+        "model.model.file_signature", return_value=[1, 2]
+    ):
+        mock_table.exists.return_value = True
+        mock_table.load_manifest.return_value = {"source": [1, 2], "limit": limit}
+        retrieval_model._load_vectors()
+
+        mock_table.load.assert_not_called()
 
 
 def test_embeddings(retrieval_model):
@@ -75,50 +104,450 @@ def test_embeddings(retrieval_model):
     assert np.array_equal(embedding, np.array([1.0] * 300))
 
 
-def test_compute_vectors_dict(retrieval_model):
+def test_build_index(retrieval_model):
     records_dictionary = {
-        "1": {"itunes_url": "url1", "average_rating": 4.5, "text": "test text"}
+        "1": {
+            "itunes_url": "url1",
+            "average_rating": 4.5,
+            "scraped_at": "2019-07-07 10:00:00",
+            "text": "test text",
+        }
     }
-    retrieval_model.compute_vectors_dict(records_dictionary)
-
-    assert "1" in retrieval_model.vectors_dict
-    assert retrieval_model.vectors_dict["1"]["itunes_url"] == "url1"
-    assert retrieval_model.vectors_dict["1"]["average_rating"] == 4.5
-    assert retrieval_model.vectors_dict["1"]["average_vector"].shape == (300,)
+    index = retrieval_model.build_index(records_dictionary, "abc")
 
+    assert list(index.podcast_ids) == ["1"]
+    assert index.itunes_urls[0] == "url1"
+    assert index.average_ratings[0] == 4.5
+    assert index.vectors.shape == (1, 300)
+    # "test" is embedded and "text" is out of vocabulary, so the average is half the vector
+    assert index.norms[0] == pytest.approx(np.linalg.norm(np.full(300, 0.5)))
 
-def test_get_similarity(retrieval_model):
-    query_embedding = np.array([1.0] * 300)
-    average_vec = np.array([1.0] * 300)
-    similarity = retrieval_model._get_similarity(query_embedding, average_vec)
-    assert similarity[0] == 1 - 0.1
 
-
-def test_rankings_no_boost(retrieval_model):
-    retrieval_model._load_vectors()
-    retrieval_model.vectors_dict = {
+def test_build_index_empty_text(retrieval_model):
+    records_dictionary = {
         "1": {
             "itunes_url": "url1",
             "average_rating": 4.5,
-            "average_vector": np.array([1.0] * 300),
+            "scraped_at": "2019-07-07 10:00:00",
+            "text": "the is",
         }
     }
-    ranks = retrieval_model.rankings(query="test", top_n=1, boost_mode=False)
+    index = retrieval_model.build_index(records_dictionary, "abc")
+
+    assert np.array_equal(index.vectors[0], np.zeros(300))
+    assert index.norms[0] == 0.0
+
+
+def _load_test_index(retrieval_model):
+    index = retrieval_model.build_index(
+        {
+            "1": {
+                "itunes_url": "url1",
+                "average_rating": 4.5,
+                "scraped_at": "2019-07-07 10:00:00",
+                "text": "test",
+            },
+            "2": {
+                "itunes_url": "url2",
+                "average_rating": 2.0,
+                "scraped_at": "2019-07-09 10:00:00",
+                "text": "test unknown",
+            },
+            "3": {
+                "itunes_url": "url3",
+                "average_rating": 5.0,
+                "scraped_at": "2019-07-09 10:00:00",
+                "text": "unknown",
+            },
+        },
+        "abc",
+    )
+    retrieval_model.load_index(index)
+
+
+def test_build_index_and_load_index(retrieval_model):
+    _load_test_index(retrieval_model)
+
+    assert retrieval_model.index.fingerprint == "abc"
+    assert retrieval_model.index.vectors.dtype == np.float32
+    assert len(retrieval_model.index) == 3
+    assert retrieval_model.ranker.index is retrieval_model.index
+
+
+def test_prune_vectors(retrieval_model):
+    _load_test_index(retrieval_model)
+
+    embeddings = retrieval_model.index.embeddings
+    assert embeddings.index_to_key == ["test", "frequent"]
+    assert retrieval_model.model is embeddings
+
+
+def test_index_config(retrieval_model):
+    config = retrieval_model.index_config()
+    assert config["query_vocab_size"] == 2
+    assert config["vectors_limit"] == RetrievalModel.TOKENIZER_CONFIG["vectors_limit"]
+
+
+def test_embeddings_fallback(retrieval_model):
+    _load_test_index(retrieval_model)
+    fallback_model = MagicMock()
+    fallback_model.key_to_index = {"rare": 0}
+    fallback_model.get_vector.return_value = np.full(300, 2.0)
+
+    with patch.object(
+        retrieval_model, "_native_vectors_available", return_value=True
+    ), patch("model.model.EmbeddingTable.load", return_value=fallback_model):
+        assert np.array_equal(retrieval_model._embeddings("rare"), np.full(300, 2.0))
+        assert np.array_equal(retrieval_model._embeddings("missing"), np.zeros(300))
+
+
+def test_embeddings_fallback_concurrent_load(retrieval_model):
+    _load_test_index(retrieval_model)
+    fallback_model = MagicMock()
+    fallback_model.key_to_index = {"rare": 0}
+    fallback_model.get_vector.return_value = np.full(300, 2.0)
+
+    def slow_load(path):
+        time.sleep(0.05)
+        return fallback_model
+
+    with patch.object(
+        retrieval_model, "_native_vectors_available", return_value=True
+    ), patch("model.model.EmbeddingTable.load", side_effect=slow_load) as mock_load:
+        with ThreadPoolExecutor(4) as pool:
+            vectors = list(pool.map(retrieval_model._embeddings, ["rare"] * 4))
+
+    mock_load.assert_called_once()
+    assert all(np.array_equal(vector, np.full(300, 2.0)) for vector in vectors)
+
+
+def test_embeddings_fallback_disabled(retrieval_model):
+    _load_test_index(retrieval_model)
+    retrieval_model.query_fallback = False
+
+    with patch.object(
+        retrieval_model, "_native_vectors_available", return_value=True
+    ), patch("model.model.EmbeddingTable.load") as mock_load:
+        assert np.array_equal(retrieval_model._embeddings("rare"), np.zeros(300))
+        mock_load.assert_not_called()
+
+
+def test_rankings_no_boost(retrieval_model):
+    _load_test_index(retrieval_model)
+    ranks = retrieval_model.rankings(query="test", top_n=2, boost_mode=False)
+    assert len(ranks) == 2
+    assert [url for url, _ in ranks] == ["url1", "url2"]
+    assert ranks[0][1] == [pytest.approx(1.0)]
+
+
+def test_rankings_with_boost(retrieval_model):
+    _load_test_index(retrieval_model)
+    ranks = retrieval_model.rankings(query="test", top_n=1, boost_mode=True)
     assert len(ranks) == 1
     assert ranks[0][0] == "url1"
-    assert ranks[0][1] == [1 - 0.1]
+    assert ranks[0][1] == pytest.approx(4.5)
 
 
-def test_rankings_with_boost(retrieval_model):
-    retrieval_model._load_vectors()
-    retrieval_model.vectors_dict = {
-        "1": {
-            "itunes_url": "url1",
+def test_rankings_rows(retrieval_model):
+    _load_test_index(retrieval_model)
+    ranks = retrieval_model.rankings(query="test", top_n=2, boost_mode=False, rows=True)
+    assert [row for row, _ in ranks] == [0, 1]
+    assert ranks[0][1] == pytest.approx(1.0)
+
+    batch_ranks = retrieval_model.rankings_batch(
+        ["test", "unknown"], top_n=1, boost_mode=True, rows=True
+    )
+    assert batch_ranks == [[(0, pytest.approx(4.5))], []]
+
+
+def test_rankings_zero_norm_document(retrieval_model):
+    _load_test_index(retrieval_model)
+    ranks = retrieval_model.rankings(query="test", top_n=3, boost_mode=True)
+    assert ranks[-1] == ("url3", 0.0)
+
+
+def test_rankings_query_is_cleaned(retrieval_model):
+    _load_test_index(retrieval_model)
+    ranks = retrieval_model.rankings(
+        query="The TEST, is it?", top_n=1, boost_mode=False
+    )
+    assert ranks[0] == ("url1", [pytest.approx(1.0)])
+
+
+def test_rankings_out_of_vocabulary_query(retrieval_model):
+    _load_test_index(retrieval_model)
+    assert retrieval_model.rankings(query="unknown", top_n=3, boost_mode=False) == []
+
+
+def test_rankings_with_filters(retrieval_model):
+    _load_test_index(retrieval_model)
+    ranks = retrieval_model.rankings(
+        query="test", top_n=5, boost_mode=False, min_score=3.0, max_score=4.8
+    )
+    assert [url for url, _ in ranks] == ["url1"]
+
+    ranks = retrieval_model.rankings(
+        query="test", top_n=5, boost_mode=False, min_date="2019-07-08"
+    )
+    assert [url for url, _ in ranks] == ["url2", "url3"]
+
+
+def test_rankings_batch(retrieval_model):
+    _load_test_index(retrieval_model)
+    queries = ["test", "unknown", "The TEST"]
+
+    batch_ranks = retrieval_model.rankings_batch(
+        queries,
+        top_n=[2, 3, 5],
+        boost_mode=[False, False, True],
+        min_score=[None, None, 3.0],
+    )
+
+    assert batch_ranks[0] == [
+        ("url1", [pytest.approx(1.0)]),
+        ("url2", [pytest.approx(1.0)]),
+    ]
+    assert batch_ranks[1] == []
+    assert batch_ranks[2] == [("url1", pytest.approx(4.5)), ("url3", 0.0)]
+
+
+def test_rankings_batch_shared_settings(retrieval_model):
+    _load_test_index(retrieval_model)
+
+    batch_ranks = retrieval_model.rankings_batch(
+        ["test", "test"], top_n=5, boost_mode=False, min_date="2019-07-08"
+    )
+    assert [[url for url, _ in ranks] for ranks in batch_ranks] == [
+        ["url2", "url3"],
+        ["url2", "url3"],
+    ]
+
+    with pytest.raises(ValueError):
+        retrieval_model.rankings_batch(["test", "test"], top_n=[1], boost_mode=False)
+
+
+def _load_test_index_with_categories(retrieval_model):
+    index = retrieval_model.build_index(
+        {
+            "1": {
+                "itunes_url": "url1",
+                "average_rating": 4.5,
+                "scraped_at": "2019-07-07 10:00:00",
+                "ratings_count": 40,
+                "categories": ["Arts", "News"],
+                "text": "test",
+            },
+            "2": {
+                "itunes_url": "url2",
+                "average_rating": 2.0,
+                "scraped_at": "2019-07-09 10:00:00",
+                "ratings_count": 3,
+                "categories": ["News"],
+                "text": "test unknown",
+            },
+        },
+        "abc",
+    )
+    retrieval_model.load_index(index)
+
+
+def test_rankings_with_ratings_count_and_categories(retrieval_model):
+    _load_test_index_with_categories(retrieval_model)
+
+    ranks = retrieval_model.rankings(
+        query="test", top_n=5, boost_mode=False, min_ratings_count=10
+    )
+    assert [url for url, _ in ranks] == ["url1"]
+
+    ranks = retrieval_model.rankings(
+        query="test", top_n=5, boost_mode=False, categories=["News"]
+    )
+    assert [url for url, _ in ranks] == ["url1", "url2"]
+
+    ranks = retrieval_model.rankings(
+        query="test", top_n=5, boost_mode=False, categories=["Arts", "Comedy"]
+    )
+    assert [url for url, _ in ranks] == ["url1"]
+
+
+def test_rankings_batch_categories(retrieval_model):
+    _load_test_index_with_categories(retrieval_model)
+
+    shared = retrieval_model.rankings_batch(
+        ["test", "test"], top_n=5, boost_mode=False, categories=["Arts", "Comedy"]
+    )
+    per_query = retrieval_model.rankings_batch(
+        ["test", "test"], top_n=5, boost_mode=False, categories=[["Arts"], None]
+    )
+
+    assert [[url for url, _ in ranks] for ranks in shared] == [["url1"], ["url1"]]
+    assert [[url for url, _ in ranks] for ranks in per_query] == [
+        ["url1"],
+        ["url1", "url2"],
+    ]
+
+
+def test_build_index_parallel(retrieval_model):
+    retrieval_model.workers = 2
+    retrieval_model.model = None
+    table = MagicMock(spec=EmbeddingTable)
+    table.key_to_index = {"test": 0}
+    table.index_to_key = ["test"]
+    table.vectors = np.ones((1, 300), dtype=np.float32)
+
+    with patch.object(
+        retrieval_model,
+        "_load_vectors",
+        side_effect=lambda: setattr(retrieval_model, "model", table),
+    ), patch("model.model.encode_documents_parallel") as mock_parallel:
+        mock_parallel.return_value = (np.ones((1, 300), dtype=np.float32), {"test"})
+        index = retrieval_model.build_index(
+            {
+                "1": {
+                    "itunes_url": "url1",
+                    "average_rating": 4.5,
+                    "scraped_at": "2019-07-07 10:00:00",
+                    "text": "test",
+                }
+            },
+            "abc",
+        )
+
+    texts, tokenize, table_path, workers, shard_size = mock_parallel.call_args[0]
+    assert texts == ["test"]
+    assert tokenize == retrieval_model.tokenizer.tokenize
+    assert table_path == retrieval_model.native_vectors_path
+    assert workers == 2
+    assert index.embeddings.index_to_key == ["test"]
+
+
+def test_build_index_from_batches_matches_build_index(retrieval_model, tmp_path):
+    records_dictionary = {
+        str(row): {
+            "itunes_url": f"url{row}",
             "average_rating": 4.5,
-            "average_vector": np.array([1.0] * 300),
+            "scraped_at": "2019-07-07 10:00:00",
+            "categories": ["Arts"] if row % 2 else [],
+            "text": text,
         }
+        for row, text in enumerate(["test", "test rare", "the", "frequent test"])
     }
-    ranks = retrieval_model.rankings(query="test", top_n=1, boost_mode=True)
-    assert len(ranks) == 1
-    assert ranks[0][0] == "url1"
-    assert ranks[0][1] == (1 - 0.1) * 4.5
+    expected = retrieval_model.build_index(records_dictionary, "abc")
+    batches = [
+        records_to_columns(dict(list(records_dictionary.items())[:3])),
+        records_to_columns(dict(list(records_dictionary.items())[3:])),
+    ]
+    vectors_path = str(tmp_path / "vectors.npy")
+
+    index = retrieval_model.build_index_from_batches(batches, 4, "abc", vectors_path)
+
+    assert isinstance(index.vectors, np.memmap)
+    assert index.vectors.filename == vectors_path
+    for name in DocumentIndex.ARRAYS:
+        assert np.array_equal(getattr(index, name), getattr(expected, name))
+    assert index.embeddings.index_to_key == expected.embeddings.index_to_key
+    with pytest.raises(ValueError):
+        retrieval_model.build_index_from_batches(batches, 3, "abc", vectors_path)
+
+
+def test_build_index_from_batches_reuses_base(retrieval_model, tmp_path):
+    def record(text):
+        return {
+            "itunes_url": "url",
+            "average_rating": 4.5,
+            "scraped_at": "2019-07-07 10:00:00",
+            "text": text,
+        }
+
+    base = retrieval_model.build_index(
+        {"1": record("test"), "2": record("rare"), "3": record("test rare")}, "old"
+    )
+    records_dictionary = {
+        "1": record("test"),
+        "2": record("frequent"),
+        "4": record("rare"),
+    }
+    expected = retrieval_model.build_index(records_dictionary, "new")
+
+    with patch.object(
+        retrieval_model.tokenizer,
+        "tokenize_batch",
+        wraps=retrieval_model.tokenizer.tokenize_batch,
+    ) as mock_tokenize:
+        with patch.object(retrieval_model, "_create_tokenizer"):
+            index = retrieval_model.build_index_from_batches(
+                [records_to_columns(records_dictionary)],
+                3,
+                "new",
+                str(tmp_path / "vectors.npy"),
+                base=base,
+            )
+
+    mock_tokenize.assert_called_once_with(["frequent", "rare"])
+    for name in DocumentIndex.ARRAYS:
+        assert np.array_equal(getattr(index, name), getattr(expected, name))
+    assert index.embeddings.index_to_key == ["test", "frequent", "rare"]
+
+
+def test_embed_query_is_cached(retrieval_model):
+    _load_test_index(retrieval_model)
+    first = retrieval_model._embed_query("The  TEST")
+
+    with patch.object(retrieval_model.tokenizer, "tokenize") as mock_tokenize:
+        second = retrieval_model._embed_query("the test")
+        mock_tokenize.assert_not_called()
+
+    assert second is first
+    assert not first.flags.writeable
+    assert retrieval_model.query_cache.stats()["hits"] == 1
+
+
+def test_query_cache_cleared_when_vectors_change(retrieval_model):
+    _load_test_index(retrieval_model)
+    retrieval_model._embed_query("test")
+    assert len(retrieval_model.query_cache) == 1
+
+    _load_test_index(retrieval_model)
+    assert len(retrieval_model.query_cache) == 0
+
+
+def test_invalid_search_mode():
+    with pytest.raises(ValueError):
+        RetrievalModel(vectors_path="/mock/path", search_mode="hnsw")
+
+
+def test_index_config_ivf(retrieval_model):
+    retrieval_model.search_mode = "ivf"
+    retrieval_model.ann_lists = 2
+    assert retrieval_model.index_config()["ann"] == {"type": "ivf", "n_lists": 2}
+
+
+def test_rankings_ivf(retrieval_model):
+    retrieval_model.search_mode = "ivf"
+    retrieval_model.ann_nprobe = 1
+    _load_test_index(retrieval_model)
+
+    assert retrieval_model.index.ann is not None
+    assert isinstance(retrieval_model.ranker, IVFRanker)
+    ranks = retrieval_model.rankings(query="test", top_n=2, boost_mode=False)
+    assert ranks == retrieval_model.rankings(
+        query="test", top_n=2, boost_mode=False, exact=True
+    )
+
+
+def test_invalid_quantization():
+    with pytest.raises(ValueError):
+        RetrievalModel(vectors_path="/mock/path", quantization="float16")
+
+
+@pytest.mark.parametrize("quantization", ["int8", "pq"])
+def test_rankings_quantized(retrieval_model, quantization):
+    retrieval_model.quantization = quantization
+    retrieval_model.pq_subvectors = 30
+    _load_test_index(retrieval_model)
+
+    assert retrieval_model.index_config()["quantization"]["type"] == quantization
+    assert retrieval_model.index.quantized is not None
+    ranks = retrieval_model.rankings(query="test", top_n=3, boost_mode=False)
+    assert [url for url, _ in ranks] == ["url1", "url2", "url3"]
+    assert ranks[0][1] == [pytest.approx(1.0, abs=0.01)]
@@ -0,0 +1,60 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.getcwd())
+from core.pages import ResultSnapshots, make_cursor, parse_cursor
+
+
+@pytest.fixture
+def snapshots():
+    return ResultSnapshots(maxsize=2, ttl=None)
+
+
+def test_pages(snapshots):
+    ranks = [[f"url{i}", [1.0 - i / 10]] for i in range(7)]
+    snapshot_id = snapshots.create(ranks, page_size=3, encoder=None)
+
+    first = snapshots.page(make_cursor(snapshot_id, 0))
+    assert first["ranks"] == ranks[:3]
+    assert first["total_results"] == 7
+    second = snapshots.page(first["next_cursor"])
+    assert second["offset"] == 3
+    assert second["ranks"] == ranks[3:6]
+    last = snapshots.page(second["next_cursor"])
+    assert last["ranks"] == ranks[6:]
+    assert last["next_cursor"] is None
+    assert last["encoder"] is None
+
+
+def test_page_with_limit(snapshots):
+    snapshot_id = snapshots.create(list(range(10)), page_size=3, encoder=None)
+    page = snapshots.page(make_cursor(snapshot_id, 2), limit=5)
+    assert page["ranks"] == [2, 3, 4, 5, 6]
+    assert page["next_cursor"] == make_cursor(snapshot_id, 7)
+
+
+def test_page_past_the_end(snapshots):
+    snapshot_id = snapshots.create(list(range(3)), page_size=3, encoder=None)
+    page = snapshots.page(make_cursor(snapshot_id, 5))
+    assert page["ranks"] == []
+    assert page["next_cursor"] is None
+
+
+def test_missing_and_evicted_snapshots(snapshots):
+    with pytest.raises(KeyError):
+        snapshots.page(make_cursor("unknown", 0))
+
+    first = snapshots.create([1], page_size=1, encoder=None)
+    snapshots.create([2], page_size=1, encoder=None)
+    snapshots.create([3], page_size=1, encoder=None)
+    with pytest.raises(KeyError):
+        snapshots.page(make_cursor(first, 0))
+
+
+def test_parse_cursor():
+    assert parse_cursor("abc-12") == ("abc", 12)
+    for cursor in ("abc", "abc-", "-3", "abc-x"):
+        with pytest.raises(ValueError):
+            parse_cursor(cursor)
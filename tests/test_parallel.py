@@ -0,0 +1,54 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.getcwd())
+from model.encoding import encode_documents
+from model.parallel import (
+    create_encoding_pool,
+    encode_batch_parallel,
+    encode_documents_parallel,
+)
+from model.vectors import EmbeddingTable
+
+
+def test_encode_documents_parallel_matches_serial(tmp_path):
+    rng = np.random.default_rng(0)
+    words = [f"word{i}" for i in range(50)]
+    table = EmbeddingTable(words, rng.normal(size=(50, 8)).astype(np.float32))
+    table_path = table.save(str(tmp_path / "table"))
+    texts = [
+        " ".join(rng.choice(words + ["oov"], size=rng.integers(0, 12)))
+        for _ in range(37)
+    ]
+
+    vectors, vocabulary = encode_documents_parallel(
+        texts, str.split, table_path, workers=2, shard_size=5
+    )
+
+    token_lists = [text.split() for text in texts]
+    assert np.array_equal(vectors, encode_documents(token_lists, table))
+    assert vocabulary == set().union(*token_lists)
+
+
+def test_encode_batch_parallel_writes_to_file(tmp_path):
+    rng = np.random.default_rng(1)
+    words = [f"word{i}" for i in range(20)]
+    table = EmbeddingTable(words, rng.normal(size=(20, 4)).astype(np.float32))
+    table_path = table.save(str(tmp_path / "table"))
+    texts = [" ".join(rng.choice(words, size=rng.integers(1, 6))) for _ in range(9)]
+    output_path = str(tmp_path / "vectors.npy")
+    np.lib.format.open_memmap(output_path, mode="w+", dtype=np.float32, shape=(9, 4))
+
+    pool = create_encoding_pool(str.split, table_path, output_path, workers=2)
+    try:
+        vocabulary = encode_batch_parallel(pool, texts[:4], 0, shard_size=3)
+        vocabulary |= encode_batch_parallel(pool, texts[4:], 4, shard_size=3)
+    finally:
+        pool.close()
+        pool.join()
+
+    token_lists = [text.split() for text in texts]
+    assert np.array_equal(np.load(output_path), encode_documents(token_lists, table))
+    assert vocabulary == set().union(*token_lists)
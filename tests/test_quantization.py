@@ -0,0 +1,121 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.getcwd())
+from model.quantization import ProductQuantizer, QuantizedVectors, ScalarQuantizer
+from model.ranking import normalize_rows
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    vectors = normalize_rows(rng.normal(size=(500, 12)))[0]
+    vectors[7] = 0.0
+    return vectors
+
+
+@pytest.fixture
+def query(vectors):
+    return normalize_rows(vectors[:1] + vectors[1:2])[0][0]
+
+
+def test_scalar_quantizer(vectors, query):
+    quantizer = ScalarQuantizer.build(vectors)
+
+    assert quantizer.codes.dtype == np.int8
+    assert len(quantizer) == 500
+    scores = quantizer.score(query)
+    assert scores.dtype == np.float32
+    assert np.allclose(scores, vectors @ query, atol=0.02)
+    assert scores[7] == 0.0
+
+
+def test_scalar_quantizer_rows(vectors, query):
+    quantizer = ScalarQuantizer.build(vectors)
+    quantizer.CHUNK_SIZE = 64
+    rows = np.array([5, 400, 3])
+
+    assert np.allclose(quantizer.score(query, rows), quantizer.score(query)[rows])
+    assert len(quantizer.score(query, np.empty(0, dtype=np.int64))) == 0
+
+
+def test_scalar_quantizer_blocks(mocker, tmp_path, vectors):
+    expected = ScalarQuantizer.build(vectors)
+    path = str(tmp_path / "vectors.npy")
+    np.save(path, vectors)
+    mocker.patch.object(ScalarQuantizer, "CHUNK_SIZE", 64)
+
+    quantizer = ScalarQuantizer.build(np.load(path, mmap_mode="r"))
+
+    assert quantizer.scales.dtype == np.float32
+    assert np.array_equal(quantizer.scales, expected.scales)
+    assert np.array_equal(quantizer.codes, expected.codes)
+    assert len(ScalarQuantizer.build(vectors[:0])) == 0
+
+
+def test_product_quantizer(vectors, query):
+    quantizer = ProductQuantizer.build(vectors, n_subvectors=4, n_centroids=64)
+
+    assert quantizer.codes.shape == (4, 500)
+    assert len(quantizer) == 500
+    assert quantizer.codes.dtype == np.uint8
+    assert quantizer.codebooks.shape == (4, 64, 3)
+    scores = quantizer.score(query)
+    assert np.corrcoef(scores, vectors @ query)[0, 1] > 0.9
+    rows = np.array([9, 2])
+    assert np.allclose(quantizer.score(query, rows), scores[rows])
+
+
+def test_product_quantizer_exact_with_enough_centroids():
+    vectors = normalize_rows(np.eye(4))[0]
+    quantizer = ProductQuantizer.build(vectors, n_subvectors=2)
+
+    assert quantizer.codebooks.shape[1] == 4
+    assert np.allclose(quantizer.score(vectors[2]), [0.0, 0.0, 1.0, 0.0])
+
+
+def test_product_quantizer_invalid_subvectors(vectors):
+    with pytest.raises(ValueError):
+        ProductQuantizer.build(vectors, n_subvectors=5)
+
+
+@pytest.mark.parametrize(
+    "quantizer_class, options",
+    [(ScalarQuantizer, {}), (ProductQuantizer, {"n_subvectors": 4})],
+)
+def test_save_and_load(tmp_path, vectors, query, quantizer_class, options):
+    quantizer = quantizer_class.build(vectors, **options)
+    directory = str(tmp_path / "quantized")
+    quantizer.save(directory)
+
+    assert QuantizedVectors.exists(directory)
+    loaded = QuantizedVectors.load(directory)
+    assert isinstance(loaded, quantizer_class)
+    assert isinstance(loaded.codes, np.memmap)
+    assert np.array_equal(loaded.score(query), quantizer.score(query))
+
+
+@pytest.mark.parametrize(
+    "quantizer_class, options",
+    [(ScalarQuantizer, {}), (ProductQuantizer, {"n_subvectors": 4})],
+)
+def test_score_batch(vectors, query, quantizer_class, options):
+    quantizer = quantizer_class.build(vectors, **options)
+    queries = np.stack([query, vectors[3], np.zeros(12, dtype=np.float32)])
+
+    scores = quantizer.score_batch(queries)
+    assert scores.shape == (3, 500)
+    assert scores.dtype == np.float32
+    for i, row in enumerate(queries):
+        assert np.allclose(scores[i], quantizer.score(row), atol=1e-5)
+        assert np.allclose(
+            scores[i], QuantizedVectors.score_batch(quantizer, queries)[i], atol=1e-5
+        )
+
+
+def test_quantized_vectors_requires_score():
+    with pytest.raises(TypeError):
+        QuantizedVectors()
@@ -0,0 +1,92 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.append(os.getcwd())
+from model.quantization import ScalarQuantizer
+from model.ranking import MatrixRanker, normalize_rows, select_top_n, select_top_n_rows
+
+
+def test_normalize_rows():
+    vectors = np.array([[3.0, 4.0], [0.0, 0.0], [np.nan, 1.0]])
+    normalized, norms = normalize_rows(vectors)
+
+    assert normalized.dtype == np.float32
+    assert np.allclose(normalized[0], [0.6, 0.8])
+    assert np.array_equal(normalized[1], [0.0, 0.0])
+    assert np.array_equal(normalized[2], [0.0, 0.0])
+    assert list(norms) == [5.0, 0.0, 0.0]
+
+
+def test_select_top_n():
+    scores = np.array([0.1, 0.9, 0.5, 0.7])
+    assert list(select_top_n(scores, 2)) == [1, 3]
+    assert list(select_top_n(scores, 10)) == [1, 3, 2, 0]
+    assert list(select_top_n(scores, 2, candidates=np.array([0, 2]))) == [2, 0]
+    assert len(select_top_n(scores, 0)) == 0
+
+
+def test_select_top_n_rows():
+    scores = np.array([[0.1, 0.9, 0.5, 0.7], [0.8, 0.2, 0.6, 0.4]])
+    assert select_top_n_rows(scores, 2).tolist() == [[1, 3], [0, 2]]
+    assert select_top_n_rows(scores, 10).tolist() == [[1, 3, 2, 0], [0, 2, 3, 1]]
+    assert select_top_n_rows(scores, 0).shape == (2, 0)
+
+
+def test_matrix_ranker():
+    vectors, _ = normalize_rows(np.array([[1.0, 0.0], [1.0, 1.0], [0.0, 0.0]]))
+    index = SimpleNamespace(
+        vectors=vectors, average_ratings=np.array([1.0, 4.0, 5.0]), quantized=None
+    )
+    ranker = MatrixRanker(index)
+
+    ranks = ranker.rank(np.array([2.0, 0.0]), top_n=3, boost_mode=False)
+    assert [row for row, _ in ranks] == [0, 1, 2]
+    assert np.isclose(ranks[1][1], np.sqrt(0.5))
+
+    ranks = ranker.rank(np.array([2.0, 0.0]), top_n=1, boost_mode=True)
+    assert ranks[0][0] == 1
+
+    mask = np.array([False, True, True])
+    ranks = ranker.rank(np.array([2.0, 0.0]), top_n=3, boost_mode=False, mask=mask)
+    assert [row for row, _ in ranks] == [1, 2]
+
+    assert ranker.rank(np.zeros(2), top_n=3, boost_mode=False) == []
+
+
+def test_matrix_ranker_quantized():
+    vectors, _ = normalize_rows(np.array([[1.0, 0.0], [1.0, 1.0], [0.0, 1.0]]))
+    index = SimpleNamespace(
+        vectors=None,
+        average_ratings=np.ones(3),
+        quantized=ScalarQuantizer.build(vectors),
+    )
+
+    ranks = MatrixRanker(index).rank(np.array([1.0, 0.2]), top_n=3, boost_mode=False)
+    assert [row for row, _ in ranks] == [0, 1, 2]
+
+
+def test_matrix_ranker_rank_batch():
+    vectors, _ = normalize_rows(np.array([[1.0, 0.0], [1.0, 1.0], [0.0, 1.0]]))
+    index = SimpleNamespace(
+        vectors=vectors, average_ratings=np.array([1.0, 4.0, 5.0]), quantized=None
+    )
+    ranker = MatrixRanker(index)
+    ranker.BATCH_SIZE = 2
+    queries = np.array([[2.0, 0.0], [0.0, 1.0], [0.0, 0.0], [1.0, 0.2]])
+    top_n = [3, 1, 3, 2]
+    boost_mode = [False, True, False, False]
+    masks = [None, None, None, np.array([False, True, True])]
+
+    batch_ranks = ranker.rank_batch(queries, top_n, boost_mode, masks)
+
+    assert len(batch_ranks) == 4
+    for ranks, args in zip(batch_ranks, zip(queries, top_n, boost_mode, masks)):
+        expected = ranker.rank(*args)
+        assert [row for row, _ in ranks] == [row for row, _ in expected]
+        assert np.allclose([s for _, s in ranks], [s for _, s in expected])
+    assert batch_ranks[2] == []
+    assert ranker.rank_batch(np.zeros((0, 2)), [], [], []) == []
+    assert ranker.rank_batch(queries[:1], [-1], [False], [None]) == [[]]
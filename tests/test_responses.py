@@ -0,0 +1,90 @@
+import json
+import os
+import sys
+from uuid import uuid4
+
+import msgpack
+import numpy as np
+import pytest
+
+sys.path.append(os.getcwd())
+from core.responses import JSON, MSGPACK, Encoded, ResultEncoder, encode, negotiate
+
+
+@pytest.fixture
+def encoder():
+    return ResultEncoder(
+        np.array(["id0", "id1", "id2"]),
+        np.array(["url0", 'url"1', "url2"]),
+    )
+
+
+RANKS = [(2, 0.75), (1, 0.5)]
+RESULTS = [
+    {"id": "id2", "url": "url2", "score": 0.75},
+    {"id": "id1", "url": 'url"1', "score": 0.5},
+]
+
+
+def test_encode_json(encoder):
+    encoded = encoder.encode(RANKS)
+    assert isinstance(encoded, Encoded)
+    assert json.loads(encoded) == RESULTS
+    assert json.loads(encoder.encode([])) == []
+
+
+def test_encode_msgpack(encoder):
+    assert msgpack.unpackb(encoder.encode(RANKS, MSGPACK)) == RESULTS
+    assert msgpack.unpackb(encoder.encode([], MSGPACK)) == []
+
+
+def test_fragments_are_reused(encoder):
+    encoder.encode(RANKS)
+    fragment = encoder._fragments[JSON][2]
+    assert json.loads(encoder.encode([(2, 0.25)])) == [dict(RESULTS[0], score=0.25)]
+    assert encoder._fragments[JSON][2] is fragment
+    assert encoder._fragments[MSGPACK] == {}
+
+
+def test_iter_lines(encoder):
+    chunks = list(encoder.iter_lines(RANKS + [(0, 0.25)], chunk_size=2))
+    assert len(chunks) == 2
+    lines = b"".join(chunks).decode().splitlines()
+    assert [json.loads(line) for line in lines][:2] == RESULTS
+    assert list(encoder.iter_lines([])) == []
+
+
+@pytest.mark.parametrize(
+    "accept, media_type",
+    [
+        (None, JSON),
+        ("", JSON),
+        ("*/*", JSON),
+        ("text/html", JSON),
+        ("application/msgpack", MSGPACK),
+        ("application/x-msgpack, application/json;q=0.5", MSGPACK),
+        ("application/msgpack;q=0.2, application/json", JSON),
+        ("application/msgpack;q=bad, */*;q=0.1", JSON),
+    ],
+)
+def test_negotiate(accept, media_type):
+    assert negotiate(accept) == media_type
+
+
+@pytest.mark.parametrize("media_type", [JSON, MSGPACK])
+def test_encode_embeds_encoded_values(encoder, media_type):
+    prediction_id = uuid4()
+    body = {
+        "prediction_id": prediction_id,
+        "predictions": [
+            {"top_n_results": 2, "ranks": encoder.encode(RANKS, media_type)}
+        ],
+        "next_cursor": None,
+    }
+    encoded = encode(body, media_type)
+    decoded = json.loads(encoded) if media_type == JSON else msgpack.unpackb(encoded)
+    assert decoded == {
+        "prediction_id": str(prediction_id),
+        "predictions": [{"top_n_results": 2, "ranks": RESULTS}],
+        "next_cursor": None,
+    }
@@ -0,0 +1,98 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.getcwd())
+from core.results import ResultCache
+
+
+def test_caches_results():
+    cache = ResultCache(maxsize=8)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return "v1", "ranks"
+
+    async def scenario():
+        first = await cache.get_or_compute(("query", 5), "v1", compute)
+        second = await cache.get_or_compute(("query", 5), "v1", compute)
+        return first, second
+
+    assert asyncio.run(scenario()) == (("v1", "ranks"), ("v1", "ranks"))
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_coalesces_concurrent_requests():
+    cache = ResultCache(maxsize=0)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "v1", "ranks"
+
+    async def scenario():
+        return await asyncio.gather(
+            *(cache.get_or_compute(("query", 5), "v1", compute) for _ in range(3))
+        )
+
+    assert asyncio.run(scenario()) == [("v1", "ranks")] * 3
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 2
+    assert cache.stats()["in_flight"] == 0
+    assert cache.stats()["size"] == 0
+
+
+def test_new_index_version_drops_results():
+    cache = ResultCache()
+    versions = iter([("v1", "old"), ("v2", "new")])
+
+    async def compute():
+        return next(versions)
+
+    async def scenario():
+        await cache.get_or_compute(("query",), "v1", compute)
+        return await cache.get_or_compute(("query",), "v2", compute)
+
+    assert asyncio.run(scenario()) == ("v2", "new")
+    assert cache.version == "v2"
+    assert cache.stats()["size"] == 1
+
+
+def test_errors_are_not_cached():
+    cache = ResultCache()
+    outcomes = iter([RuntimeError("boom"), ("v1", "ranks")])
+
+    async def compute():
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute(("query",), "v1", compute)
+        return await cache.get_or_compute(("query",), "v1", compute)
+
+    assert asyncio.run(scenario()) == ("v1", "ranks")
+
+
+def test_results_of_another_version_are_not_cached():
+    cache = ResultCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return "v2", "ranks"
+
+    async def scenario():
+        await cache.get_or_compute(("query",), "v1", compute)
+        return await cache.get_or_compute(("query",), "v1", compute)
+
+    assert asyncio.run(scenario()) == ("v2", "ranks")
+    assert len(calls) == 2
+    assert cache.stats()["size"] == 0
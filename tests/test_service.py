@@ -0,0 +1,178 @@
+import os
+import sys
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+sys.path.append(os.getcwd())
+from core.service import SearchService
+
+
+@pytest.fixture
+def core_app():
+    core_app = MagicMock()
+    core_app.search.return_value = "ranks"
+    return core_app
+
+
+def test_load(core_app):
+    service = SearchService(lambda: core_app, ["warm"])
+    assert service.status() == {"status": "idle", "error": None}
+
+    service.load()
+
+    core_app.load.assert_called_once()
+    core_app.warm_up.assert_called_once_with(["warm"])
+    assert service.ready
+    assert service.status() == {"status": "ready", "error": None}
+
+
+def test_load_failure(core_app):
+    core_app.load.side_effect = OSError("missing index")
+    service = SearchService(lambda: core_app)
+
+    with pytest.raises(OSError):
+        service.load()
+    assert not service.ready
+    assert service.status() == {"status": "failed", "error": "missing index"}
+
+
+def test_start_loads_in_background(core_app):
+    release = threading.Event()
+    core_app.load.side_effect = lambda: release.wait(5)
+    service = SearchService(lambda: core_app)
+
+    service.start()
+    assert not service.wait_ready(0.05)
+    assert service.state == "loading"
+
+    release.set()
+    assert service.wait_ready(5)
+
+
+def test_rank(core_app):
+    core_app.rank.return_value = [(1, 0.9)]
+    service = SearchService(lambda: core_app)
+    with pytest.raises(RuntimeError):
+        service.rank("query", 5)
+
+    service.load()
+    assert service.rank("query", 5, boost_mode=True) == (
+        core_app.rm.index.fingerprint,
+        [(1, 0.9)],
+    )
+    core_app.rank.assert_called_once_with("query", 5, boost_mode=True)
+
+
+def test_rank_batch(core_app):
+    core_app.rank_batch.return_value = [[(1, 0.9)], []]
+    service = SearchService(lambda: core_app)
+    with pytest.raises(RuntimeError):
+        service.rank_batch(["first", "second"], 5)
+
+    service.load()
+    assert service.rank_batch(["first", "second"], 5) == (
+        core_app.rm.index.fingerprint,
+        [[(1, 0.9)], []],
+    )
+    core_app.rank_batch.assert_called_once_with(["first", "second"], 5)
+
+
+def test_encoder(core_app):
+    core_app.rm.index.podcast_ids = ["id0"]
+    core_app.rm.index.itunes_urls = ["url0"]
+    service = SearchService(lambda: core_app)
+    assert service.encoder is None
+
+    service.load()
+    assert service.encoder.encode([(0, 0.5)]) == (
+        b'[{"id":"id0","url":"url0","score":0.5}]'
+    )
+
+
+def test_index_version(core_app):
+    core_app.rm.index.fingerprint = "abc"
+    service = SearchService(lambda: core_app)
+    assert service.index_version is None
+
+    service.load()
+    assert service.index_version == "abc"
+
+
+def _versioned_app(version, url):
+    core_app = MagicMock()
+    core_app.rm.index.fingerprint = version
+    core_app.rm.index.podcast_ids = [f"id-{version}"]
+    core_app.rm.index.itunes_urls = [url]
+    return core_app
+
+
+def test_rebuild_swaps_index(core_app):
+    old_app = _versioned_app("old", "old-url")
+    new_app = _versioned_app("new", "new-url")
+    apps = iter([old_app, new_app])
+    service = SearchService(lambda: next(apps), ["warm"])
+    service.load()
+    on_swap = MagicMock()
+    new_app.load.side_effect = lambda rebuild, progress: progress("loading index")
+
+    assert service.start_rebuild(force=True, on_swap=on_swap)
+    deadline = time.time() + 5
+    while service.rebuild_status()["status"] == "running" and time.time() < deadline:
+        time.sleep(0.01)
+
+    status = service.rebuild_status()
+    assert status["status"] == "succeeded"
+    assert status["stage"] == "swapping"
+    assert status["step"] == status["steps"]
+    assert (status["previous_version"], status["index_version"]) == ("old", "new")
+    new_app.load.assert_called_once()
+    assert new_app.load.call_args.kwargs["rebuild"] is True
+    new_app.warm_up.assert_called_once_with(["warm"])
+    on_swap.assert_called_once()
+    new_app.prune_indexes.assert_called_once_with(keep=["old"])
+    assert service.core_app is new_app
+    assert service.index_version == "new"
+
+    # Rankings of the replaced index are still encoded with its own encoder
+    assert b"old-url" in service.encoder_for("old").encode([(0, 1.0)])
+    assert b"new-url" in service.encoder_for("new").encode([(0, 1.0)])
+
+
+def test_rebuild_failure_keeps_live_index():
+    old_app = _versioned_app("old", "old-url")
+    new_app = _versioned_app("new", "new-url")
+    new_app.load.side_effect = OSError("disk full")
+    apps = iter([old_app, new_app])
+    service = SearchService(lambda: next(apps))
+    service.load()
+
+    assert service.start_rebuild()
+    deadline = time.time() + 5
+    while service.rebuild_status()["status"] == "running" and time.time() < deadline:
+        time.sleep(0.01)
+
+    status = service.rebuild_status()
+    assert status["status"] == "failed"
+    assert status["error"] == "disk full"
+    assert service.core_app is old_app
+    assert service.ready
+
+
+def test_only_one_rebuild_at_a_time(core_app):
+    release = threading.Event()
+    service = SearchService(lambda: core_app)
+    service.load()
+    core_app.load.side_effect = lambda rebuild, progress: release.wait(5)
+
+    assert service.start_rebuild()
+    assert not service.start_rebuild()
+    release.set()
+
+
+def test_encoder_for_unknown_version(core_app):
+    service = SearchService(lambda: core_app)
+    with pytest.raises(RuntimeError):
+        service.encoder_for("unknown")
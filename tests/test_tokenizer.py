@@ -0,0 +1,60 @@
+import os
+import pickle
+import sys
+
+import pytest
+
+sys.path.append(os.getcwd())
+from model.tokenizer import Tokenizer
+
+
+@pytest.fixture
+def tokenizer():
+    return Tokenizer(["the", "is", "in", "and", "do", "it", "s", "can", "not"])
+
+
+def test_tokenize(tokenizer):
+    assert tokenizer.tokenize("This is a test- example") == [
+        "This",
+        "a",
+        "test",
+        "example",
+    ]
+
+
+def test_tokenize_stopwords_are_case_insensitive(tokenizer):
+    assert tokenizer.tokenize("The podcast IS great And fun") == [
+        "podcast",
+        "great",
+        "fun",
+    ]
+
+
+def test_tokenize_punctuation(tokenizer):
+    assert tokenizer.tokenize("news/sports, (comedy)! 1,000 U.S. e-mail") == [
+        "newssports",
+        "comedy",
+        "1000",
+        "US",
+        "e",
+        "mail",
+    ]
+
+
+def test_tokenize_contractions(tokenizer):
+    assert tokenizer.tokenize("Don't miss it's Joe's show, you cannot") == [
+        "nt",
+        "miss",
+        "Joe",
+        "show",
+        "you",
+    ]
+
+
+def test_tokenize_batch(tokenizer):
+    assert tokenizer.tokenize_batch(["the news", "", "in and"]) == [["news"], [], []]
+
+
+def test_tokenizer_is_picklable(tokenizer):
+    restored = pickle.loads(pickle.dumps(tokenizer))
+    assert restored.tokenize("the news") == ["news"]
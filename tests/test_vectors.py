@@ -0,0 +1,65 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from gensim.models import KeyedVectors
+
+sys.path.append(os.getcwd())
+from model.vectors import EmbeddingTable, convert_vectors
+from utils.common import file_signature
+
+
+@pytest.fixture
+def table():
+    return EmbeddingTable(
+        ["hello", "world"], np.arange(6, dtype=np.float32).reshape(2, 3)
+    )
+
+
+def test_lookup(table):
+    assert "hello" in table
+    assert "missing" not in table
+    assert len(table) == 2
+    assert table.vector_size == 3
+    assert table.key_to_index["world"] == 1
+    assert np.array_equal(table.get_vector("world"), [3.0, 4.0, 5.0])
+    with pytest.raises(KeyError):
+        table.get_vector("missing")
+
+
+def test_save_and_load(tmp_path, table):
+    directory = str(tmp_path / "table")
+    assert not EmbeddingTable.exists(directory)
+
+    table.save(directory)
+    assert EmbeddingTable.exists(directory)
+
+    loaded = EmbeddingTable.load(directory)
+    assert isinstance(loaded.vectors, np.memmap)
+    assert not loaded.vectors.flags.writeable
+    assert loaded.index_to_key == ["hello", "world"]
+    assert np.array_equal(loaded.get_vector("hello"), table.get_vector("hello"))
+
+
+def test_convert_vectors(tmp_path):
+    keyed_vectors = KeyedVectors(3)
+    keyed_vectors.add_vectors(["first", "second", "third"], np.eye(3, dtype=np.float32))
+    source_path = str(tmp_path / "vectors.bin.gz")
+    keyed_vectors.save_word2vec_format(source_path, binary=True)
+
+    directory = convert_vectors(source_path, str(tmp_path / "native"), limit=2)
+
+    loaded = EmbeddingTable.load(directory)
+    assert loaded.index_to_key == ["first", "second"]
+    assert np.array_equal(loaded.get_vector("second"), [0.0, 1.0, 0.0])
+    assert loaded.source == file_signature(source_path)
+    assert loaded.limit == 2
+    assert EmbeddingTable.load_manifest(directory)["limit"] == 2
+
+
+def test_from_rows(table):
+    pruned = EmbeddingTable.from_rows(table, [1])
+    assert pruned.index_to_key == ["world"]
+    assert pruned.key_to_index == {"world": 0}
+    assert np.array_equal(pruned.get_vector("world"), [3.0, 4.0, 5.0])
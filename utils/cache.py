@@ -0,0 +1,167 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A bounded, thread-safe least recently used cache.
+
+    When the cache is full, adding a new key evicts the least recently used one. A cache with a
+    size of 0 stores nothing, which disables caching without changing the calling code.
+
+    Attributes:
+        maxsize (int): Maximum number of entries kept in the cache.
+        hits (int): Number of lookups that found their key.
+        misses (int): Number of lookups that did not find their key.
+        evictions (int): Number of entries removed to make room for new ones.
+    """
+
+    def __init__(self, maxsize):
+        """
+        Initializes the LRUCache instance.
+
+        Args:
+            maxsize (int): Maximum number of entries kept in the cache.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """
+        Retrieves the value of a key and marks it as the most recently used.
+
+        Args:
+            key: The key to look up.
+            default: Value returned if the key is not in the cache.
+
+        Returns:
+            The cached value, or `default` if the key is not in the cache.
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """
+        Stores the value of a key, evicting the least recently used entries if the cache is full.
+
+        Args:
+            key: The key to store.
+            value: The value to store.
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Removes every entry from the cache. The counters are kept.
+        """
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        Returns the counters of the cache.
+
+        Returns:
+            dict: Hits, misses, evictions, current size and maximum size of the cache.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+
+class TTLCache(LRUCache):
+    """
+    A bounded, thread-safe least recently used cache whose entries expire.
+
+    An entry older than `ttl` seconds is dropped when it is looked up and counts as a miss.
+    Expired entries that are never looked up again are evicted like any other entry.
+
+    Attributes:
+        ttl (Optional[float]): Number of seconds an entry stays valid. Entries never expire if None.
+        expirations (int): Number of entries dropped because they had expired.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        """
+        Initializes the TTLCache instance.
+
+        Args:
+            maxsize (int): Maximum number of entries kept in the cache.
+            ttl (Optional[float]): Number of seconds an entry stays valid. Entries never expire if None.
+        """
+        super().__init__(maxsize)
+        self.ttl = ttl
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """
+        Retrieves the value of a key that has not expired and marks it as the most recently used.
+
+        Args:
+            key: The key to look up.
+            default: Value returned if the key is not in the cache or has expired.
+
+        Returns:
+            The cached value, or `default` if the key is not in the cache or has expired.
+        """
+        with self._lock:
+            if key in self._data:
+                expires_at, value = self._data[key]
+                if expires_at is None or time.monotonic() < expires_at:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """
+        Stores the value of a key for `ttl` seconds, evicting the least recently used entries if
+        the cache is full.
+
+        Args:
+            key: The key to store.
+            value: The value to store.
+        """
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        super().put(key, (expires_at, value))
+
+    def stats(self):
+        """
+        Returns the counters of the cache.
+
+        Returns:
+            dict: Hits, misses, evictions, expirations, current size, maximum size and time to
+            live of the cache.
+        """
+        stats = super().stats()
+        with self._lock:
+            stats.update(expirations=self.expirations, ttl=self.ttl)
+        return stats
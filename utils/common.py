@@ -1,6 +1,12 @@
 import logging
 import os
 import zipfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
 
 
 # Function to configure logger
@@ -58,6 +64,26 @@ def ensure_directory_exists(directory_path):
     return directory_path
 
 
+# Function to build a cheap signature of a file
+def file_signature(path):
+    """
+    Builds a cheap signature of a file from its size and modification time.
+
+    Hashing the full content of `database.db` or the vectors file would take longer than
+    the work it is meant to save, so the stat information is used instead.
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        list: Size and modification time of the file, or None if the file does not exist.
+    """
+    if not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
 # Function to extract a zip file
 def extract_zip(zip_path, extract_to):
     """
@@ -75,3 +101,97 @@ def extract_zip(zip_path, extract_to):
     else:
         with zipfile.ZipFile(zip_path, "r") as zip_ref:
             zip_ref.extractall(extract_to)
+
+
+# Function to serialize work across processes
+@contextmanager
+def file_lock(path, blocking=True):
+    """
+    Holds an exclusive lock on a file for the duration of a `with` block.
+
+    The lock is held by the process, so the workers of a server that start at the same time can
+    use it to let only one of them do some work, like building the document index. The lock is
+    released when the block exits or the process dies. A holder may remove the lock file while
+    it holds the lock: a process that was waiting on the removed file then locks the file found
+    at the path again, so two processes never hold the lock of the same path. Where `fcntl` is
+    not available, the block runs without locking.
+
+    Args:
+        path (str): Path of the lock file, created if it does not exist.
+        blocking (bool): Whether to wait for the lock. If False and another holder has it, the
+                         block runs without it.
+
+    Yields:
+        bool: Whether the lock is held.
+    """
+    while True:
+        with open(path, "a") as fh:
+            if fcntl is None:
+                yield True
+                return
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                if _is_same_file(fh, path):
+                    yield True
+                    return
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _is_same_file(fh, path):
+    """
+    Checks whether an open file is still the file found at its path.
+
+    Args:
+        fh (file): Open file.
+        path (str): Path the file was opened from.
+
+    Returns:
+        bool: False if the file was removed or replaced since it was opened.
+    """
+    try:
+        current = os.stat(path)
+    except FileNotFoundError:
+        return False
+    opened = os.fstat(fh.fileno())
+    return (current.st_dev, current.st_ino) == (opened.st_dev, opened.st_ino)
+
+
+# Function to measure the memory of the current process
+def process_memory():
+    """
+    Measures the resident memory of the current process, split into shared and private pages.
+
+    Memory mapped files, like the document index and the converted word vectors, are shared with
+    every process that maps them, so the proportional set size (PSS), which splits shared pages
+    among the processes that use them, is the real cost of a process.
+
+    Returns:
+        Optional[dict]: Process ID and resident (RSS), proportional (PSS), shared and private
+        memory in MB, or None if `/proc/self/smaps_rollup` is not available.
+    """
+    try:
+        with open("/proc/self/smaps_rollup") as fh:
+            lines = fh.readlines()
+    except OSError:
+        return None
+    fields = {}
+    for line in lines:
+        name, _, value = line.partition(":")
+        if value.strip().endswith("kB"):
+            fields[name] = int(value.split()[0]) / 1024
+    return {
+        "pid": os.getpid(),
+        "rss_mb": round(fields.get("Rss", 0.0), 1),
+        "pss_mb": round(fields.get("Pss", 0.0), 1),
+        "shared_mb": round(
+            fields.get("Shared_Clean", 0.0) + fields.get("Shared_Dirty", 0.0), 1
+        ),
+        "private_mb": round(
+            fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0), 1
+        ),
+    }